@@ -0,0 +1,158 @@
+"""Baked animation key reduction: the FBX exporter's simplification against anim_bake's.
+
+Usage: python bench_anim.py [--bones N] [--actions N] [--frames N ...]
+
+Every bone gets smooth synthetic location, rotation (degrees) and scale
+curves, wrapped in stand-ins for the FBX exporter's AnimationCurveNodeWrapper
+exactly as it fills them while baking. Both reductions run on the same
+samples; the time, the keys kept and the largest error of linear
+interpolation between kept keys are printed for each.
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+from synthetic import import_addon_module
+
+anim_bake = import_addon_module("anim_bake")
+
+GROUPS = ("Lcl Translation", "Lcl Rotation", "Lcl Scaling")
+TOLERANCES = {"Lcl Translation": 1e-3, "Lcl Rotation": 0.05, "Lcl Scaling": 1e-3}
+
+
+class CurveNode:
+    """The parts of io_scene_fbx's AnimationCurveNodeWrapper (Blender 2.8x) the reductions use."""
+
+    def __init__(self, elem_key, group, frames, values):
+        self.elem_keys = [elem_key]
+        self.fbx_group = [group]
+        self.fbx_props = [("X", "Y", "Z")]
+        self.force_keying = False
+        self.force_startend_keying = True
+        self._keys = [(frame, value, [True] * 3) for frame, value in zip(frames, values.tolist())]
+
+    def reference_simplify(self, fac, step, force_keep=False):
+        """AnimationCurveNodeWrapper.simplify() of Blender 2.81."""
+        if not self._keys:
+            return
+        if fac == 0.0:
+            return
+        min_reldiff_fac = fac * 1.0e-3
+        min_absdiff_fac = 0.1
+        keys = self._keys
+        p_currframe, p_key, p_key_write = keys[0]
+        p_keyed = list(p_key)
+        are_keyed = [False] * len(p_key)
+        for currframe, key, key_write in keys:
+            for idx, (val, p_val) in enumerate(zip(key, p_key)):
+                key_write[idx] = False
+                p_keyedval = p_keyed[idx]
+                if val == p_val:
+                    continue
+                if abs(val - p_val) > (min_reldiff_fac * max(abs(val) + abs(p_val), min_absdiff_fac)):
+                    key_write[idx] = True
+                    p_key_write[idx] = True
+                    p_keyed[idx] = val
+                    are_keyed[idx] = True
+                elif abs(val - p_keyedval) > (min_reldiff_fac * max((abs(val) + abs(p_keyedval)), min_absdiff_fac)):
+                    key_write[idx] = True
+                    p_keyed[idx] = val
+                    are_keyed[idx] = True
+            p_currframe, p_key, p_key_write = currframe, key, key_write
+        if self.force_keying or (force_keep and not any(are_keyed)):
+            are_keyed[:] = [True] * len(are_keyed)
+        if self.force_startend_keying:
+            for idx, is_keyed in enumerate(are_keyed):
+                if is_keyed:
+                    keys[0][2][idx] = keys[-1][2][idx] = True
+
+    def kept_and_error(self):
+        frames = np.array([frame for frame, _key, _write in self._keys], np.float64)
+        values = np.array([key for _frame, key, _write in self._keys], np.float64)
+        writes = np.array([write for _frame, _key, write in self._keys], bool)
+        kept = 0
+        error = 0.0
+        for channel in range(values.shape[1]):
+            mask = writes[:, channel]
+            kept += int(mask.sum())
+            if mask.any():
+                interpolated = np.interp(frames, frames[mask], values[mask, channel])
+            else:
+                interpolated = np.full(len(frames), values[0, channel])
+            error = max(error, float(np.abs(interpolated - values[:, channel]).max()))
+        return kept, error
+
+
+def curves(bones, frames, seed):
+    """Location, rotation and scale samples of every bone of one action."""
+    rng = np.random.default_rng(seed)
+    time_axis = np.arange(frames, dtype=np.float64).reshape(1, -1, 1)
+
+    def smooth(amplitude, count):
+        frequency = rng.uniform(0.005, 0.05, (count, 1, 3)) * 2.0 * math.pi
+        phase = rng.uniform(0.0, 2.0 * math.pi, (count, 1, 3))
+        return amplitude * np.sin(time_axis * frequency + phase)
+
+    location = smooth(0.05, bones)
+    location[bones // 2:] = 0.0  # Most bones only rotate.
+    rotation = smooth(30.0, bones)
+    scale = np.ones((bones, frames, 3))
+    return {"Lcl Translation": location, "Lcl Rotation": rotation, "Lcl Scaling": scale}
+
+
+def nodes(bones, frames, seed):
+    samples = curves(bones, frames, seed)
+    frame_numbers = list(range(frames))
+    return [CurveNode("bone_%03d" % bone, group, frame_numbers, samples[group][bone])
+            for bone in range(bones) for group in GROUPS]
+
+
+def run(bones, actions, frames):
+    rows = []
+    for name in ("reference", "bounded"):
+        stats = anim_bake.KeyStats()
+        reducer = anim_bake.Reducer(TOLERANCES, stats)
+        seconds = 0.0
+        kept = 0
+        error = {group: 0.0 for group in GROUPS}
+        for action in range(actions):
+            action_nodes = nodes(bones, frames, action)
+            start = time.perf_counter()
+            for node in action_nodes:
+                if name == "reference":
+                    node.reference_simplify(1.0, 1.0)
+                else:
+                    if node is action_nodes[0]:
+                        for other in action_nodes:
+                            reducer.add(other)
+                    reducer.simplify(node)
+            seconds += time.perf_counter() - start
+            for node in action_nodes:
+                node_kept, node_error = node.kept_and_error()
+                kept += node_kept
+                error[node.fbx_group[0]] = max(error[node.fbx_group[0]], node_error)
+        sampled = bones * actions * frames * 9
+        rows.append((name, frames, seconds, kept, 100.0 * kept / sampled,
+                     error["Lcl Translation"], error["Lcl Rotation"], error["Lcl Scaling"]))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bones", type=int, default=120)
+    parser.add_argument("--actions", type=int, default=6)
+    parser.add_argument("--frames", type=int, nargs="+", default=[30, 250, 1000])
+    args = parser.parse_args()
+
+    print("%-10s %7s %9s %10s %7s %10s %10s %10s" % ("method", "frames", "time", "keys", "kept",
+                                                     "loc err", "rot err", "scale err"))
+    for frames in args.frames:
+        for row in run(args.bones, args.actions, frames):
+            print("%-10s %7d %8.3fs %10d %6.1f%% %10.4g %10.4g %10.4g" % row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Conversion throughput with one process per file against persistent services.
+
+Usage: python bench_convert.py [--files N] [--startup SECONDS] [--workers N] [--crash-after N]
+
+Converts N small intermediate files with fake_fbx_tool.py, once with a fresh
+process per file and once through converter services kept alive across the
+whole run, and prints both timings. --crash-after makes the services die
+periodically, to check that they are restarted and no file is lost.
+"""
+
+import argparse
+import os
+import shlex
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from synthetic import import_addon_module
+
+converter = import_addon_module("converter")
+
+FAKE_TOOL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_fbx_tool.py")
+
+
+def make_files(directory, count):
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, "prop_%04d.fbx" % index)
+        with open(path, "wb") as f:
+            f.write(os.urandom(4096))
+        paths.append(path)
+    return paths
+
+
+def convert_files(fbx_paths, max_workers=0):
+    """Convert every file with at most max_workers concurrent conversions, like the exporter's pool."""
+    with ThreadPoolExecutor(max_workers=max_workers or converter.default_max_workers()) as pool:
+        return list(pool.map(converter.convert_fbx, fbx_paths))
+
+
+def run(directory, count, workers):
+    paths = make_files(directory, count)
+    start = time.perf_counter()
+    results = convert_files(paths, workers)
+    elapsed = time.perf_counter() - start
+    failed = sum(not result.ok for result in results)
+    missing = sum(not os.path.isfile(os.path.splitext(path)[0] + ".mesh") for path in paths)
+    leftover = sum(os.path.isfile(path) for path in paths)
+    return elapsed, failed, missing, leftover
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--startup", type=float, default=0.1, help="simulated tool startup in seconds")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--crash-after", type=int)
+    args = parser.parse_args()
+
+    tool = "%s %s --startup %s" % (shlex.quote(sys.executable), shlex.quote(FAKE_TOOL), args.startup)
+    server = tool + " --serve"
+    if args.crash_after is not None:
+        server += " --crash-after %d" % args.crash_after
+
+    print("%-12s %10s %8s %8s %9s" % ("mode", "seconds", "failed", "missing", "leftover"))
+    os.environ[converter.TOOL_ENV] = tool
+    for mode, server_command in (("per-process", None), ("service", server)):
+        if server_command:
+            os.environ[converter.SERVER_ENV] = server_command
+        else:
+            os.environ.pop(converter.SERVER_ENV, None)
+        with tempfile.TemporaryDirectory() as directory:
+            print("%-12s %10.3f %8d %8d %9d" % ((mode,) + run(directory, args.files, args.workers)))
+    converter.shutdown_services()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Microbenchmark of mesh_arrays extraction on synthetic grids.
+
+Usage: python bench_extract.py [--weights N] [--repeat N]
+
+Prints extraction time per size and the time per vertex, which should stay
+roughly constant (linear scaling) as the vertex count grows.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from synthetic import grid_mesh, import_addon_module
+
+mesh_arrays = import_addon_module("mesh_arrays")
+
+SIDES = (32, 64, 128, 256, 512)
+
+
+def time_extract(mesh, repeat, use_weights):
+    matrix = mesh_arrays.export_matrix(global_scale=0.01)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        arrays = mesh_arrays.extract(mesh, use_tspace=True, use_weights=use_weights)
+        mesh_arrays.transform(arrays, matrix)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weights", type=int, default=0, help="vertex group influences per vertex")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    counts = []
+    times = []
+    print("%10s %10s %12s %14s" % ("vertices", "triangles", "time (ms)", "ns / vertex"))
+    for side in SIDES:
+        mesh = grid_mesh(side, influences=args.weights)
+        vertex_count = len(mesh.vertices)
+        elapsed = time_extract(mesh, args.repeat, args.weights > 0)
+        counts.append(vertex_count)
+        times.append(elapsed)
+        print("%10d %10d %12.3f %14.1f" % (vertex_count, len(mesh.loop_triangles),
+                                           elapsed * 1e3, elapsed * 1e9 / vertex_count))
+
+    # Log-log slope of time against vertex count: 1.0 means linear scaling.
+    slope = np.polyfit(np.log(counts[1:]), np.log(times[1:]), 1)[0]
+    print("scaling exponent: %.2f" % slope)
+
+
+if __name__ == "__main__":
+    main()
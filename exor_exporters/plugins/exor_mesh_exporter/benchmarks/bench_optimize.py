@@ -0,0 +1,63 @@
+"""Vertex cache optimization speed and ACMR on synthetic grids.
+
+Usage: python bench_optimize.py [--triangles N ...] [--cache-size N] [--tipsify]
+
+Grids get their polygons shuffled first, since real meshes rarely come out of
+modelling in a cache-friendly order. For each size the welding, the triangle
+reordering and the vertex fetch reordering are timed, and the ACMR of the
+shuffled and optimized index buffers is printed.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from synthetic import grid_mesh, import_addon_module, quads_per_side_for
+
+mesh_arrays = import_addon_module("mesh_arrays")
+optimize = import_addon_module("optimize")
+
+
+def shuffled_arrays(triangles, seed=0):
+    arrays = mesh_arrays.extract(grid_mesh(quads_per_side_for(triangles)), use_tspace=True)
+    order = np.random.default_rng(seed).permutation(arrays.triangle_count)
+    arrays.triangles = arrays.triangles[order]
+    arrays.triangle_polygons = arrays.triangle_polygons[order]
+    return arrays
+
+
+def run(triangles, method, cache_size):
+    arrays = shuffled_arrays(triangles)
+
+    start = time.perf_counter()
+    buffer = optimize.vertex_buffer(arrays)
+    weld_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    optimized = optimize.optimize(buffer, method, cache_size)
+    order_seconds = time.perf_counter() - start
+
+    before = optimize.acmr(buffer.indices, cache_size)
+    after = optimize.acmr(optimized.indices, cache_size)
+    return arrays.triangle_count, arrays.loop_count, buffer.vertex_count, weld_seconds, order_seconds, before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--triangles", type=int, nargs="+", default=[10000, 100000, 500000])
+    parser.add_argument("--cache-size", type=int, default=optimize.DEFAULT_CACHE_SIZE)
+    parser.add_argument("--tipsify", action="store_true", help="also time the TIPSIFY triangle order")
+    args = parser.parse_args()
+
+    methods = optimize.METHODS if args.tipsify else ('SPATIAL',)
+    print("%-8s %10s %10s %10s %9s %9s %8s %8s" % ("method", "triangles", "corners", "vertices",
+                                                   "weld", "reorder", "acmr", "after"))
+    for method in methods:
+        for triangles in args.triangles:
+            print("%-8s %10d %10d %10d %8.3fs %8.3fs %8.3f %8.3f" % ((method,) + run(triangles, method,
+                                                                                       args.cache_size)))
+
+
+if __name__ == "__main__":
+    main()
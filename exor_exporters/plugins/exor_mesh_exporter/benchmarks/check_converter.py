@@ -0,0 +1,114 @@
+"""Checks of the converter service protocol against fake_fbx_tool.py.
+
+Usage: python check_converter.py
+
+Runs io_scene_mesh/converter.py against the stand-in converter: requests
+through a long-lived service, restarts after the service crashes, the timeout
+of a service and of a one-off process that stop answering, and the fallback
+to one-off processes when no service can be started. Prints one line per
+check and exits with status 1 when any of them fails.
+"""
+
+import os
+import shlex
+import sys
+import tempfile
+import time
+
+from synthetic import import_addon_module
+
+converter = import_addon_module("converter")
+
+FAKE_TOOL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_fbx_tool.py")
+TOOL = "%s %s" % (shlex.quote(sys.executable), shlex.quote(FAKE_TOOL))
+
+
+def make_files(directory, count):
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, "prop_%04d.fbx" % index)
+        with open(path, "wb") as f:
+            f.write(os.urandom(256))
+        paths.append(path)
+    return paths
+
+
+def convert(count, tool_options="", server_options=None, timeout=None):
+    """Results and seconds of converting count new files one after the other."""
+    os.environ[converter.TOOL_ENV] = TOOL + tool_options
+    if server_options is None:
+        os.environ.pop(converter.SERVER_ENV, None)
+    else:
+        os.environ[converter.SERVER_ENV] = TOOL + " --serve" + server_options
+    os.environ[converter.TIMEOUT_ENV] = str(timeout or 0)
+    converter.shutdown_services()
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_files(directory, count)
+        start = time.perf_counter()
+        results = [converter.convert_fbx(path) for path in paths]
+        seconds = time.perf_counter() - start
+        written = [os.path.isfile(os.path.splitext(path)[0] + ".mesh") for path in paths]
+        leftover = any(os.path.isfile(path) for path in paths)
+    return results, written, leftover, seconds
+
+
+def check_service():
+    results, written, leftover, _seconds = convert(5, server_options="")
+    pool = converter.service_pool()
+    assert all(result.ok for result in results), [result.message for result in results]
+    assert all(written) and not leftover
+    assert len(pool.idle) == 1 and pool.idle[0].last_id == 5, "one service should have handled every request"
+
+
+def check_restart():
+    results, written, _leftover, _seconds = convert(7, server_options=" --crash-after 2")
+    assert all(result.ok for result in results), [result.message for result in results]
+    assert all(written)
+
+
+def check_service_timeout():
+    results, written, leftover, seconds = convert(3, server_options=" --hang-after 1", timeout=1.0)
+    assert [result.ok for result in results] == [True, False, True], [result.message for result in results]
+    assert results[1].returncode is None and "within" in results[1].message, results[1].message
+    assert written == [True, False, True] and not leftover
+    assert seconds < 10.0, "the hung request took %.1fs" % seconds
+
+
+def check_process_timeout():
+    results, written, _leftover, seconds = convert(1, tool_options=" --hang-after 0", timeout=1.0)
+    assert not results[0].ok and "within" in results[0].message, results[0].message
+    assert not written[0] and seconds < 10.0
+
+
+def check_fallback():
+    os.environ[converter.SERVER_ENV] = os.path.join(tempfile.gettempdir(), "no_such_converter")
+    os.environ[converter.TOOL_ENV] = TOOL
+    os.environ[converter.TIMEOUT_ENV] = "0"
+    converter.shutdown_services()
+    with tempfile.TemporaryDirectory() as directory:
+        path = make_files(directory, 1)[0]
+        result = converter.convert_fbx(path)
+        assert result.ok, result.message
+        assert os.path.isfile(os.path.splitext(path)[0] + ".mesh")
+
+
+CHECKS = (check_service, check_restart, check_service_timeout, check_process_timeout, check_fallback)
+
+
+def main():
+    failed = 0
+    for check in CHECKS:
+        start = time.perf_counter()
+        try:
+            check()
+            status = "ok"
+        except AssertionError as e:
+            status = "FAILED %s" % e
+            failed += 1
+        print("%-24s %6.2fs %s" % (check.__name__, time.perf_counter() - start, status))
+    converter.shutdown_services()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
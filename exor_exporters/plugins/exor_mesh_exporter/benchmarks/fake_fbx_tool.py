@@ -0,0 +1,101 @@
+"""Stand-in for fbx_tool_win_release.exe, for benchmarks and protocol checks.
+
+    fake_fbx_tool.py [--startup S] [--hang-after 0] FILE.fbx A B C D REMOVE_BONES
+    fake_fbx_tool.py [--startup S] [--crash-after N] [--hang-after N] --serve
+
+The first form converts one file like the real tool is invoked. "Converting"
+writes FILE.mesh next to the input, holding a hash of its content, and fails
+with exit code 1 when the input does not exist. --startup sleeps before doing
+anything, to simulate the tool's initialization cost.
+
+--serve answers conversion requests with the length-prefixed JSON protocol of
+io_scene_mesh/converter.py on stdin/stdout until stdin is closed. With
+--crash-after it exits abruptly after N requests, to exercise restarts. With
+--hang-after it stops answering after N requests (a one-off conversion hangs
+with 0), to exercise timeouts.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+
+HEADER = struct.Struct("<I")
+
+
+def convert(args):
+    if len(args) != 6:
+        return 2, "expected 6 arguments, got %d" % len(args)
+    fbx_path = args[0]
+    try:
+        with open(fbx_path, "rb") as f:
+            digest = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+    except OSError as e:
+        return 1, "cannot read %s: %s" % (fbx_path, e)
+
+    with open(os.path.splitext(fbx_path)[0] + ".mesh", "w", encoding="utf-8") as f:
+        f.write("FAKEMESH %s remove_bones=%s\n" % (digest, args[5]))
+    return 0, "converted %s" % os.path.basename(fbx_path)
+
+
+def read_exactly(stream, size):
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def hang():
+    while True:
+        time.sleep(60.0)
+
+
+def serve(crash_after, hang_after):
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    handled = 0
+    while True:
+        header = read_exactly(stdin, HEADER.size)
+        if header is None:
+            return
+        request = json.loads(read_exactly(stdin, HEADER.unpack(header)[0]).decode("utf-8"))
+        if crash_after is not None and handled >= crash_after:
+            os._exit(3)
+        if hang_after is not None and handled >= hang_after:
+            hang()
+        returncode, output = convert(request["args"])
+        data = json.dumps({"id": request["id"], "returncode": returncode, "output": output}).encode("utf-8")
+        stdout.write(HEADER.pack(len(data)) + data)
+        stdout.flush()
+        handled += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="fbx_tool stand-in")
+    parser.add_argument("--startup", type=float, default=0.0, help="simulated startup time in seconds")
+    parser.add_argument("--serve", action="store_true", help="serve requests on stdin/stdout")
+    parser.add_argument("--crash-after", type=int, help="exit abruptly after this many requests")
+    parser.add_argument("--hang-after", type=int, help="stop answering after this many requests")
+    parser.add_argument("args", nargs="*")
+    args = parser.parse_args()
+
+    time.sleep(args.startup)
+    if args.serve:
+        serve(args.crash_after, args.hang_after)
+        return 0
+    if args.hang_after == 0:
+        hang()
+
+    returncode, output = convert(args.args)
+    print(output)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
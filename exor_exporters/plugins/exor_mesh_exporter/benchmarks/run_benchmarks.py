@@ -0,0 +1,327 @@
+"""Export pipeline benchmarks over a sweep of synthetic scenes.
+
+    python run_benchmarks.py [--quick] [--filter TEXT] [--output FILE] [--compare BASELINE]
+    blender --background --python run_benchmarks.py -- [same options]
+
+The sweep covers 1k to 1M triangles, 1 to 500 objects, skinned meshes with 1
+to 8 influences and actions of 10 to 10k frames.
+
+Under plain Python, scenes are built from the stand-ins in synthetic.py and
+the addon's own stages are timed: extraction, and the export cache's object
+and action hashing. Inside Blender the same scenes are built for real. The
+same stages are timed on them, and the scene is also exported with ExportMESH,
+so every stage of its export trace (write_fbx, convert, ...) is recorded too.
+
+--streaming exports with the addon's streaming mode (one FBX file per object
+hierarchy). Every scenario also records the largest RSS its trace saw at the
+start or end of a stage. Unlike the process peak, it does not carry over from
+the scenarios run before it.
+
+Results are written as JSON. --compare prints the per-stage ratio against an
+earlier result file and exits with status 1 when a stage got slower than
+--threshold.
+"""
+
+import argparse
+import ast
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+mesh_arrays = synthetic.import_addon_module("mesh_arrays")
+export_cache = synthetic.import_addon_module("export_cache")
+profiling = synthetic.import_addon_module("profiling")
+
+GLOBAL_SCALE = 0.01
+
+# Stages faster than this are noise, they are never reported as regressions.
+NOISE_SECONDS = 0.005
+
+
+def scenarios(quick=False):
+    triangles = (1000, 10000, 100000) if quick else (1000, 10000, 100000, 1000000)
+    objects = (1, 10, 100) if quick else (1, 10, 100, 500)
+    frames = (10, 100, 1000) if quick else (10, 100, 1000, 10000)
+    skinned_triangles = 10000 if quick else 100000
+
+    sweep = []
+    sweep.extend({"name": "triangles_%d" % count, "triangles": count} for count in triangles)
+    sweep.extend({"name": "objects_%d" % count, "triangles": 1000, "objects": count} for count in objects)
+    sweep.extend({"name": "influences_%d" % count, "triangles": skinned_triangles, "influences": count}
+                 for count in (1, 2, 4, 8))
+    sweep.extend({"name": "frames_%d" % count, "triangles": 1000, "influences": 4, "frames": count}
+                 for count in frames)
+    return sweep
+
+
+def time_addon_stages(trace, scene_objects, actions, depsgraph=None):
+    """Time the addon's own stages on scene objects, fake or real."""
+    meshes = [obj for obj in scene_objects if obj.type == 'MESH']
+    for obj in meshes:
+        with trace.stage("extract", obj.name) as event:
+            arrays = mesh_arrays.extract_object(obj, depsgraph, None, GLOBAL_SCALE, use_tspace=True)
+            event["triangles"] = arrays.triangle_count
+
+    settings = export_cache.settings_digest({"global_scale": GLOBAL_SCALE})
+    with trace.stage("hash_actions"):
+        actions_key = export_cache.actions_digest(actions)
+    for obj in meshes:
+        with trace.stage("hash", obj.name):
+            export_cache.object_key(obj, depsgraph, settings, actions_key, None, GLOBAL_SCALE)
+
+
+# ----------------------------------------------------------------------------
+# Stand-in scenes.
+
+def run_standin(params, workdir, streaming=False):
+    options = {key: value for key, value in params.items() if key != "name"}
+    scene = synthetic.make_scene(**options)
+    trace = profiling.Trace()
+    time_addon_stages(trace, scene.objects, scene.actions)
+    return trace, None
+
+
+# ----------------------------------------------------------------------------
+# Real Blender scenes.
+
+def clear_blend_data(bpy):
+    for collection in (bpy.data.objects, bpy.data.meshes, bpy.data.armatures, bpy.data.actions):
+        for datablock in list(collection):
+            collection.remove(datablock)
+
+
+def build_mesh(bpy, name, co, quads):
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(co))
+    mesh.vertices.foreach_set("co", co.ravel())
+    mesh.loops.add(quads.size)
+    mesh.loops.foreach_set("vertex_index", quads.ravel())
+    mesh.polygons.add(len(quads))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, quads.size, 4, dtype=np.int32))
+    try:
+        mesh.polygons.foreach_set("loop_total", np.full(len(quads), 4, np.int32))
+    except (AttributeError, TypeError, RuntimeError):
+        pass  # Read-only and derived from loop_start in newer Blender versions.
+    mesh.update()
+    mesh.uv_layers.new(name="UVMap")
+    return mesh
+
+
+def build_armature(bpy, scene, bone_count):
+    armature = bpy.data.objects.new("Armature", bpy.data.armatures.new("Armature"))
+    scene.collection.objects.link(armature)
+    bpy.context.view_layer.objects.active = armature
+    bpy.ops.object.mode_set(mode='EDIT')
+    for index in range(bone_count):
+        bone = armature.data.edit_bones.new("bone_%03d" % index)
+        bone.head = (index, 0.0, 0.0)
+        bone.tail = (index, 0.0, 1.0)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    return armature
+
+
+def build_action(bpy, armature, frames):
+    action = bpy.data.actions.new("Action")
+    times = np.arange(frames, dtype=np.float32)
+    coords = np.stack((times, np.sin(times * 0.1)), axis=1).ravel()
+    for bone in armature.data.bones:
+        for prop, size in (("location", 3), ("rotation_quaternion", 4), ("scale", 3)):
+            for index in range(size):
+                fcurve = action.fcurves.new('pose.bones["%s"].%s' % (bone.name, prop), index=index,
+                                            action_group=bone.name)
+                fcurve.keyframe_points.add(frames)
+                fcurve.keyframe_points.foreach_set("co", coords)
+    armature.animation_data_create().action = action
+    return action
+
+
+def add_weights(obj, influences, bone_count, seed):
+    groups, weights = synthetic.random_weights(len(obj.data.vertices), influences, bone_count, seed)
+    # Quantized weights keep the number of VertexGroup.add() calls small.
+    weights = np.round(weights * 16.0) / 16.0
+    for bone in range(bone_count):
+        group = obj.vertex_groups.new(name="bone_%03d" % bone)
+        rows, cols = np.nonzero(groups == bone)
+        bone_weights = weights[rows, cols]
+        for weight in np.unique(bone_weights):
+            if weight > 0.0:
+                group.add(rows[bone_weights == weight].tolist(), float(weight), 'REPLACE')
+
+
+def build_blender_scene(bpy, triangles=1000, objects=1, influences=0, frames=0, bones=64):
+    clear_blend_data(bpy)
+    scene = bpy.context.scene
+    co, quads = synthetic.grid_arrays(synthetic.quads_per_side_for(triangles))
+
+    armature = build_armature(bpy, scene, bones) if influences or frames else None
+    for index in range(objects):
+        obj = bpy.data.objects.new("grid_%03d" % index, build_mesh(bpy, "grid_%03d" % index, co, quads))
+        scene.collection.objects.link(obj)
+        if armature is not None:
+            obj.parent = armature
+            obj.modifiers.new("Armature", 'ARMATURE').object = armature
+        if influences:
+            add_weights(obj, influences, bones, index)
+
+    if frames:
+        build_action(bpy, armature, frames)
+        scene.frame_start = 0
+        scene.frame_end = frames - 1
+
+
+def run_blender(params, workdir, streaming=False):
+    import bpy
+
+    options = {key: value for key, value in params.items() if key != "name"}
+    build_blender_scene(bpy, **options)
+
+    trace = profiling.Trace()
+    time_addon_stages(trace, bpy.context.scene.objects, bpy.data.actions, bpy.context.evaluated_depsgraph_get())
+
+    error = None
+    trace_path = os.path.join(workdir, params["name"] + ".trace.json")
+    try:
+        bpy.ops.export_scene.mesh(filepath=os.path.join(workdir, params["name"] + ".mesh"),
+                                  use_selection=False, use_streaming=streaming, trace_path=trace_path)
+    except RuntimeError as e:
+        # Typically the converter missing on this platform, the other stages still count.
+        error = str(e)
+
+    if os.path.isfile(trace_path):
+        with open(trace_path, "r", encoding="utf-8") as f:
+            trace.events.extend(json.load(f)["events"])
+    return trace, error
+
+
+def register_addon():
+    import bpy
+
+    if not hasattr(bpy.types, "EXPORT_SCENE_OT_mesh"):
+        import io_scene_mesh
+        io_scene_mesh.register()
+
+
+# ----------------------------------------------------------------------------
+# Results.
+
+def stage_seconds(trace):
+    return {stage: total["seconds"] for stage, total in trace.summary().items()}
+
+
+def largest_rss(trace):
+    return max((max(event.get("rss_before", 0), event.get("rss_after", 0)) for event in trace.events), default=0)
+
+
+def addon_version():
+    with open(os.path.join(synthetic.ADDON_DIR, "__init__.py"), "r", encoding="utf-8") as f:
+        for node in ast.parse(f.read()).body:
+            if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == "bl_info":
+                return ".".join(str(part) for part in ast.literal_eval(node.value)["version"])
+    return "unknown"
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=synthetic.ADDON_DIR,
+                                       stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print per-stage ratios against baseline, returning the number of regressions."""
+    previous = {scenario["name"]: scenario["stages"] for scenario in baseline["scenarios"]}
+    regressions = 0
+    print("%-18s %-14s %10s %10s %8s" % ("scenario", "stage", "before", "after", "ratio"))
+    for scenario in results["scenarios"]:
+        before = previous.get(scenario["name"], {})
+        for stage, seconds in sorted(scenario["stages"].items()):
+            if stage not in before:
+                continue
+            ratio = seconds / before[stage] if before[stage] else float("inf")
+            slower = ratio > 1.0 + threshold and seconds > NOISE_SECONDS
+            regressions += slower
+            print("%-18s %-14s %9.4fs %9.4fs %7.2fx%s" % (scenario["name"], stage, before[stage], seconds,
+                                                          ratio, "  REGRESSION" if slower else ""))
+    return regressions
+
+
+def parse_args():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser(prog="run_benchmarks.py", description="Export pipeline benchmarks")
+    parser.add_argument("--quick", action="store_true", help="smaller sweep for quick checks")
+    parser.add_argument("--filter", default="", help="only run scenarios whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scenario, the fastest one is kept")
+    parser.add_argument("--output", default="bench_results.json", help="JSON results file")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed slowdown before a regression")
+    parser.add_argument("--streaming", action="store_true", help="export in streaming mode (Blender only)")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    try:
+        import bpy
+    except ImportError:
+        bpy = None
+
+    if bpy is not None:
+        register_addon()
+    run = run_blender if bpy is not None else run_standin
+
+    results = {
+        "mode": "blender" if bpy is not None else "standin",
+        "blender": bpy.app.version_string if bpy is not None else None,
+        "addon_version": addon_version(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "streaming": args.streaming,
+        "scenarios": [],
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for params in scenarios(args.quick):
+            if args.filter not in params["name"]:
+                continue
+            best = None
+            error = None
+            for _ in range(args.repeat):
+                trace, error = run(params, workdir, args.streaming)
+                seconds = stage_seconds(trace)
+                best = seconds if best is None else {stage: min(value, best.get(stage, value))
+                                                     for stage, value in seconds.items()}
+            scenario = {"name": params["name"], "params": params, "stages": best,
+                        "rss": largest_rss(trace)}
+            if error:
+                scenario["error"] = error
+            results["scenarios"].append(scenario)
+            print("%-18s %s" % (params["name"], "  ".join("%s %.4fs" % item for item in sorted(best.items()))))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+    print("Results written to %s" % args.output)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("%d stage(s) regressed by more than %d%%" % (regressions, args.threshold * 100))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# Synthetic stand-ins for Blender data, used by the benchmarks.
+#
+# The classes only implement what the addon reads (foreach_get, len, iteration
+# over vertex groups and bones, evaluated_get/to_mesh), backed by NumPy arrays,
+# so the addon's own stages can be timed without a Blender build.
+
+import importlib
+import os
+import sys
+import types
+from collections import namedtuple
+
+import numpy as np
+
+ADDON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "io_scene_mesh")
+
+
+def import_addon_module(name):
+    """Import io_scene_mesh.<name> from this tree.
+
+    Inside Blender the real addon package is imported. Elsewhere an empty
+    package stands in for it, so its bpy-dependent __init__ never runs.
+    """
+    if "io_scene_mesh" not in sys.modules:
+        try:
+            import bpy  # noqa: F401
+        except ImportError:
+            package = types.ModuleType("io_scene_mesh")
+            package.__path__ = [ADDON_DIR]
+            sys.modules["io_scene_mesh"] = package
+        else:
+            sys.path.insert(0, os.path.dirname(ADDON_DIR))
+    return importlib.import_module("io_scene_mesh." + name)
+
+
+class FakeCollection:
+    def __init__(self, **attrs):
+        self._attrs = attrs
+        self._len = len(next(iter(attrs.values()))) if attrs else 0
+
+    def __len__(self):
+        return self._len
+
+    def foreach_get(self, attr, buf):
+        buf[:] = self._attrs[attr].ravel()
+
+
+VertexGroupElement = namedtuple("VertexGroupElement", ("group", "weight"))
+Vertex = namedtuple("Vertex", ("groups",))
+
+
+class FakeVertices(FakeCollection):
+    def __init__(self, co, groups=None, weights=None):
+        super().__init__(co=co)
+        self._groups = groups
+        self._weights = weights
+
+    def __iter__(self):
+        if self._groups is None:
+            for _ in range(self._len):
+                yield Vertex(())
+            return
+        for groups, weights in zip(self._groups.tolist(), self._weights.tolist()):
+            yield Vertex(tuple(VertexGroupElement(g, w) for g, w in zip(groups, weights) if w > 0.0))
+
+
+class FakeLayer:
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.data = FakeCollection(**attrs)
+
+
+class FakeLayers(list):
+    @property
+    def active(self):
+        return self[0] if self else None
+
+
+class FakeMesh:
+    def __init__(self, vertices, loops, polygons, loop_triangles, uv_layers=(), vertex_colors=()):
+        self.vertices = vertices
+        self.loops = loops
+        self.polygons = polygons
+        self.loop_triangles = loop_triangles
+        self.uv_layers = FakeLayers(uv_layers)
+        self.vertex_colors = FakeLayers(vertex_colors)
+
+    def calc_loop_triangles(self):
+        pass
+
+    def calc_normals_split(self):
+        pass
+
+    def calc_tangents(self, uvmap=""):
+        pass
+
+
+def grid_arrays(quads_per_side):
+    """Vertex positions and quad vertex indices of a flat quads_per_side**2 grid."""
+    side = quads_per_side + 1
+    xs, ys = np.meshgrid(np.arange(side, dtype=np.float32), np.arange(side, dtype=np.float32))
+    co = np.stack((xs.ravel(), ys.ravel(), np.zeros(side * side, np.float32)), axis=1)
+
+    cell = np.arange(quads_per_side * quads_per_side)
+    row, col = np.divmod(cell, quads_per_side)
+    first = row * side + col
+    quads = np.stack((first, first + 1, first + side + 1, first + side), axis=1).astype(np.int32)
+    return co, quads
+
+
+def random_weights(vertex_count, influences, bone_count, seed=0):
+    """(V, influences) distinct group indices and weights summing to one per vertex."""
+    rng = np.random.default_rng(seed)
+    groups = np.argsort(rng.random((vertex_count, bone_count)), axis=1)[:, :influences]
+    weights = rng.random((vertex_count, influences)).astype(np.float32)
+    weights /= weights.sum(axis=1, keepdims=True)
+    return groups, weights
+
+
+def quads_per_side_for(triangles):
+    return max(1, int(round((triangles / 2.0) ** 0.5)))
+
+
+def grid_mesh(quads_per_side, influences=0, bone_count=64, seed=0):
+    """A flat grid of quads_per_side**2 quads (twice as many triangles).
+
+    With influences > 0 every vertex gets that many random vertex group weights.
+    """
+    co, quads = grid_arrays(quads_per_side)
+    quad_count = len(quads)
+    loop_vertices = quads.ravel()
+    loop_count = len(loop_vertices)
+    normals = np.tile(np.array((0.0, 0.0, 1.0), np.float32), (loop_count, 1))
+    tangents = np.tile(np.array((1.0, 0.0, 0.0), np.float32), (loop_count, 1))
+    loops = FakeCollection(vertex_index=loop_vertices, normal=normals, tangent=tangents,
+                           bitangent_sign=np.ones(loop_count, np.float32))
+
+    loop_starts = np.arange(0, loop_count, 4, dtype=np.int32)
+    polygons = FakeCollection(loop_start=loop_starts,
+                              loop_total=np.full(quad_count, 4, np.int32),
+                              material_index=np.zeros(quad_count, np.int32))
+
+    tri_loops = np.concatenate((loop_starts[:, None] + (0, 1, 2), loop_starts[:, None] + (0, 2, 3)), axis=1)
+    loop_triangles = FakeCollection(loops=tri_loops.reshape(-1, 3).astype(np.int32),
+                                    polygon_index=np.repeat(np.arange(quad_count, dtype=np.int32), 2))
+
+    uv = co[loop_vertices, :2] / quads_per_side
+    uv_layers = [FakeLayer("UVMap", uv=uv.astype(np.float32))]
+
+    groups = weights = None
+    if influences:
+        groups, weights = random_weights(len(co), influences, bone_count, seed)
+
+    return FakeMesh(FakeVertices(co, groups, weights), loops, polygons, loop_triangles, uv_layers)
+
+
+class FakeNamed:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeBones(FakeCollection):
+    def __init__(self, names, **attrs):
+        super().__init__(**attrs)
+        self._names = names
+
+    def __iter__(self):
+        return (FakeNamed(name) for name in self._names)
+
+
+class FakeModifier:
+    def __init__(self, name, type, object=None):
+        self.name = name
+        self.type = type
+        self.object = object
+        self.show_viewport = True
+        self.show_render = True
+
+
+class FakeArmatureObject:
+    type = 'ARMATURE'
+
+    def __init__(self, name, bone_count):
+        names = ["bone_%03d" % index for index in range(bone_count)]
+        matrices = np.tile(np.identity(4, np.float32).ravel(), (bone_count, 1))
+        self.name = name
+        self.parent = None
+        self.data = FakeNamed(name)
+        self.data.bones = FakeBones(names, matrix_local=matrices)
+        self.pose = FakeNamed(name)
+        self.pose.bones = FakeBones(names, matrix=matrices.copy())
+        self.matrix_world = np.identity(4)
+
+
+class FakeMeshObject:
+    type = 'MESH'
+
+    def __init__(self, name, mesh, armature=None, group_count=0):
+        self.name = name
+        self.data = mesh
+        self.parent = armature
+        self.modifiers = [FakeModifier("Armature", 'ARMATURE', armature)] if armature else []
+        self.vertex_groups = [FakeNamed("bone_%03d" % index) for index in range(group_count)]
+        self.material_slots = []
+        self.matrix_world = np.identity(4)
+
+    def evaluated_get(self, depsgraph):
+        return self
+
+    def to_mesh(self):
+        return self.data
+
+    def to_mesh_clear(self):
+        pass
+
+
+class FakeFCurve:
+    def __init__(self, data_path, array_index, frames):
+        self.data_path = data_path
+        self.array_index = array_index
+        times = np.arange(frames, dtype=np.float32)
+        self.keyframe_points = FakeCollection(co=np.stack((times, np.sin(times * 0.1)), axis=1))
+
+
+class FakeAction:
+    def __init__(self, name, bone_names, frames):
+        self.name = name
+        self.fcurves = [FakeFCurve('pose.bones["%s"].%s' % (bone, prop), index, frames)
+                        for bone in bone_names
+                        for prop, size in (("location", 3), ("rotation_quaternion", 4), ("scale", 3))
+                        for index in range(size)]
+
+
+class FakeScene:
+    """Objects and actions of one synthetic benchmark scene."""
+
+    def __init__(self, objects, actions):
+        self.objects = objects
+        self.actions = actions
+
+
+def make_scene(triangles=1000, objects=1, influences=0, frames=0, bones=64):
+    """Scene of `objects` grids of about `triangles` triangles each.
+
+    Skinned scenes (influences > 0) get one armature with `bones` bones driving
+    every grid; frames > 0 adds one action keying all of its bones.
+    """
+    side = quads_per_side_for(triangles)
+    armature = FakeArmatureObject("Armature", bones) if influences or frames else None
+    scene_objects = [armature] if armature else []
+    for index in range(objects):
+        mesh = grid_mesh(side, influences=influences, bone_count=bones, seed=index)
+        scene_objects.append(FakeMeshObject("grid_%03d" % index, mesh, armature, bones if influences else 0))
+
+    actions = []
+    if frames:
+        actions.append(FakeAction("Action", ["bone_%03d" % index for index in range(bones)], frames))
+    return FakeScene(scene_objects, actions)
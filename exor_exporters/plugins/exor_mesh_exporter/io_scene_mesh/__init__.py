@@ -18,6 +18,7 @@
 
 # <pep8-80 compliant>
 
+import math
 import os
 script_file = os.path.realpath(__file__)
 directory = os.path.dirname(script_file)
@@ -36,6 +37,34 @@ bl_info = {
 
 if "bpy" in locals():
     import importlib
+    if "mesh_arrays" in locals():
+        importlib.reload(mesh_arrays)
+    if "profiling" in locals():
+        importlib.reload(profiling)
+    if "optimize" in locals():
+        importlib.reload(optimize)
+    if "preflight" in locals():
+        importlib.reload(preflight)
+    if "quantize" in locals():
+        importlib.reload(quantize)
+    if "decimate" in locals():
+        importlib.reload(decimate)
+    if "skinning" in locals():
+        importlib.reload(skinning)
+    if "anim_bake" in locals():
+        importlib.reload(anim_bake)
+    if "lod" in locals():
+        importlib.reload(lod)
+    if "manifest" in locals():
+        importlib.reload(manifest)
+    if "services" in locals():
+        importlib.reload(services)
+    if "collision" in locals():
+        importlib.reload(collision)
+    if "export_cache" in locals():
+        importlib.reload(export_cache)
+    if "converter" in locals():
+        importlib.reload(converter)
     if "export_mesh" in locals():
         importlib.reload(export_mesh)
 
@@ -46,6 +75,7 @@ import bpy
 from bpy.props import (
         BoolProperty,
         FloatProperty,
+        IntProperty,
         StringProperty,
         EnumProperty,
         )
@@ -89,6 +119,28 @@ class MESH_PT_export_main(bpy.types.Panel):
         row.prop(operator, "batch_mode")
         sub = row.row(align=True)
         sub.prop(operator, "use_batch_own_dir", text="", icon='NEWFOLDER')
+        sub = layout.row()
+        sub.enabled = (operator.batch_mode != 'OFF' or operator.use_background or operator.use_streaming)
+        sub.prop(operator, "max_workers")
+        row = layout.row(align=True)
+        row.enabled = (operator.batch_mode == 'OFF')
+        row.prop(operator, "use_cache")
+        sub = row.row(align=True)
+        sub.enabled = operator.use_cache
+        sub.prop(operator, "use_cache_force", text="", icon='FILE_REFRESH')
+        row = layout.row(align=True)
+        row.prop(operator, "use_preflight")
+        sub = row.row(align=True)
+        sub.enabled = operator.use_preflight
+        sub.prop(operator, "preflight_strict", text="", icon='ERROR')
+        layout.prop(operator, "use_manifest")
+        layout.prop(operator, "use_background")
+        sub = layout.row()
+        sub.enabled = (operator.batch_mode == 'OFF')
+        sub.prop(operator, "use_streaming")
+        sub = layout.row()
+        sub.enabled = (operator.batch_mode == 'OFF' and (operator.use_streaming or operator.use_background))
+        sub.prop(operator, "memory_limit")
 
 
 class MESH_PT_export_include(bpy.types.Panel):
@@ -184,6 +236,23 @@ class MESH_PT_export_geometry(bpy.types.Panel):
         sub = layout.row()
         #~ sub.enabled = operator.mesh_smooth_type in {'OFF'}
         sub.prop(operator, "use_tspace")
+        sub = layout.row()
+        sub.enabled = (operator.batch_mode == 'OFF')
+        sub.prop(operator, "use_vertex_order")
+        sub = layout.row()
+        sub.enabled = (operator.batch_mode == 'OFF')
+        sub.prop(operator, "report_vertex_cache")
+        sub.prop(operator, "report_compact_format")
+        row = layout.row(align=True)
+        row.enabled = (operator.batch_mode == 'OFF')
+        row.prop(operator, "use_lods")
+        sub = row.row(align=True)
+        sub.enabled = operator.use_lods
+        sub.prop(operator, "lod_ratios", text="")
+        layout.prop(operator, "collision_mode")
+        sub = layout.row()
+        sub.enabled = (operator.collision_mode != 'OFF')
+        sub.prop(operator, "collision_max_vertices")
 
 
 class MESH_PT_export_armature(bpy.types.Panel):
@@ -213,6 +282,11 @@ class MESH_PT_export_armature(bpy.types.Panel):
         layout.prop(operator, "armature_nodetype")
         layout.prop(operator, "use_armature_deform_only")
         layout.prop(operator, "add_leaf_bones")
+        layout.prop(operator, "use_skin_compaction")
+        col = layout.column()
+        col.enabled = operator.use_skin_compaction
+        col.prop(operator, "skin_weight_threshold")
+        col.prop(operator, "skin_max_influences")
 
 
 class MESH_PT_export_bake_animation(bpy.types.Panel):
@@ -249,7 +323,15 @@ class MESH_PT_export_bake_animation(bpy.types.Panel):
         layout.prop(operator, "bake_anim_use_all_actions")
         layout.prop(operator, "bake_anim_force_startend_keying")
         layout.prop(operator, "bake_anim_step")
-        layout.prop(operator, "bake_anim_simplify_factor")
+        sub = layout.row()
+        sub.enabled = not operator.use_anim_key_reduction
+        sub.prop(operator, "bake_anim_simplify_factor")
+        layout.prop(operator, "use_anim_key_reduction")
+        sub = layout.column()
+        sub.enabled = operator.use_anim_key_reduction
+        sub.prop(operator, "anim_max_location_error")
+        sub.prop(operator, "anim_max_rotation_error")
+        sub.prop(operator, "anim_max_scale_error")
 
 
 @orientation_helper(axis_forward='X', axis_up='Y')
@@ -404,6 +486,25 @@ class ExportMESH(bpy.types.Operator, ExportHelper):
             description="Only write deforming bones (and non-deforming ones when they have deforming children)",
             default=False,
             )
+    use_skin_compaction: BoolProperty(
+            name="Compact Skin Weights",
+            description="Drop small bone weights, keep the strongest influences of every vertex and renormalize "
+                        "them, reporting the influence counts of every skinned mesh before and after",
+            default=False,
+            )
+    skin_weight_threshold: FloatProperty(
+            name="Weight Threshold",
+            description="Bone weights below this are dropped (a vertex always keeps its strongest bone)",
+            min=0.0, max=0.5,
+            soft_min=0.0, soft_max=0.1,
+            default=0.01,
+            )
+    skin_max_influences: IntProperty(
+            name="Max Influences",
+            description="Bones per vertex kept",
+            min=1, max=8,
+            default=4,
+            )
     armature_nodetype: EnumProperty(
             name="Armature FBXNode Type",
             items=(('NULL', "Null", "'Null' FBX node, similar to Blender's Empty (default)"),
@@ -458,6 +559,36 @@ class ExportMESH(bpy.types.Operator, ExportHelper):
             soft_min=0.0, soft_max=10.0,
             default=1.0,  # default: min slope: 0.005, max frame step: 10.
             )
+    use_anim_key_reduction: BoolProperty(
+            name="Error-Bounded Key Reduction",
+            description="Reduce baked values to the keys needed to stay within the maximum errors below, "
+                        "instead of using the Simplify factor (only the keys are reduced, bones are sampled as before)",
+            default=False,
+            )
+    anim_max_location_error: FloatProperty(
+            name="Max Location Error",
+            description="Largest location difference to the sampled animation, in exported units",
+            min=0.0, max=1.0,
+            soft_min=0.0, soft_max=0.1,
+            precision=5,
+            default=0.001,
+            )
+    anim_max_rotation_error: FloatProperty(
+            name="Max Rotation Error",
+            description="Largest difference of each rotation angle to the sampled animation",
+            subtype='ANGLE',
+            min=0.0, max=math.radians(10.0),
+            precision=3,
+            default=math.radians(0.05),
+            )
+    anim_max_scale_error: FloatProperty(
+            name="Max Scale Error",
+            description="Largest scale difference to the sampled animation",
+            min=0.0, max=1.0,
+            soft_min=0.0, soft_max=0.1,
+            precision=5,
+            default=0.001,
+            )
     path_mode: path_reference_mode
     embed_textures: BoolProperty(
             name="Embed Textures",
@@ -483,6 +614,125 @@ class ExportMESH(bpy.types.Operator, ExportHelper):
             description="Create a dir for each exported file",
             default=True,
             )
+    max_workers: IntProperty(
+            name="Max Workers",
+            description="How many batch, background or streamed export files to convert at the same time "
+                        "(0 uses one per CPU core)",
+            min=0, max=256,
+            default=0,
+            )
+    use_cache: BoolProperty(
+            name="Skip Unchanged",
+            description="Only export objects whose geometry, armature, actions or export settings changed "
+                        "since the last export to this directory (not available in batch mode)",
+            default=False,
+            )
+    use_cache_force: BoolProperty(
+            name="Force Rebuild",
+            description="Export every object and rebuild the export cache",
+            default=False,
+            )
+    use_preflight: BoolProperty(
+            name="Preflight Checks",
+            description="Check every mesh before anything is written and report all problems found: "
+                        "NaN positions, missing UVs, degenerate triangles, bone weights and vertex counts. "
+                        "Errors abort the export, a missing UV layer is only an error with tangent space",
+            default=True,
+            )
+    preflight_strict: BoolProperty(
+            name="Strict Preflight",
+            description="Abort the export on preflight warnings too",
+            default=False,
+            )
+    use_manifest: BoolProperty(
+            name="Write Manifest",
+            description="Merge an entry for every written .mesh file into exor_mesh_manifest.json in the export "
+                        "directory: content hash, bounds, vertex, triangle and bone counts, materials and settings",
+            default=False,
+            )
+    use_background: BoolProperty(
+            name="Background Export",
+            description="Keep Blender responsive while exporting: objects are written one hierarchy at a time "
+                        "and converted in the background, with progress in the status bar (Esc cancels)",
+            default=False,
+            )
+    use_streaming: BoolProperty(
+            name="Stream Objects",
+            description="Write and convert one object hierarchy at a time, freeing its data before the next one, "
+                        "so memory use follows the largest hierarchy instead of the whole scene "
+                        "(not available in batch mode)",
+            default=False,
+            )
+    memory_limit: IntProperty(
+            name="Memory Ceiling",
+            description="While Blender uses more than this many megabytes, wait for the queued work holding mesh "
+                        "data (reports, manifest, collision hulls, LODs) before writing the next hierarchy of a "
+                        "streamed or background export (0 for no limit)",
+            subtype='UNSIGNED',
+            min=0, max=1024 * 1024,
+            default=0,
+            )
+    use_vertex_order: BoolProperty(
+            name="Vertex Cache Order",
+            description="Write the triangles and vertices of every mesh in vertex cache friendly order, "
+                        "grouped by material (meshes with shape keys or modifiers other than armatures keep "
+                        "Blender's order, not available in batch mode)",
+            default=False,
+            )
+    report_vertex_cache: BoolProperty(
+            name="Vertex Cache Report",
+            description="Report the vertex cache miss ratio (ACMR) of every exported mesh in Blender's triangle order "
+                        "and after cache optimization (not available in batch mode)",
+            default=False,
+            )
+    report_compact_format: BoolProperty(
+            name="Compact Format Report",
+            description="Report the size of every exported mesh with octahedral normals and tangents, 16-bit UVs, "
+                        "8-bit bone weights and 16-bit indices where they fit, and the largest error of each "
+                        "(not available in batch mode)",
+            default=False,
+            )
+    use_lods: BoolProperty(
+            name="Generate LODs",
+            description="Also export decimated levels of every mesh object as <object>_lod1.mesh, "
+                        "<object>_lod2.mesh... (not available in batch mode)",
+            default=False,
+            )
+    lod_ratios: StringProperty(
+            name="LOD Ratios",
+            description="Comma separated triangle count targets of the LOD levels, relative to the full mesh",
+            default="0.5, 0.25, 0.125",
+            )
+    collision_mode: EnumProperty(
+            name="Collision Hulls",
+            items=(('OFF', "Off", "Leave collision to the converter"),
+                   ('HULL', "Convex Hull", "One convex hull per mesh object, or one per UCX_ child of it"),
+                   ('PARTS', "Convex Parts", "One convex hull per loose part of every mesh object, "
+                                             "or one per UCX_ child of it"),
+                   ),
+            description="Cook convex collision hulls of every exported mesh into <object>.hulls next to its .mesh, "
+                        "reusing hulls of unchanged geometry from earlier exports",
+            default='OFF',
+            )
+    collision_max_vertices: IntProperty(
+            name="Max Hull Vertices",
+            description="Vertices per collision hull, hulls with more are simplified",
+            min=4, max=255,
+            default=64,
+            )
+    trace_path: StringProperty(
+            name="Trace File",
+            description="Write per-stage timings, memory and bytes written to this JSON file "
+                        "(also enabled by the EXOR_MESH_TRACE environment variable)",
+            default="",
+            options={'HIDDEN'},
+            )
+    trace_chrome: BoolProperty(
+            name="Chrome Trace",
+            description="Also write the trace in Chrome trace event format, next to the JSON trace",
+            default=False,
+            options={'HIDDEN'},
+            )
     use_metadata: BoolProperty(
             name="Use Metadata",
             default=True,
@@ -497,7 +747,6 @@ class ExportMESH(bpy.types.Operator, ExportHelper):
         return self.batch_mode == 'OFF'
 
     def execute(self, context):
-        from mathutils import Matrix
         if not self.filepath:
             raise Exception("filepath not set")
 
@@ -511,23 +760,50 @@ class ExportMESH(bpy.types.Operator, ExportHelper):
                                             ))
 
         keywords["global_matrix"] = global_matrix
-        keywords["filepath"] = keywords["filepath"].replace(".mesh", ".fbx")
-
-        from io_scene_fbx import export_fbx_bin
-        result = export_fbx_bin.save(self, context, **keywords)
-
-        removeBones = "1"
-        if self.use_armature_deform_only:
-            removeBones = "0"
 
+        from . import export_mesh
         try:
-            import subprocess
-            subprocess.run([directory + "/fbx_tool_win_release.exe", keywords["filepath"], "1", "1", "1", "0", removeBones ], shell=True)
-        finally:
-            import os
-            os.remove(keywords["filepath"]) 
+            job = export_mesh.ExportJob(self, **keywords)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        if not self.use_background or context.window is None:
+            return job.run(context)
 
-        return result
+        try:
+            job.prepare(context)
+        except BaseException:
+            job.cancel()
+            job.finish(context)
+            raise
+        self._job = job
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.05, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        job = self._job
+        if event.type == 'ESC' and event.value == 'PRESS':
+            job.cancel()
+        elif event.type != 'TIMER' or event.timer != self._timer:
+            return {'PASS_THROUGH'}
+
+        if job.writing and job.ready:
+            try:
+                job.write_next(context)
+            except Exception as e:
+                logger.exception("EXOR Mesh export failed")
+                self.report({'ERROR'}, "Export failed: %s" % e)
+                job.cancel()
+
+        if not job.done:
+            context.workspace.status_text_set(job.status_text())
+            return {'RUNNING_MODAL'}
+
+        context.window_manager.event_timer_remove(self._timer)
+        context.workspace.status_text_set(None)
+        return job.finish(context)
 
 def menu_func_export(self, context):
     self.layout.operator(ExportMESH.bl_idname, text="EXOR Mesh (.mesh)")
@@ -551,6 +827,9 @@ def register():
 
 
 def unregister():
+    from . import converter
+    converter.shutdown_services()
+
     bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
 
     for cls in classes:
@@ -0,0 +1,296 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""Headless batch export of a tree of .blend files to .mesh.
+
+    blender --background --python batch_export.py -- SOURCE_DIR OUTPUT_DIR
+            [--jobs N] [--preset PRESET] [--report REPORT.json] [--force] [--trace]
+
+Every .blend file below SOURCE_DIR is exported with ExportMESH into a directory
+of its own below OUTPUT_DIR, at its relative path without the .blend extension
+(SOURCE_DIR/props/crates.blend to OUTPUT_DIR/props/crates/). The .mesh files
+are named after objects and the export cache and manifest describe a whole
+directory, so files sharing one would overwrite and claim each other's output
+when exported in parallel. The files are spread over N background
+Blender worker processes, each of which keeps loading files sent over its stdin
+until the queue is empty, so Blender starts only once per worker. A worker that
+crashes is replaced and only the file it was on is marked as failed.
+
+PRESET is either an ExportMESH operator preset (the .py file Blender writes to
+presets/operator/export_scene.mesh) or a JSON object of operator properties.
+The script also runs under a plain Python interpreter when --blender points to
+the Blender executable.
+"""
+
+import argparse
+import ast
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+RESULT_MARKER = "@@EXOR_MESH_RESULT@@"
+
+# Preset entries that only make sense in the file browser.
+IGNORED_PRESET_KEYS = {"filepath", "check_existing", "filter_glob", "ui_tab"}
+
+
+def load_preset(path):
+    """Operator properties from a Blender operator preset script or a JSON file."""
+    if not path:
+        return {}
+
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+
+    if path.lower().endswith(".json"):
+        settings = json.loads(source)
+    else:
+        settings = {}
+        for node in ast.parse(source, path).body:
+            if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+                continue
+            target = node.targets[0]
+            if (isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and
+                    target.value.id == "op"):
+                settings[target.attr] = ast.literal_eval(node.value)
+
+    settings = {key: value for key, value in settings.items() if key not in IGNORED_PRESET_KEYS}
+    if isinstance(settings.get("object_types"), list):
+        settings["object_types"] = set(settings["object_types"])
+    return settings
+
+
+def find_blend_files(root):
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        found.extend(os.path.join(dirpath, name) for name in sorted(filenames) if name.lower().endswith(".blend"))
+    return found
+
+
+def output_path(source, source_root, output_root):
+    """Export file path of source, in its own directory below output_root."""
+    stem = os.path.splitext(os.path.relpath(source, source_root))[0]
+    return os.path.join(output_root, stem, os.path.basename(stem) + ".mesh")
+
+
+# ----------------------------------------------------------------------------
+# Worker side, runs inside Blender.
+
+def register_addon():
+    import bpy
+
+    if hasattr(bpy.types, "EXPORT_SCENE_OT_mesh"):
+        return
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    import io_scene_mesh
+    io_scene_mesh.register()
+
+
+def export_file(source, output, settings, trace=False):
+    import bpy
+
+    result = {"source": source, "output": output, "status": "failed"}
+    start = time.perf_counter()
+    try:
+        bpy.ops.wm.open_mainfile(filepath=source)
+        result["load_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        if trace:
+            settings = dict(settings, trace_path=os.path.splitext(output)[0] + ".trace.json")
+        ret = bpy.ops.export_scene.mesh(filepath=output, **settings)
+        result["export_seconds"] = time.perf_counter() - start
+        if 'FINISHED' in ret:
+            result["status"] = "ok"
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def run_worker(args):
+    register_addon()
+    settings = load_preset(args.preset)
+    if args.force:
+        settings["use_cache_force"] = True
+
+    for line in sys.stdin:
+        job = json.loads(line)
+        result = export_file(job["source"], job["output"], settings, args.trace)
+        sys.stdout.write(RESULT_MARKER + json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+
+# ----------------------------------------------------------------------------
+# Driver side.
+
+def blender_binary(args):
+    if args.blender:
+        return args.blender
+    try:
+        import bpy
+    except ImportError:
+        raise SystemExit("Not running inside Blender, pass --blender")
+    return bpy.app.binary_path
+
+
+class Worker:
+    """One background Blender process fed with jobs over stdin."""
+
+    def __init__(self, command):
+        self.command = command
+        self.proc = None
+
+    def run(self, job):
+        if self.proc is None or self.proc.poll() is not None:
+            self.proc = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1)
+        log = []
+        try:
+            self.proc.stdin.write(json.dumps(job) + "\n")
+            self.proc.stdin.flush()
+            for line in self.proc.stdout:
+                if line.startswith(RESULT_MARKER):
+                    return json.loads(line[len(RESULT_MARKER):]), log
+                log.append(line.rstrip("\n"))
+        except OSError:
+            pass
+
+        # The worker died on this file, the next job starts a new one.
+        self.proc.kill()
+        self.proc.wait()
+        self.proc = None
+        return dict(job, status="crashed", error="worker exited unexpectedly"), log
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdin.close()
+            self.proc.wait()
+
+
+def run_jobs(jobs, command, worker_count):
+    pending = queue.Queue()
+    for job in jobs:
+        pending.put(job)
+    results = []
+    lock = threading.Lock()
+
+    def slot():
+        worker = Worker(command)
+        try:
+            while True:
+                try:
+                    job = pending.get_nowait()
+                except queue.Empty:
+                    break
+                start = time.perf_counter()
+                result, log = worker.run(job)
+                result["seconds"] = time.perf_counter() - start
+                if result["status"] != "ok":
+                    result["log"] = log[-20:]
+                with lock:
+                    results.append(result)
+                    print("[%d/%d] %s %s (%.2fs)" % (len(results), len(jobs), result["status"],
+                                                     result["source"], result["seconds"]))
+        finally:
+            worker.close()
+
+    threads = [threading.Thread(target=slot) for _ in range(min(worker_count, len(jobs)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    order = {job["source"]: index for index, job in enumerate(jobs)}
+    return sorted(results, key=lambda result: order[result["source"]])
+
+
+def run_driver(args):
+    source_root = os.path.abspath(args.source)
+    output_root = os.path.abspath(args.output)
+    jobs = [{"source": source, "output": output_path(source, source_root, output_root)}
+            for source in find_blend_files(source_root)]
+
+    command = [blender_binary(args), "--background", "--python", os.path.realpath(__file__), "--", "--worker"]
+    if args.preset:
+        load_preset(args.preset)  # Fail early on a broken preset, not once per worker.
+        command += ["--preset", os.path.abspath(args.preset)]
+    if args.force:
+        command.append("--force")
+    if args.trace:
+        command.append("--trace")
+
+    start = time.perf_counter()
+    results = run_jobs(jobs, command, args.jobs)
+    report = {
+        "source": source_root,
+        "output": output_root,
+        "jobs": args.jobs,
+        "seconds": time.perf_counter() - start,
+        "ok": sum(result["status"] == "ok" for result in results),
+        "failed": sum(result["status"] != "ok" for result in results),
+        "files": results,
+    }
+
+    report_path = args.report or os.path.join(output_root, "export_report.json")
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("Exported %d files, %d failed, in %.1fs. Report: %s" % (report["ok"], report["failed"],
+                                                                 report["seconds"], report_path))
+    return 1 if report["failed"] else 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="batch_export.py", description="Export a tree of .blend files to .mesh")
+    parser.add_argument("source", nargs="?", help="directory searched recursively for .blend files")
+    parser.add_argument("output", nargs="?", help="output directory, one directory per .blend file")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="number of Blender workers")
+    parser.add_argument("--preset", help="ExportMESH operator preset (.py) or JSON settings file")
+    parser.add_argument("--report", help="JSON report path (default: OUTPUT/export_report.json)")
+    parser.add_argument("--force", action="store_true", help="ignore the export cache and rebuild everything")
+    parser.add_argument("--trace", action="store_true", help="write a <output>.trace.json stage trace per file")
+    parser.add_argument("--blender", help="Blender executable, when not run from inside Blender")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if not args.worker and (args.source is None or args.output is None):
+        parser.error("source and output directories are required")
+    return args
+
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+    if args.worker:
+        run_worker(args)
+        return 0
+    return run_driver(args)
+
+
+if __name__ == "__main__":
+    status = main()
+    if status:
+        sys.exit(status)
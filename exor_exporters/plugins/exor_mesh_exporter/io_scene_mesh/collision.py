@@ -0,0 +1,400 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Convex collision hulls.
+#
+# cook() turns the pieces of one object into convex hulls: a piece is either a
+# single hull or, split, one hull per loose part of its triangles, a cheap
+# convex decomposition that matches how collision is usually modelled. Hulls
+# are built with an incremental quickhull over NumPy arrays that adds the
+# farthest outside point first, so stopping at max_vertices gives a good
+# simplified hull (slightly inside the exact one) within the vertex limit of
+# PhysX convex meshes.
+#
+# The hulls of an object are written next to its .mesh as <name>.hulls:
+#
+#   b"EXHL", version (uint32), hull count (uint32), then for every hull
+#   vertex count (uint32), triangle count (uint32),
+#   vertices (float32 x, y, z), triangles (uint16 a, b, c, counter-clockwise
+#   seen from outside)
+#
+# all little-endian. Cooked files are also kept in a cache directory in the
+# export root, named after key(), a hash of the pieces' geometry and the
+# cooking settings, so unchanged colliders are not cooked again.
+#
+# Cooking is pure Python and NumPy, so it runs in worker processes rather than
+# threads. Like the converter services (see converter.py), CookPool keeps
+# long-lived workers, this module run as a script with --serve, and feeds them
+# jobs over stdin/stdout with the protocol of services.py. Arrays travel as
+# base64 of their little-endian bytes:
+#
+#   request:  {"id": 1, "pieces": [{"positions": ARRAY, "triangles": ARRAY, "split": false}], "max_vertices": 64}
+#   reply:    {"id": 1, "hulls": "<base64 .hulls content>", "stats": {"hulls": 1, ...}}
+#   ARRAY:    {"dtype": "<f4", "shape": [N, 3], "data": "<base64>"}
+#
+# A job whose worker fails twice is cooked in the calling thread instead.
+#
+# This module does not import bpy, and of the addon only services.py, so the
+# workers only need NumPy.
+
+import base64
+import hashlib
+import os
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from . import services
+except ImportError:  # Run as a worker script, see serve().
+    import services
+
+HULLS_EXTENSION = ".hulls"
+HULLS_MAGIC = b"EXHL"
+HULLS_VERSION = 1
+
+CACHE_DIRNAME = ".exor_hull_cache"
+# The least recently used cache files above this count are deleted.
+MAX_CACHE_FILES = 4096
+
+# Part of every cache key, raise it when cooking changes its output.
+COOK_VERSION = 1
+
+# Vertex limit of a hull. PhysX convex meshes take up to 255.
+DEFAULT_MAX_VERTICES = 64
+MAX_VERTICES = 255
+
+# Points closer to a hull plane than this, relative to the size of the
+# piece, count as on it.
+RELATIVE_EPSILON = 1e-9
+
+
+def _face_planes(points, faces):
+    """Unit normals and offsets of (F, 3) triangles, zero normals for degenerate ones."""
+    origins = points[faces[:, 0]]
+    normals = np.cross(points[faces[:, 1]] - origins, points[faces[:, 2]] - origins)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.where(lengths > 0.0, normals / np.where(lengths > 0.0, lengths, 1.0), 0.0)
+    return normals, (normals * origins).sum(axis=1)
+
+
+def _initial_simplex(points, epsilon):
+    """Four point indices spanning a tetrahedron, None when the points are (nearly) flat."""
+    extremes = np.unique(np.concatenate((points.argmin(axis=0), points.argmax(axis=0))))
+    pair_distances = np.linalg.norm(points[extremes][:, None] - points[extremes][None], axis=2)
+    first, second = np.unravel_index(pair_distances.argmax(), pair_distances.shape)
+    a, b = extremes[first], extremes[second]
+    if pair_distances[first, second] <= epsilon:
+        return None
+
+    direction = (points[b] - points[a]) / pair_distances[first, second]
+    line_distances = np.linalg.norm(np.cross(points - points[a], direction), axis=1)
+    c = int(line_distances.argmax())
+    if line_distances[c] <= epsilon:
+        return None
+
+    normal = np.cross(points[b] - points[a], points[c] - points[a])
+    plane_distances = (points - points[a]) @ (normal / np.linalg.norm(normal))
+    d = int(np.abs(plane_distances).argmax())
+    if abs(plane_distances[d]) <= epsilon:
+        return None
+    return int(a), int(b), c, d
+
+
+def convex_hull(points, max_vertices=0):
+    """Vertices (H, 3) float32 and outward triangles (T, 3) int32 of the convex hull of (N, 3) points.
+
+    max_vertices above 3 stops adding vertices at that count. None when the
+    points are flat or fewer than four.
+    """
+    points = np.unique(np.asarray(points, np.float64), axis=0)
+    if len(points) < 4:
+        return None
+    epsilon = RELATIVE_EPSILON * max(float(np.abs(points).max(axis=0).sum()), 1e-30)
+    simplex = _initial_simplex(points, epsilon)
+    if simplex is None:
+        return None
+
+    a, b, c, d = simplex
+    faces = np.array([[a, b, c], [a, c, d], [a, d, b], [b, d, c]])
+    normals, offsets = _face_planes(points, faces)
+    # Orient the faces away from the tetrahedron's centroid.
+    centroid = points[list(simplex)].mean(axis=0)
+    flip = normals @ centroid - offsets > 0.0
+    faces[flip] = faces[flip][:, ::-1]
+    normals[flip] = -normals[flip]
+    offsets[flip] = -offsets[flip]
+    alive = np.ones(4, bool)
+
+    # Every point outside the hull belongs to one face it is in front of.
+    distances = points @ normals.T - offsets
+    owners = np.where(distances.max(axis=1) > epsilon, distances.argmax(axis=1), -1)
+    heights = distances.max(axis=1)
+    vertex_count = 4
+
+    while (max_vertices <= 3 or vertex_count < max_vertices) and (owners >= 0).any():
+        eye = int(np.where(owners >= 0, heights, -np.inf).argmax())
+        point = points[eye]
+        live = np.flatnonzero(alive)
+        visible = live[normals[live] @ point - offsets[live] > epsilon]
+
+        # The horizon: edges of visible faces whose twin belongs to a face that stays.
+        edges = faces[visible][:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2).astype(np.int64)
+        keys = edges[:, 0] * len(points) + edges[:, 1]
+        twins = edges[:, 1] * len(points) + edges[:, 0]
+        horizon = edges[~np.isin(twins, keys)]
+
+        new_faces = np.column_stack((horizon, np.full(len(horizon), eye)))
+        new_normals, new_offsets = _face_planes(points, new_faces)
+        first_new = len(faces)
+        alive[visible] = False
+        faces = np.concatenate((faces, new_faces))
+        normals = np.concatenate((normals, new_normals))
+        offsets = np.concatenate((offsets, new_offsets))
+        alive = np.concatenate((alive, np.ones(len(new_faces), bool)))
+        vertex_count += 1
+
+        # Points of the removed faces move to a new face they are in front of, or are inside now.
+        orphans = np.flatnonzero(np.isin(owners, visible))
+        owners[eye] = -1
+        orphans = orphans[orphans != eye]
+        if len(orphans):
+            distances = points[orphans] @ new_normals.T - new_offsets
+            best = distances.argmax(axis=1)
+            heights[orphans] = distances[np.arange(len(orphans)), best]
+            owners[orphans] = np.where(heights[orphans] > epsilon, first_new + best, -1)
+
+    faces = faces[alive]
+    used, triangles = np.unique(faces, return_inverse=True)
+    return points[used].astype(np.float32), triangles.reshape(-1, 3).astype(np.int32)
+
+
+def loose_parts(triangles, vertex_count):
+    """Vertex indices of every loose part of a triangle mesh, largest first; unused vertices are left out."""
+    triangles = np.asarray(triangles, np.int64)
+    if not len(triangles):
+        return []
+    labels = np.arange(vertex_count)
+    corners = triangles.ravel()
+    while True:
+        # Every vertex takes the smallest label of its triangles, then labels
+        # follow their own label, which collapses chains quickly.
+        updated = labels.copy()
+        np.minimum.at(updated, corners, np.repeat(labels[triangles].min(axis=1), 3))
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+
+    used = np.unique(corners)
+    order = np.argsort(labels[used], kind="stable")
+    used = used[order]
+    starts = np.flatnonzero(np.diff(labels[used])) + 1
+    return sorted(np.split(used, starts), key=len, reverse=True)
+
+
+def key(pieces, max_vertices=DEFAULT_MAX_VERTICES):
+    """blake2b-128 hex digest of the geometry of pieces and the cooking settings."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(("%d %d %d;" % (COOK_VERSION, max_vertices, len(pieces))).encode())
+    for positions, triangles, split in pieces:
+        for array in (np.ascontiguousarray(positions, np.float32), np.ascontiguousarray(triangles, np.int32)):
+            h.update(str(array.shape).encode())
+            h.update(array.data)
+        h.update(b"split;" if split else b"whole;")
+    return h.hexdigest()
+
+
+def encode(hulls):
+    """.hulls file content of a list of (vertices, triangles)."""
+    parts = [HULLS_MAGIC, struct.pack("<II", HULLS_VERSION, len(hulls))]
+    for vertices, triangles in hulls:
+        parts.append(struct.pack("<II", len(vertices), len(triangles)))
+        parts.append(np.ascontiguousarray(vertices, "<f4").tobytes())
+        parts.append(np.ascontiguousarray(triangles, "<u2").tobytes())
+    return b"".join(parts)
+
+
+def decode(data):
+    """List of (vertices, triangles) of .hulls file content."""
+    if data[:4] != HULLS_MAGIC:
+        raise ValueError("not a .hulls file")
+    version, count = struct.unpack_from("<II", data, 4)
+    if version != HULLS_VERSION:
+        raise ValueError(".hulls version %d is not supported" % version)
+    position = 12
+    hulls = []
+    for _hull in range(count):
+        vertex_count, triangle_count = struct.unpack_from("<II", data, position)
+        position += 8
+        vertices = np.frombuffer(data, "<f4", vertex_count * 3, position).reshape(-1, 3)
+        position += vertex_count * 12
+        triangles = np.frombuffer(data, "<u2", triangle_count * 3, position).reshape(-1, 3)
+        position += triangle_count * 6
+        hulls.append((vertices, triangles))
+    return hulls
+
+
+def write_file(path, data):
+    """Write data to path atomically."""
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def cache_load(directory, cache_key):
+    """Cached .hulls file content for cache_key, None when there is none."""
+    path = os.path.join(directory, cache_key + HULLS_EXTENSION)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)  # Recently used, pruned last.
+    except OSError:
+        return None
+    return data
+
+
+def cache_store(directory, cache_key, data):
+    """Keep .hulls file content for cache_key, pruning the least recently used files."""
+    os.makedirs(directory, exist_ok=True)
+    write_file(os.path.join(directory, cache_key + HULLS_EXTENSION), data)
+    entries = [entry for entry in os.scandir(directory) if entry.name.endswith(HULLS_EXTENSION)]
+    if len(entries) <= MAX_CACHE_FILES:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:len(entries) - MAX_CACHE_FILES]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass  # Removed by a parallel export.
+
+
+def hull_stats(hulls):
+    return {
+        "hulls": len(hulls),
+        "vertices": sum(len(vertices) for vertices, _triangles in hulls),
+        "triangles": sum(len(triangles) for _vertices, triangles in hulls),
+    }
+
+
+def cook(pieces, max_vertices=DEFAULT_MAX_VERTICES):
+    """.hulls file content and figures of the hulls of pieces.
+
+    pieces is a list of (positions (N, 3), triangles (T, 3), split); split
+    pieces get one hull per loose part. Parts that are flat or have fewer
+    than four vertices get no hull and count as skipped.
+    """
+    start = time.perf_counter()
+    hulls = []
+    skipped = 0
+    for positions, triangles, split in pieces:
+        parts = loose_parts(triangles, len(positions)) if split else [np.unique(triangles)]
+        for part in parts:
+            hull = convex_hull(positions[part], max_vertices) if len(part) else None
+            if hull is None:
+                skipped += 1
+            else:
+                hulls.append(hull)
+    stats = hull_stats(hulls)
+    stats.update(skipped=skipped, seconds=time.perf_counter() - start)
+    return encode(hulls), stats
+
+
+def _encode_array(array):
+    array = np.ascontiguousarray(array)
+    return {"dtype": array.dtype.str, "shape": list(array.shape),
+            "data": base64.b64encode(array.tobytes()).decode("ascii")}
+
+
+def _decode_array(message):
+    return np.frombuffer(base64.b64decode(message["data"]), message["dtype"]).reshape(message["shape"])
+
+
+def cook_request(pieces, max_vertices):
+    """Worker request cooking pieces, see CookPool."""
+    return {
+        "pieces": [{"positions": _encode_array(np.asarray(positions, np.float32)),
+                    "triangles": _encode_array(np.asarray(triangles, np.int32)),
+                    "split": bool(split)}
+                   for positions, triangles, split in pieces],
+        "max_vertices": max_vertices,
+    }
+
+
+def cook_reply(request):
+    """Worker reply to a cook_request(), with the hulls base64 encoded."""
+    pieces = [(_decode_array(piece["positions"]), _decode_array(piece["triangles"]), piece["split"])
+              for piece in request["pieces"]]
+    data, stats = cook(pieces, request["max_vertices"])
+    return {"id": request["id"], "hulls": base64.b64encode(data).decode("ascii"), "stats": stats}
+
+
+class CookPool:
+    """max_workers worker processes started with the Python interpreter python.
+
+    Blender's sys.executable is Blender itself, the exporter passes the
+    interpreter bundled with it.
+    """
+
+    def __init__(self, max_workers, python=None):
+        command = [python or sys.executable, os.path.abspath(__file__), "--serve"]
+        self.services = services.ServicePool(command, "cooking worker")
+        self.threads = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.fallbacks = 0
+
+    def submit(self, pieces, max_vertices=DEFAULT_MAX_VERTICES):
+        """Future of cook(pieces, max_vertices)."""
+        return self.threads.submit(self._cook, pieces, max_vertices)
+
+    def _cook(self, pieces, max_vertices):
+        reply = self.services.request(cook_request(pieces, max_vertices))
+        if reply is not None:
+            return base64.b64decode(reply["hulls"]), reply["stats"]
+        with self.lock:
+            self.fallbacks += 1
+        return cook(pieces, max_vertices)
+
+    def shutdown(self, wait=True):
+        self.threads.shutdown(wait=wait)
+        self.services.close()
+
+
+def serve():
+    """Cook the jobs arriving on stdin until it is closed, see CookPool."""
+    requests, replies = sys.stdin.buffer, sys.stdout.buffer
+    # Anything printed must not end up in the replies.
+    sys.stdout = sys.stderr
+    while True:
+        request = services.read_message(requests)
+        if request is None:
+            return
+        services.write_message(replies, cook_reply(request))
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["--serve"]:
+        sys.exit("usage: python collision.py --serve")
+    serve()
@@ -0,0 +1,205 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Conversion of intermediate FBX files to .mesh with fbx_tool_win_release.exe.
+#
+# Conversions are independent external processes, so several of them run at
+# once from a thread pool. A failing file never aborts the others, its error is
+# collected in its ConversionResult, and the intermediate FBX is always removed.
+#
+# By default every file gets its own converter process. When a converter that
+# can serve requests is configured (EXOR_MESH_CONVERTER_SERVER), long-lived
+# instances of it are kept for the whole Blender session instead and fed jobs
+# over stdin/stdout with the protocol of services.py:
+#
+#   request:  {"id": 1, "args": ["<file.fbx>", "1", "1", "1", "0", "1"]}
+#   reply:    {"id": 1, "returncode": 0, "output": "..."}
+#
+# A service that dies is restarted for the next job, and a job whose service
+# fails twice falls back to a one-off process. A conversion that takes longer
+# than the timeout (EXOR_MESH_CONVERTER_TIMEOUT seconds) fails: its service or
+# process is killed, so a hung converter never blocks the export, and a killed
+# service is restarted for the next job.
+
+import atexit
+import os
+import shlex
+import subprocess
+import threading
+import time
+
+from . import services
+from .profiling import NULL_TRACE, file_size
+
+TOOL_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fbx_tool_win_release.exe")
+
+# Command line replacing the bundled tool, e.g. a wrapper on non-Windows hosts.
+TOOL_ENV = "EXOR_MESH_CONVERTER"
+# Command line of a converter serving requests, see above.
+SERVER_ENV = "EXOR_MESH_CONVERTER_SERVER"
+# Seconds one conversion may take, 0 for no limit.
+TIMEOUT_ENV = "EXOR_MESH_CONVERTER_TIMEOUT"
+DEFAULT_TIMEOUT = 600.0
+
+
+class ConversionResult:
+    __slots__ = ("fbx_path", "returncode", "output", "elapsed")
+
+    def __init__(self, fbx_path, returncode, output="", elapsed=0.0):
+        self.fbx_path = fbx_path
+        # None when the tool could not be started at all.
+        self.returncode = returncode
+        self.output = output
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    @property
+    def message(self):
+        lines = self.output.strip().splitlines()
+        if lines:
+            return lines[-1]
+        if self.returncode is None:
+            return "converter could not be started"
+        return "converter exited with code %d" % self.returncode
+
+
+def default_max_workers():
+    return os.cpu_count() or 1
+
+
+def conversion_timeout():
+    """Seconds one conversion may take, None for no limit."""
+    try:
+        timeout = float(os.environ.get(TIMEOUT_ENV, DEFAULT_TIMEOUT))
+    except ValueError:
+        timeout = DEFAULT_TIMEOUT
+    return timeout if timeout > 0.0 else None
+
+
+def split_command(command):
+    if os.name == "nt":
+        return [part.strip('"') for part in shlex.split(command, posix=False)]
+    return shlex.split(command)
+
+
+def tool_command():
+    command = os.environ.get(TOOL_ENV)
+    return split_command(command) if command else [TOOL_PATH]
+
+
+def tool_arguments(fbx_path, use_armature_deform_only=False):
+    # Last flag tells the tool whether it may strip non-deforming bones.
+    remove_bones = "0" if use_armature_deform_only else "1"
+    return [fbx_path, "1", "1", "1", "0", remove_bones]
+
+
+def fbx_tool_args(fbx_path, use_armature_deform_only=False):
+    return tool_command() + tool_arguments(fbx_path, use_armature_deform_only)
+
+
+class ServicePool(services.ServicePool):
+    """Idle converter services, grown on demand to the number of concurrent conversions."""
+
+    def __init__(self, command):
+        super().__init__(command, "converter")
+
+    def convert(self, args, timeout=None):
+        """Reply of a service to the request, None when no service could handle it.
+
+        A request that times out is not retried, its reply has returncode None.
+        """
+        try:
+            return self.request({"args": args}, timeout)
+        except TimeoutError as e:
+            return {"returncode": None, "output": str(e)}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def service_pool():
+    """The session's service pool, None when no converter server is configured."""
+    global _pool
+    command = os.environ.get(SERVER_ENV)
+    with _pool_lock:
+        if _pool is not None and (not command or _pool.command != split_command(command)):
+            _pool.close()
+            _pool = None
+        if command and _pool is None:
+            _pool = ServicePool(split_command(command))
+        return _pool
+
+
+def shutdown_services():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+atexit.register(shutdown_services)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def run_tool(fbx_path, use_armature_deform_only=False, timeout=None):
+    """Convert with a one-off converter process, started directly (no shell in between)."""
+    try:
+        proc = subprocess.run(fbx_tool_args(fbx_path, use_armature_deform_only),
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+        return ConversionResult(fbx_path, proc.returncode, proc.stdout.decode(errors="replace"))
+    except subprocess.TimeoutExpired:
+        return ConversionResult(fbx_path, None, "converter did not finish within %.0fs" % timeout)
+    except (OSError, subprocess.SubprocessError) as e:
+        return ConversionResult(fbx_path, None, str(e))
+
+
+def convert_fbx(fbx_path, use_armature_deform_only=False, trace=NULL_TRACE):
+    """Run the converter on an intermediate FBX file, always removing it afterwards."""
+    name = os.path.basename(fbx_path)
+    start = time.perf_counter()
+    timeout = conversion_timeout()
+    try:
+        with trace.stage("convert", name) as event:
+            event["input_bytes"] = file_size(fbx_path)
+            pool = service_pool()
+            reply = pool.convert(tool_arguments(fbx_path, use_armature_deform_only), timeout) if pool else None
+            if reply is not None:
+                result = ConversionResult(fbx_path, reply.get("returncode"), reply.get("output", ""))
+            else:
+                result = run_tool(fbx_path, use_armature_deform_only, timeout)
+            event["service"] = reply is not None
+            event["returncode"] = result.returncode
+    finally:
+        with trace.stage("cleanup", name):
+            remove_file(fbx_path)
+
+    result.elapsed = time.perf_counter() - start
+    return result
@@ -0,0 +1,234 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Incremental export cache.
+#
+# Every exported object gets a content key: a hash of its evaluated geometry in
+# export space, its modifier stack, materials, the armature and actions driving
+# it, and the export settings. The key and the .mesh files produced for it are
+# stored in a JSON file in the export directory, and an object whose key
+# matches (and whose outputs still exist) does not need to be exported again.
+#
+# Several exports may share a directory (batch workers, a background export
+# next to another one), so save() only writes back the entries this export
+# changed: under the manifest lock it merges them into the file as it is on
+# disk and replaces it atomically.
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from . import manifest, mesh_arrays
+
+CACHE_FILENAME = ".exor_mesh_cache.json"
+CACHE_VERSION = 1
+MAX_ENTRIES = 4096
+
+# Geometry types the FBX exporter converts to meshes, by object_types entry.
+MESH_TYPES = {
+    'MESH': {'MESH'},
+    'OTHER': {'CURVE', 'SURFACE', 'FONT', 'META'},
+}
+
+# Operator keywords that do not change the exported data.
+IGNORED_SETTINGS = {"filepath", "max_workers", "use_cache", "use_cache_force", "use_background",
+                    "use_streaming", "memory_limit", "use_preflight", "preflight_strict", "use_manifest",
+                    "report_vertex_cache", "report_compact_format", "trace_path", "trace_chrome"}
+
+
+def is_cacheable(obj, object_types):
+    return any(obj.type in MESH_TYPES.get(object_type, ()) for object_type in object_types)
+
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=16)
+
+
+def _update_array(h, array):
+    if array is not None:
+        array = np.ascontiguousarray(array)
+        h.update(str(array.shape).encode())
+        h.update(array.data)
+
+
+def settings_digest(keywords):
+    h = _new_hash()
+    for key in sorted(keywords):
+        if key in IGNORED_SETTINGS:
+            continue
+        value = keywords[key]
+        if key == "global_matrix":
+            value = [tuple(row) for row in value]
+        elif isinstance(value, (set, frozenset)):
+            value = sorted(value)
+        h.update(("%s=%r;" % (key, value)).encode())
+    return h.hexdigest()
+
+
+def actions_digest(actions):
+    """Hash of the keyframes of all actions, the animation exported with skinned meshes."""
+    h = _new_hash()
+    for action in sorted(actions, key=lambda action: action.name):
+        h.update(action.name.encode())
+        for fcurve in action.fcurves:
+            h.update(("%s[%d]" % (fcurve.data_path, fcurve.array_index)).encode())
+            points = fcurve.keyframe_points
+            coords = np.empty(len(points) * 2, np.float32)
+            points.foreach_get("co", coords)
+            _update_array(h, coords)
+    return h.hexdigest()
+
+
+def _armatures(obj):
+    armatures = {modifier.object for modifier in obj.modifiers
+                 if modifier.type == 'ARMATURE' and modifier.object is not None}
+    if obj.parent is not None and obj.parent.type == 'ARMATURE':
+        armatures.add(obj.parent)
+    return sorted(armatures, key=lambda armature: armature.name)
+
+
+def _update_armature(h, armature):
+    h.update(armature.name.encode())
+    bones = armature.data.bones
+    h.update(",".join(bone.name for bone in bones).encode())
+    matrices = np.empty(len(bones) * 16, np.float32)
+    bones.foreach_get("matrix_local", matrices)
+    _update_array(h, matrices)
+    pose_bones = armature.pose.bones
+    matrices = np.empty(len(pose_bones) * 16, np.float32)
+    pose_bones.foreach_get("matrix", matrices)
+    _update_array(h, matrices)
+    _update_array(h, np.array(armature.matrix_world, np.float32))
+
+
+def object_key(obj, depsgraph, settings, actions=None, global_matrix=None, global_scale=1.0):
+    """Content key of one object, combining the settings and actions digests."""
+    h = _new_hash()
+    h.update(settings.encode())
+    h.update(obj.name.encode())
+
+    arrays = mesh_arrays.extract_object(obj, depsgraph, global_matrix, global_scale)
+    if arrays is not None:
+        for name in ("positions", "loop_vertices", "loop_normals", "polygon_loop_starts", "polygon_materials",
+                     "triangles", "weight_offsets", "weight_groups", "weight_values"):
+            _update_array(h, getattr(arrays, name))
+        for layers in (arrays.uvs, arrays.colors):
+            for name in sorted(layers):
+                h.update(name.encode())
+                _update_array(h, layers[name])
+        h.update(",".join(arrays.group_names).encode())
+
+    for modifier in obj.modifiers:
+        h.update(("%s:%s:%d:%d;" % (modifier.name, modifier.type,
+                                    modifier.show_viewport, modifier.show_render)).encode())
+    for slot in obj.material_slots:
+        h.update((slot.material.name if slot.material else "").encode())
+
+    armatures = _armatures(obj)
+    for armature in armatures:
+        _update_armature(h, armature)
+    if armatures and actions:
+        h.update(actions.encode())
+
+    return h.hexdigest()
+
+
+class ExportCache:
+    """Persistent map of object name -> (content key, produced .mesh files)."""
+
+    def __init__(self, directory, max_entries=MAX_ENTRIES):
+        self.path = os.path.join(directory, CACHE_FILENAME)
+        self.max_entries = max_entries
+        self.entries = {}
+        self.changed = set()  # names stored or discarded since load()
+        self.used = set()  # names of lookup() hits
+
+    @classmethod
+    def load(cls, directory, max_entries=MAX_ENTRIES):
+        cache = cls(directory, max_entries)
+        try:
+            with open(cache.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cache
+
+        if data.get("version") == CACHE_VERSION:
+            cache.entries = data.get("entries", {})
+        return cache
+
+    def lookup(self, name, key):
+        """True when name was exported with this key and all its outputs still exist."""
+        entry = self.entries.get(name)
+        hit = (entry is not None and entry["key"] == key and bool(entry["outputs"]) and
+               all(os.path.isfile(os.path.join(os.path.dirname(self.path), output))
+                   for output in entry["outputs"]))
+        if hit:
+            entry["used"] = time.time()
+            self.used.add(name)
+        return hit
+
+    def store(self, name, key, outputs):
+        directory = os.path.dirname(self.path)
+        self.entries[name] = {
+            "key": key,
+            "outputs": sorted(os.path.relpath(output, directory) for output in outputs),
+            "used": time.time(),
+        }
+        self.changed.add(name)
+
+    def discard(self, name):
+        self.entries.pop(name, None)
+        self.changed.add(name)
+
+    def evict(self):
+        """Drop least recently used entries beyond max_entries."""
+        if len(self.entries) > self.max_entries:
+            names = sorted(self.entries, key=lambda name: self.entries[name]["used"], reverse=True)
+            for name in names[self.max_entries:]:
+                del self.entries[name]
+
+    def merge(self, entries):
+        """Entries on disk, with this cache's changes and lookup times applied."""
+        for name in self.changed:
+            if name in self.entries:
+                entries[name] = self.entries[name]
+            else:
+                entries.pop(name, None)
+        for name in self.used - self.changed:
+            entry = entries.get(name)
+            if entry is not None and entry["key"] == self.entries[name]["key"]:
+                entry["used"] = max(entry["used"], self.entries[name]["used"])
+        return entries
+
+    def save(self):
+        """Merge the changes into the cache file, raises OSError or TimeoutError when it cannot."""
+        directory = os.path.dirname(self.path)
+        with manifest.locked(directory):
+            self.entries = self.merge(ExportCache.load(directory, self.max_entries).entries)
+            self.evict()
+            tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, "entries": self.entries}, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        self.changed.clear()
+        self.used.clear()
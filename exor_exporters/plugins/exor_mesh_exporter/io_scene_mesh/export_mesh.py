@@ -0,0 +1,1042 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Export pipeline of the EXOR mesh addon.
+#
+# The .mesh layout is owned by fbx_tool_win_release.exe, so export is done in
+# two steps: Blender's own FBX exporter writes intermediate binary FBX files and
+# the tool turns each of them into one .mesh file per object. Every step lives
+# in its own function so the pipeline can be driven (and timed) piece by piece.
+#
+# An ExportJob ties the steps together. FBX files are written on the calling
+# thread, as they read Blender data, while the files already written convert on
+# a thread pool. save() runs a job to completion; the operator's background mode
+# instead writes one object hierarchy per timer event and polls the conversions,
+# so Blender stays responsive and the export can be cancelled in between.
+# Before any of that, the meshes to export go through the checks of
+# preflight.py, so broken ones stop the export before anything is written.
+#
+# With vertex cache ordering, meshes are rebuilt in optimize.reorder()'s order
+# for the duration of the FBX write, so the converter's buffers come out in it.
+#
+# Streaming writes one hierarchy per FBX file as well, so the FBX exporter only
+# ever holds the evaluated meshes and document of one hierarchy. What stays in
+# Blender after that are the mesh arrays queued for analysis, manifest figures,
+# collision hulls and LODs. With a memory ceiling, the next hierarchy is not
+# written while Blender is above it and such arrays are still held; converter
+# processes do not count, their memory is not Blender's.
+
+import math
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import bpy
+import numpy as np
+
+from . import (anim_bake, collision, converter, decimate, export_cache, lod, manifest, mesh_arrays, optimize,
+               preflight, profiling, quantize, skinning)
+from .profiling import NULL_TRACE, file_size
+
+
+def fbx_path_from_mesh_path(filepath):
+    return filepath.replace(".mesh", ".fbx")
+
+
+def list_files(root, ext, depth=1):
+    """Map path -> mtime of files with extension ext in root and up to depth levels below."""
+    found = {}
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return found
+
+    for entry in entries:
+        if entry.is_file():
+            if entry.name.lower().endswith(ext):
+                found[entry.path] = entry.stat().st_mtime_ns
+        elif depth and entry.is_dir():
+            found.update(list_files(entry.path, ext, depth - 1))
+    return found
+
+
+def new_files(root, ext, before):
+    """Files created or modified since the list_files snapshot before."""
+    return sorted(path for path, mtime in list_files(root, ext).items() if before.get(path) != mtime)
+
+
+def context_objects(context, use_selection=False, use_active_collection=False):
+    """Objects the FBX exporter considers when batch_mode is OFF."""
+    if use_active_collection:
+        objects = context.view_layer.active_layer_collection.collection.all_objects
+        if use_selection:
+            return [obj for obj in objects if obj.select_get()]
+        return list(objects)
+    if use_selection:
+        return list(context.selected_objects)
+    return list(context.view_layer.objects)
+
+
+def write_fbx(operator, context, fbx_path, context_objects=None, **kwargs):
+    """Write an intermediate FBX file, restricted to context_objects when given."""
+    from io_scene_fbx import export_fbx_bin
+    if context_objects is None:
+        return export_fbx_bin.save(operator, context, filepath=fbx_path, **kwargs)
+
+    for key in ("use_selection", "use_active_collection", "batch_mode", "use_batch_own_dir"):
+        kwargs.pop(key, None)
+    return export_fbx_bin.save_single(operator, context.scene, context.evaluated_depsgraph_get(), fbx_path,
+                                      context_objects=context_objects, **kwargs)
+
+
+def write_fbx_files(operator, context, fbx_path, batch_mode='OFF', trace=NULL_TRACE, **kwargs):
+    """Write the intermediate FBX file(s), returning the FBX exporter result and the written paths.
+
+    Batch modes name their files after scenes/collections, so the written ones
+    are found by comparing the export directory before and after (batch own
+    dirs sit one level below it). Partially written files are removed on error.
+    """
+    export_root = os.path.dirname(fbx_path)
+    before = list_files(export_root, ".fbx")
+    with trace.stage("write_fbx", os.path.basename(fbx_path)) as event:
+        try:
+            result = write_fbx(operator, context, fbx_path, batch_mode=batch_mode, **kwargs)
+        except BaseException:
+            for path in new_files(export_root, ".fbx", before):
+                converter.remove_file(path)
+            raise
+
+        fbx_paths = [fbx_path] if batch_mode == 'OFF' else new_files(export_root, ".fbx", before)
+        event["bytes"] = sum(file_size(path) for path in fbx_paths)
+        event["files"] = len(fbx_paths)
+
+    return result, fbx_paths
+
+
+def report_conversions(operator, results):
+    failed = [result for result in results if not result.ok]
+    for result in failed:
+        operator.report({'WARNING'}, "Converting %s failed: %s" % (os.path.basename(result.fbx_path), result.message))
+    if failed:
+        operator.report({'ERROR'}, "%d of %d files failed to convert" % (len(failed), len(results)))
+
+
+def mesh_outputs(obj, paths):
+    """The .mesh files among paths that the converter wrote for obj, its generated LODs included."""
+    names = {obj.name.lower(), bpy.path.clean_name(obj.name).lower()}
+    outputs = []
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0].lower()
+        if stem in names or lod.LOD_NAME.sub("", stem) in names:
+            outputs.append(path)
+    return outputs
+
+
+def batch_objects(context, batch_mode):
+    """Objects the FBX exporter writes in a batch mode, across all its files."""
+    if batch_mode == 'SCENE':
+        collections = [scene.collection for scene in bpy.data.scenes]
+    elif batch_mode == 'COLLECTION':
+        collections = bpy.data.collections
+    else:
+        collections = context.scene.collection.children
+    return list({obj: None for collection in collections for obj in collection.all_objects})
+
+
+def skin_groups(obj):
+    """Names of the bones of the armatures deforming obj, the vertex groups it is skinned with."""
+    names = set()
+    for modifier in getattr(obj, "modifiers", ()):
+        armature = getattr(modifier, "object", None)
+        if modifier.type == 'ARMATURE' and armature is not None and armature.type == 'ARMATURE':
+            names.update(bone.name for bone in armature.data.bones)
+    return names
+
+
+def _write_weights(obj, arrays, compaction):
+    """Write compacted weights to the vertex groups of obj, whose mesh arrays was extracted from."""
+    vertex_groups = obj.vertex_groups
+    vertices = obj.data.vertices
+    offsets = arrays.weight_offsets
+    owners = np.repeat(np.arange(arrays.vertex_count), np.diff(offsets))
+    changed = np.flatnonzero((compaction.weights != arrays.weight_values) & ~compaction.pruned)
+    weights = compaction.weights.tolist()
+    for entry, vertex in zip(changed.tolist(), owners[changed].tolist()):
+        vertices[vertex].groups[entry - int(offsets[vertex])].weight = weights[entry]
+
+    pruned = np.flatnonzero(compaction.pruned)
+    groups = arrays.weight_groups[pruned]
+    for group in np.unique(groups).tolist():
+        vertex_groups[group].remove(owners[pruned[groups == group]].tolist())
+
+
+@contextmanager
+def compacted_skins(context, objects, threshold, max_influences, trace=NULL_TRACE):
+    """Give the skinned meshes among objects compacted bone weights during the block.
+
+    Their meshes are swapped for copies, under the same name, which get the
+    compacted weights; the originals are put back on exit. Yields a list that
+    collects (object name, skinning.Compaction) pairs.
+    """
+    compactions = []
+    swapped = []  # (object, original mesh, copy)
+    try:
+        for obj in objects:
+            bones = skin_groups(obj) if obj.type == 'MESH' else ()
+            if not bones:
+                continue
+            with trace.stage("compact_skin", obj.name):
+                arrays = mesh_arrays.extract_weights(obj.data, [group.name for group in obj.vertex_groups])
+                compaction = skinning.compact(arrays, bones, threshold, max_influences)
+                if compaction is None:
+                    continue
+                compactions.append((obj.name, compaction))
+                if not compaction.changed:
+                    continue
+                original = obj.data
+                name = original.name
+                copy = original.copy()
+                swapped.append((obj, original, copy))
+                original.name = name + ".uncompacted"
+                copy.name = name
+                obj.data = copy
+                _write_weights(obj, arrays, compaction)
+        if swapped:
+            context.view_layer.update()
+        yield compactions
+    finally:
+        for obj, original, copy in reversed(swapped):
+            name = copy.name
+            obj.data = original
+            bpy.data.meshes.remove(copy)
+            original.name = name
+        if swapped:
+            context.view_layer.update()
+
+
+def keeps_order(obj, use_mesh_modifiers=True):
+    """True for meshes whose polygon order the FBX exporter does not take from obj.data as it is."""
+    if obj.data.shape_keys is not None:
+        return True
+    return use_mesh_modifiers and any(modifier.type != 'ARMATURE' for modifier in obj.modifiers)
+
+
+@contextmanager
+def reordered_meshes(context, objects, use_mesh_modifiers=True, trace=NULL_TRACE):
+    """Give the meshes among objects triangles and vertices in vertex cache order during the block.
+
+    Their meshes are swapped for new ones, under the same name, built from
+    optimize.reorder(); the originals are put back on exit. Meshes with shape
+    keys or (with use_mesh_modifiers) modifiers other than armatures keep
+    Blender's order, the FBX exporter would not write the new one. Yields a
+    list that collects the names of the reordered objects.
+    """
+    reordered = []
+    swapped = []  # (object, original mesh, copy)
+    try:
+        for obj in objects:
+            if obj.type != 'MESH' or keeps_order(obj, use_mesh_modifiers):
+                continue
+            with trace.stage("reorder", obj.name) as event:
+                original = obj.data
+                arrays = mesh_arrays.extract(original, group_names=[group.name for group in obj.vertex_groups])
+                if not arrays.triangle_count:
+                    continue
+                arrays = optimize.reorder(arrays)
+                event["triangles"] = arrays.triangle_count
+                name = original.name
+                copy = bpy.data.meshes.new(name + ".reordered")
+                mesh_arrays.fill_mesh(copy, arrays)
+                for material in original.materials:
+                    copy.materials.append(material)
+                if arrays.uvs:
+                    copy.uv_layers.active_index = original.uv_layers.active_index
+                swapped.append((obj, original, copy))
+                original.name = name + ".unordered"
+                copy.name = name
+                obj.data = copy
+                mesh_arrays.add_weights(obj.vertex_groups, arrays)
+                reordered.append(obj.name)
+        if swapped:
+            context.view_layer.update()
+        yield reordered
+    finally:
+        for obj, original, copy in reversed(swapped):
+            name = copy.name
+            obj.data = original
+            bpy.data.meshes.remove(copy)
+            original.name = name
+        if swapped:
+            context.view_layer.update()
+
+
+def mesh_stems(name):
+    """Lower case file names (without extension) the .mesh of an object called name may have."""
+    return {name.lower(), bpy.path.clean_name(name).lower()}
+
+
+# Children named UCX_<anything> model the collision of their parent, one convex piece each.
+COLLIDER_PREFIX = "UCX_"
+
+
+def is_collider(obj):
+    return obj.name.upper().startswith(COLLIDER_PREFIX)
+
+
+def collision_pieces(obj, depsgraph, global_matrix=None, global_scale=1.0, split=False):
+    """Collision pieces of obj for collision.cook(), in its own space with the export axes and scale.
+
+    Its UCX_ mesh children are a piece each, without them the object itself
+    is one piece, split into loose parts when split is set.
+    """
+    colliders = [child for child in obj.children if child.type == 'MESH' and is_collider(child)]
+    sources = [(child, False) for child in colliders] or [(obj, split)]
+    owner_inverse = obj.matrix_world.inverted()
+    pieces = []
+    for source, split_source in sources:
+        with mesh_arrays.evaluated_mesh(source, depsgraph) as mesh:
+            if mesh is None:
+                continue
+            arrays = mesh_arrays.extract(mesh, use_uvs=False, use_colors=False, use_weights=False)
+        if not arrays.triangle_count:
+            continue
+        matrix = mesh_arrays.export_matrix(global_matrix, global_scale, owner_inverse @ source.matrix_world)
+        positions = arrays.positions @ matrix[:3, :3].T + matrix[:3, 3]
+        pieces.append((positions.astype(np.float32), arrays.triangle_vertices, split_source))
+    return pieces
+
+
+def export_units(objects):
+    """Split objects into groups the converter can process independently, as (name, objects) pairs.
+
+    A group is a root object (one whose parent is not exported) with its
+    exported descendants, plus the exported armatures deforming them. Armatures
+    only used by other groups do not get a group of their own.
+    """
+    exported = set(objects)
+    groups = {}
+    roots = []
+    for obj in objects:
+        root = obj
+        while root.parent in exported:
+            root = root.parent
+        if root not in groups:
+            groups[root] = []
+            roots.append(root)
+        groups[root].append(obj)
+
+    deforming = set()
+    for members in groups.values():
+        for obj in list(members):
+            for modifier in getattr(obj, "modifiers", ()):
+                armature = getattr(modifier, "object", None)
+                if modifier.type == 'ARMATURE' and armature in exported and armature not in members:
+                    members.append(armature)
+                    deforming.add(armature)
+
+    return [(root.name, groups[root]) for root in roots
+            if not (root in deforming and groups[root] == [root])]
+
+
+class ExportJob:
+    """One export, run to completion by run() or step by step from a modal operator.
+
+    prepare() decides what to write, write_next() writes the next unit (the
+    whole export, or one object hierarchy in split mode) and queues its
+    conversions, finish() waits for them and reports.
+    """
+
+    def __init__(self, operator, filepath="", max_workers=0, use_cache=False, use_cache_force=False,
+                 use_background=False, use_streaming=False, memory_limit=0,
+                 use_preflight=True, preflight_strict=False, use_vertex_order=False,
+                 report_vertex_cache=False, report_compact_format=False,
+                 use_lods=False, lod_ratios="", use_skin_compaction=False,
+                 skin_weight_threshold=skinning.DEFAULT_THRESHOLD, skin_max_influences=skinning.DEFAULT_MAX_INFLUENCES,
+                 use_anim_key_reduction=False, anim_max_location_error=0.001,
+                 anim_max_rotation_error=math.radians(0.05), anim_max_scale_error=0.001,
+                 use_manifest=False, collision_mode='OFF', collision_max_vertices=collision.DEFAULT_MAX_VERTICES,
+                 trace_path="", trace_chrome=False, **keywords):
+        self.operator = operator
+        self.keywords = keywords
+        self.fbx_path = fbx_path_from_mesh_path(filepath)
+        self.export_root = os.path.dirname(self.fbx_path)
+        batch = keywords.get("batch_mode", 'OFF') != 'OFF'
+        self.report_vertex_cache = report_vertex_cache and not batch
+        self.report_compact_format = report_compact_format and not batch
+        self.use_vertex_order = use_vertex_order and not batch
+        self.reordered = set()  # names of the objects written in vertex cache order
+        self.use_preflight = use_preflight
+        self.preflight_strict = preflight_strict
+        self.lod_ratios = decimate.parse_ratios(lod_ratios) if use_lods and not batch else []
+        self.use_cache = use_cache and not batch
+        self.use_cache_force = use_cache_force
+        self.anim_tolerances = None
+        if use_anim_key_reduction and keywords.get("bake_anim", True):
+            self.anim_tolerances = {
+                "Lcl Translation": anim_max_location_error,
+                "Lcl Rotation": math.degrees(anim_max_rotation_error),
+                "Lcl Scaling": anim_max_scale_error,
+            }
+        self.key_stats = anim_bake.KeyStats()
+        self.skin_compaction = (skin_weight_threshold, skin_max_influences) if use_skin_compaction else None
+        self.compactions = []  # (object name, skinning.Compaction)
+        self.use_manifest = use_manifest
+        self.collision_mode = collision_mode
+        self.collision_max_vertices = collision_max_vertices
+        # Per-hierarchy FBX files give per-object progress and cancellation
+        # points, and bound the memory the FBX exporter needs.
+        self.split = (use_background or use_streaming) and not batch
+        self.memory_limit = memory_limit * 1024 * 1024
+
+        self.trace_path, self.trace_chrome = profiling.trace_settings(trace_path, trace_chrome)
+        self.trace = profiling.Trace() if self.trace_path else NULL_TRACE
+        self.start = time.perf_counter()
+
+        self.max_workers = max_workers or converter.default_max_workers()
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.cook_pool = None  # collision.CookPool, started with the first hull to cook
+        self.units = []  # (name, objects), objects None leaves the choice to the FBX exporter
+        self.next_unit = 0
+        self.conversions = []  # (future, fbx_path)
+        self.analyses = []  # (object name, future)
+        self.lods = {}  # source object -> (triangle count, [(level, future)])
+        self.manifest_stats = {}  # object name -> (future of manifest.mesh_stats, material names)
+        self.collisions = {}  # object name -> (future of collision.cook, cache key)
+        self.held = {}  # future -> bytes of mesh arrays it keeps in Blender until it is done
+        self.unit_paths = {}  # object -> FBX file it was written to, in split mode
+        self.result = {'FINISHED'}
+        self.cancelled = False
+
+        self.meshes_before = {}
+        self.cache = None
+        self.changed = {}
+        self.unchanged = set()
+        self.org_mode = None
+
+    @property
+    def writing(self):
+        return not self.cancelled and self.next_unit < len(self.units)
+
+    @property
+    def done(self):
+        return (not self.writing and all(future.done() for future, _path in self.conversions)
+                and all(future.done() for _name, future in self.analyses)
+                and all(future.done() for future, _materials in self.manifest_stats.values())
+                and all(future.done() for future, _key in self.collisions.values())
+                and all(future.done() for future in self.lod_futures()))
+
+    def lod_futures(self, objects=None):
+        for obj in self.lods if objects is None else objects:
+            for _level, future in self.lods.get(obj, (0, ()))[1]:
+                yield future
+
+    @property
+    def ready(self):
+        """False while the LODs of the next unit are still being generated, or while throttled."""
+        if not self.writing:
+            return True
+        return all(future.done() for future in self.lod_futures(self.units[self.next_unit][1])) and not self.throttled()
+
+    def hold(self, future, nbytes):
+        """Count nbytes of mesh arrays as held until future is done."""
+        self.held[future] = nbytes
+        return future
+
+    def holding(self):
+        """Futures of queued work that still holds mesh arrays."""
+        self.held = {future: nbytes for future, nbytes in self.held.items() if not future.done()}
+        return list(self.held)
+
+    def throttled(self):
+        """True while Blender is above the memory ceiling and queued work still holds mesh arrays.
+
+        Only waiting for that work frees memory in Blender, so conversions are not waited for.
+        """
+        return bool(self.memory_limit and self.holding() and profiling.current_rss() > self.memory_limit)
+
+    def throttle(self):
+        """Block while throttled, for synchronous exports."""
+        if not self.throttled():
+            return
+        with self.trace.stage("throttle") as event:
+            event["rss"] = profiling.current_rss()
+            event["held_bytes"] = sum(self.held.values())
+            while self.throttled():
+                wait(self.holding(), return_when=FIRST_COMPLETED)
+
+    def prepare(self, context):
+        self.meshes_before = list_files(self.export_root, ".mesh")
+        if self.memory_limit and not profiling.current_rss():
+            self.operator.report({'WARNING'}, "Memory ceiling ignored, Blender's memory use cannot be queried here")
+            self.memory_limit = 0
+        batch_mode = self.keywords.get("batch_mode", 'OFF')
+        if batch_mode != 'OFF':
+            if not self.use_preflight or self.check(context, batch_objects(context, batch_mode)):
+                self.units = [(None, None)]
+            return
+
+        # The FBX exporter only leaves edit mode itself when it picks the objects.
+        active_object = context.view_layer.objects.active
+        if ((self.use_cache or self.split or self.lod_ratios or self.use_vertex_order) and active_object
+                and active_object.mode != 'OBJECT' and bpy.ops.object.mode_set.poll()):
+            self.org_mode = active_object.mode
+            bpy.ops.object.mode_set(mode='OBJECT')
+
+        objects = context_objects(context, self.keywords.get("use_selection", False),
+                                  self.keywords.get("use_active_collection", False))
+        if self.use_cache:
+            objects = self.skip_unchanged(context, objects)
+            if not objects:
+                return
+        if self.use_preflight and not self.check(context, objects):
+            self.cache = None
+            return
+
+        if self.split:
+            self.units = export_units(objects)
+        else:
+            self.units = [(None, objects if self.use_cache or self.lod_ratios else None)]
+        if self.lod_ratios and self.units:
+            self.queue_lods(context, self.units[0][1])
+
+    def check(self, context, objects):
+        """Run the preflight checks on the meshes among objects and report their problems.
+
+        Returns False when the export should not go ahead.
+        """
+        keywords = self.keywords
+        object_types = keywords.get("object_types", set())
+        use_tspace = keywords.get("use_tspace", False)
+        global_matrix, global_scale = keywords.get("global_matrix"), keywords.get("global_scale", 1.0)
+        problems = []
+        checked = 0
+        start = time.perf_counter()
+        # Compacted skins are normalized and limited before they are written.
+        check_weights = not self.skin_compaction or self.skin_compaction[1] > preflight.MAX_INFLUENCES
+        with self.trace.stage("evaluate"):
+            depsgraph = context.evaluated_depsgraph_get()
+        for obj in objects:
+            # Colliders are only ever used for their shape.
+            if not export_cache.is_cacheable(obj, object_types) or is_collider(obj):
+                continue
+            with self.trace.stage("preflight", obj.name) as event:
+                if keywords.get("use_mesh_modifiers", True):
+                    arrays = mesh_arrays.extract_object(obj, depsgraph, global_matrix, global_scale)
+                elif obj.type == 'MESH':
+                    arrays = mesh_arrays.extract(obj.data, group_names=[group.name for group in obj.vertex_groups])
+                    mesh_arrays.transform(arrays, mesh_arrays.export_matrix(global_matrix, global_scale,
+                                                                            obj.matrix_world))
+                else:
+                    arrays = mesh_arrays.extract_object(obj, depsgraph, global_matrix, global_scale)
+                if arrays is None:
+                    continue
+                found = preflight.check(obj.name, arrays, use_tspace=use_tspace,
+                                        skin_groups=skin_groups(obj) if check_weights else ())
+                event["problems"] = len(found)
+            problems.extend(found)
+            checked += 1
+
+        errors = [problem for problem in problems if problem.severity == 'ERROR']
+        for problem in problems:
+            self.operator.report({problem.severity}, "Preflight: %s" % problem)
+        failed = bool(errors or (self.preflight_strict and problems))
+        summary = "Preflight checked %d objects in %.0f ms, %d errors, %d warnings" % (
+            checked, 1000.0 * (time.perf_counter() - start), len(errors), len(problems) - len(errors))
+        if failed:
+            self.operator.report({'ERROR'}, summary + ", nothing exported")
+            self.result = {'CANCELLED'}
+        else:
+            self.operator.report({'INFO'}, summary)
+        return not failed
+
+    def settings_digest(self):
+        """Digest of every export setting that changes the output."""
+        settings = self.keywords
+        if self.lod_ratios:
+            settings = dict(settings, lod_ratios=self.lod_ratios)
+        if self.anim_tolerances:
+            settings = dict(settings, anim_tolerances=sorted(self.anim_tolerances.items()))
+        if self.skin_compaction:
+            settings = dict(settings, skin_compaction=self.skin_compaction)
+        if self.use_vertex_order:
+            settings = dict(settings, vertex_order=True)
+        if self.collision_mode != 'OFF':
+            settings = dict(settings, collision=(self.collision_mode, self.collision_max_vertices))
+        return export_cache.settings_digest(settings)
+
+    def skip_unchanged(self, context, objects):
+        """Objects to export, leaving out those whose content key matches the export cache."""
+        keywords = self.keywords
+        self.cache = export_cache.ExportCache.load(self.export_root)
+        with self.trace.stage("evaluate"):
+            depsgraph = context.evaluated_depsgraph_get()
+        settings = self.settings_digest()
+        actions = export_cache.actions_digest(bpy.data.actions) if keywords.get("bake_anim") else None
+
+        object_types = keywords.get("object_types", set())
+        for obj in objects:
+            if not export_cache.is_cacheable(obj, object_types):
+                continue
+            with self.trace.stage("hash", obj.name):
+                key = export_cache.object_key(obj, depsgraph, settings, actions,
+                                              keywords.get("global_matrix"), keywords.get("global_scale", 1.0))
+            if not self.use_cache_force and self.cache.lookup(obj.name, key):
+                self.unchanged.add(obj)
+            else:
+                self.changed[obj] = key
+
+        if self.unchanged and not self.changed:
+            return []
+        return [obj for obj in objects if obj not in self.unchanged]
+
+    def unit_fbx_path(self, name):
+        stem = os.path.splitext(self.fbx_path)[0]
+        path = "%s.%s.fbx" % (stem, bpy.path.clean_name(name))
+        index = 1
+        while any(path == other for _future, other in self.conversions):
+            path = "%s.%s.%03d.fbx" % (stem, bpy.path.clean_name(name), index)
+            index += 1
+        return path
+
+    def write_next(self, context):
+        """Write the next unit and queue its conversions."""
+        name, objects = self.units[self.next_unit]
+        self.next_unit += 1
+
+        fbx_path = self.unit_fbx_path(name) if self.split else self.fbx_path
+        lod_objects = self.build_lods(context, objects) if self.lods else []
+        if self.lod_ratios and self.writing:
+            # Only the next unit's LOD sources are extracted ahead, they decimate while this one is written.
+            self.queue_lods(context, self.units[self.next_unit][1])
+        try:
+            if self.collision_mode != 'OFF':
+                self.queue_collisions(context, self.unit_objects(context, objects))
+            with anim_bake.instrumented_bake(self.key_stats, self.anim_tolerances, self.trace), \
+                    self.reordered_meshes(context, objects, lod_objects), \
+                    self.compacted_skins(context, objects, lod_objects):
+                if self.use_manifest:
+                    self.queue_manifest_stats(context, self.unit_objects(context, objects) + lod_objects)
+                result, fbx_paths = write_fbx_files(self.operator, context, fbx_path,
+                                                    context_objects=objects and objects + lod_objects,
+                                                    trace=self.trace, **self.keywords)
+        finally:
+            lod.remove_objects(lod_objects)
+        if result != {'FINISHED'}:
+            self.result = result
+        if self.split:
+            self.unit_paths.update((obj, fbx_path) for obj in objects)
+
+        deform_only = self.keywords.get("use_armature_deform_only", False)
+        for path in fbx_paths:
+            self.conversions.append((self.pool.submit(converter.convert_fbx, path, deform_only, self.trace), path))
+
+        if self.report_vertex_cache or self.report_compact_format:
+            self.queue_analyses(context, objects)
+
+    def unit_objects(self, context, objects):
+        """The objects of a unit, or of the whole export when objects is None and the FBX exporter picks them."""
+        if objects is not None:
+            return list(objects)
+        batch_mode = self.keywords.get("batch_mode", 'OFF')
+        if batch_mode != 'OFF':
+            return batch_objects(context, batch_mode)
+        return context_objects(context, self.keywords.get("use_selection", False),
+                               self.keywords.get("use_active_collection", False))
+
+    @contextmanager
+    def reordered_meshes(self, context, objects, lod_objects):
+        """reordered_meshes() over the objects of a unit, or of the whole export when the FBX exporter picks them."""
+        if not self.use_vertex_order:
+            yield
+            return
+        objects = self.unit_objects(context, objects) + lod_objects
+        with reordered_meshes(context, objects, self.keywords.get("use_mesh_modifiers", True), self.trace) as names:
+            yield
+        self.reordered.update(names)
+
+    @contextmanager
+    def compacted_skins(self, context, objects, lod_objects):
+        """compacted_skins() over the objects of a unit, or of the whole export when the FBX exporter picks them."""
+        if not self.skin_compaction:
+            yield
+            return
+        objects = self.unit_objects(context, objects) + lod_objects
+        with compacted_skins(context, objects, *self.skin_compaction, self.trace) as compactions:
+            yield
+        self.compactions.extend(compactions)
+
+    def queue_manifest_stats(self, context, objects):
+        """Extract the meshes among objects and queue their manifest figures.
+
+        The figures describe the mesh itself, so where the object sits in the
+        scene does not change its bounds.
+        """
+        keywords = self.keywords
+        object_types = keywords.get("object_types", set())
+        depsgraph = context.evaluated_depsgraph_get()
+        for obj in objects:
+            if not export_cache.is_cacheable(obj, object_types):
+                continue
+            with self.trace.stage("extract", obj.name):
+                arrays = mesh_arrays.extract_object(obj, depsgraph, keywords.get("global_matrix"),
+                                                    keywords.get("global_scale", 1.0), use_world=False)
+            if arrays is None:
+                continue
+            materials = [slot.material.name if slot.material else "" for slot in obj.material_slots]
+            future = self.hold(self.pool.submit(manifest.mesh_stats, arrays, skin_groups(obj)), arrays.nbytes)
+            self.manifest_stats[obj.name] = (future, materials)
+
+    def write_manifest(self, written):
+        """Merge entries for the written .mesh files into the export root's manifest."""
+        by_stem = {}
+        for name, (future, materials) in self.manifest_stats.items():
+            if not future.cancelled():
+                for stem in mesh_stems(name):
+                    by_stem[stem] = (name, future.result(), materials)
+
+        settings = self.settings_digest()
+        now = time.time()
+        entries = {}
+        with self.trace.stage("manifest") as event:
+            for path in written:
+                stem = os.path.splitext(os.path.basename(path))[0]
+                name, stats, materials = by_stem.get(stem.lower(), (stem, {}, None))
+                entry = {"object": name, "hash": manifest.file_hash(path), "size": file_size(path),
+                         "settings": settings, "exported": now}
+                entry.update(stats)
+                if materials is not None:
+                    entry["materials"] = materials
+                entries[manifest.relative_key(self.export_root, path)] = entry
+            try:
+                listed = manifest.update(self.export_root, entries)
+            except (OSError, TimeoutError) as e:
+                self.operator.report({'WARNING'}, "Export manifest not updated: %s" % e)
+                return
+            event["entries"] = listed
+        self.operator.report({'INFO'}, "Export manifest: %d files updated, %d listed" % (len(entries), listed))
+
+    def queue_collisions(self, context, objects):
+        """Extract the collision pieces of the meshes among objects and queue the cooking of their hulls.
+
+        Hulls of geometry cooked before with the same settings come from the
+        hull cache in the export root instead.
+        """
+        keywords = self.keywords
+        object_types = keywords.get("object_types", set())
+        cache_directory = os.path.join(self.export_root, collision.CACHE_DIRNAME)
+        depsgraph = context.evaluated_depsgraph_get()
+        for obj in objects:
+            if not export_cache.is_cacheable(obj, object_types) or is_collider(obj) or lod.is_lod(obj):
+                continue
+            with self.trace.stage("extract_collision", obj.name):
+                pieces = collision_pieces(obj, depsgraph, keywords.get("global_matrix"),
+                                          keywords.get("global_scale", 1.0), self.collision_mode == 'PARTS')
+            if not pieces:
+                continue
+            key = collision.key(pieces, self.collision_max_vertices)
+            data = collision.cache_load(cache_directory, key)
+            if data is not None:
+                future = Future()
+                future.set_result((data, dict(collision.hull_stats(collision.decode(data)), cached=True)))
+            else:
+                if self.cook_pool is None:
+                    # Blender 2.8x runs its bundled Python from binary_path_python, later versions from sys.executable.
+                    python = getattr(bpy.app, "binary_path_python", "") or sys.executable
+                    self.cook_pool = collision.CookPool(self.max_workers, python)
+                future = self.hold(self.cook_pool.submit(pieces, self.collision_max_vertices),
+                                   sum(positions.nbytes + triangles.nbytes for positions, triangles, _split in pieces))
+            self.collisions[obj.name] = (future, key)
+
+    def write_collisions(self, written):
+        """Write the cooked hulls of every object next to its .mesh and report them."""
+        by_stem = {}
+        for name, (future, key) in self.collisions.items():
+            for stem in mesh_stems(name):
+                by_stem[stem] = (name, future, key)
+
+        cache_directory = os.path.join(self.export_root, collision.CACHE_DIRNAME)
+        totals = {"objects": 0, "hulls": 0, "vertices": 0, "cached": 0, "seconds": 0.0}
+        with self.trace.stage("collision") as event:
+            for path in written:
+                name, future, key = by_stem.get(os.path.splitext(os.path.basename(path))[0].lower(),
+                                                (None, None, None))
+                if future is None or future.cancelled():
+                    continue
+                try:
+                    data, stats = future.result()
+                    collision.write_file(os.path.splitext(path)[0] + collision.HULLS_EXTENSION, data)
+                    if not stats.get("cached"):
+                        collision.cache_store(cache_directory, key, data)
+                except (OSError, ValueError) as e:
+                    self.operator.report({'WARNING'}, "%s: collision hulls not written: %s" % (name, e))
+                    continue
+                if stats.get("cached"):
+                    timing = "from the hull cache"
+                else:
+                    timing = "cooked in %.0f ms" % (1000.0 * stats["seconds"])
+                skipped = ", %d flat parts skipped" % stats["skipped"] if stats.get("skipped") else ""
+                self.operator.report({'INFO'}, "%s: %d collision hulls, %d vertices, %d triangles, %s%s"
+                                     % (name, stats["hulls"], stats["vertices"], stats["triangles"], timing, skipped))
+                totals["objects"] += 1
+                totals["hulls"] += stats["hulls"]
+                totals["vertices"] += stats["vertices"]
+                totals["cached"] += bool(stats.get("cached"))
+                totals["seconds"] += stats.get("seconds", 0.0)
+            event.update(totals)
+        if not totals["objects"]:
+            return
+        summary = "Collision: %d hulls, %d vertices for %d objects, %d from the hull cache, %.2fs cooking" % (
+            totals["hulls"], totals["vertices"], totals["objects"], totals["cached"], totals["seconds"])
+        if self.cook_pool is not None and self.cook_pool.fallbacks:
+            summary += ", %d cooked in Blender after worker failures" % self.cook_pool.fallbacks
+        self.operator.report({'INFO'}, summary)
+
+    def queue_lods(self, context, objects):
+        """Extract the LOD sources among objects and queue the decimation of every level."""
+        sources = [obj for obj in objects if obj.type == 'MESH' and not lod.is_lod(obj)]
+        with self.trace.stage("extract_lod_sources"):
+            source_arrays = lod.extract_sources(context, sources, self.keywords.get("use_mesh_modifiers", True))
+        for obj, arrays in source_arrays.items():
+            self.lods[obj] = (arrays.triangle_count, [
+                (level, self.hold(self.pool.submit(self.decimate_level, lod.lod_name(obj.name, level), arrays, ratio),
+                                  arrays.nbytes))
+                for level, ratio in enumerate(self.lod_ratios, 1)])
+
+    def decimate_level(self, name, arrays, ratio):
+        with self.trace.stage("decimate", name) as event:
+            decimation = decimate.decimate(arrays, ratio)
+            if decimation is not None:
+                event["triangles"] = decimation.triangle_count
+                event["max_error"] = decimation.max_error
+        return decimation
+
+    def build_lods(self, context, objects):
+        """Temporary LOD objects for the objects of a unit, waiting for their decimation."""
+        built = []
+        for obj in objects:
+            triangle_count, levels = self.lods.pop(obj, (0, ()))
+            for level, future in levels:
+                name = lod.lod_name(obj.name, level)
+                decimation = future.result()
+                if decimation is None:
+                    self.operator.report({'INFO'}, "%s: too few triangles for LOD %d, skipped" % (obj.name, level))
+                    continue
+                with self.trace.stage("build_lod", name):
+                    lod_object = lod.build_object(context, obj, name, decimation.arrays)
+                if lod_object is None:
+                    self.operator.report({'WARNING'}, "%s: an object named %s already exists, LOD %d skipped"
+                                         % (obj.name, name, level))
+                    continue
+                built.append(lod_object)
+                self.operator.report({'INFO'}, "%s: %d of %d triangles, error max %.4g rms %.4g"
+                                     % (name, decimation.triangle_count, triangle_count,
+                                        decimation.max_error, decimation.rms_error))
+        return built
+
+    def queue_analyses(self, context, objects):
+        """Extract the meshes of a unit and queue their vertex cache and compact format analysis."""
+        if objects is None:
+            objects = context_objects(context, self.keywords.get("use_selection", False),
+                                      self.keywords.get("use_active_collection", False))
+        depsgraph = context.evaluated_depsgraph_get()
+        for obj in objects:
+            if obj.type != 'MESH':
+                continue
+            with self.trace.stage("extract", obj.name):
+                arrays = mesh_arrays.extract_object(obj, depsgraph, use_tspace=self.keywords.get("use_tspace", False))
+            self.analyses.append((obj.name, self.hold(self.pool.submit(self.analyze, obj.name, arrays), arrays.nbytes)))
+
+    def analyze(self, name, arrays):
+        figures = {}
+        buffer = optimize.vertex_buffer(arrays)
+        if self.report_vertex_cache:
+            with self.trace.stage("optimize", name) as event:
+                figures.update(optimize.analyze(arrays, buffer=buffer))
+                event.update(figures)
+        if self.report_compact_format:
+            with self.trace.stage("quantize", name) as event:
+                figures["compact"] = compact = quantize.analyze(buffer)
+                event.update((key, compact[key]) for key in ("stride", "baseline_stride", "bytes", "baseline_bytes"))
+        return figures
+
+    def report_analyses(self):
+        saved = baseline = 0
+        for name, future in self.analyses:
+            if future.cancelled():
+                continue
+            figures = future.result()
+            if self.report_vertex_cache:
+                self.operator.report({'INFO'}, "%s: ACMR %.3f in Blender's order, %.3f %s (%d triangles, %d vertices)"
+                                     % (name, figures["acmr_before"], figures["acmr_after"],
+                                        "written" if name in self.reordered else "optimized",
+                                        figures["triangles"], figures["vertices"]))
+            if self.report_compact_format:
+                compact = figures["compact"]
+                for attribute, error in compact["fallbacks"]:
+                    self.operator.report({'WARNING'}, "%s: %s error %.4g is above tolerance, kept at full precision"
+                                         % (name, attribute, error))
+                self.operator.report({'INFO'}, "%s: compact format %d bytes per vertex instead of %d, "
+                                               "%d-bit indices, %.1f KB saved (%.1f%%)"
+                                     % (name, compact["stride"], compact["baseline_stride"], compact["index_bits"],
+                                        (compact["baseline_bytes"] - compact["bytes"]) / 1024.0,
+                                        100.0 * (1.0 - compact["bytes"] / max(compact["baseline_bytes"], 1))))
+                saved += compact["baseline_bytes"] - compact["bytes"]
+                baseline += compact["baseline_bytes"]
+        if baseline:
+            self.operator.report({'INFO'}, "Compact format would save %.1f of %.1f KB of vertex and index data (%.1f%%)"
+                                 % (saved / 1024.0, baseline / 1024.0, 100.0 * saved / baseline))
+
+    def report_skins(self):
+        if not self.compactions:
+            return
+        pruned = 0
+        for name, compaction in self.compactions:
+            pruned += int(compaction.pruned.sum())
+            self.operator.report({'INFO'}, "%s: influences %s before, %s after, %d of %d bones used, "
+                                           "%d weights dropped"
+                                 % (name, skinning.format_histogram(compaction.before),
+                                    skinning.format_histogram(compaction.after), len(compaction.palette),
+                                    compaction.bone_count, int(compaction.pruned.sum())))
+        self.operator.report({'INFO'}, "Skin weights compacted on %d meshes, %d weights dropped"
+                             % (len(self.compactions), pruned))
+
+    def report_bake(self):
+        stats = self.key_stats
+        if self.anim_tolerances and not stats.supported:
+            self.operator.report({'WARNING'}, "Error-bounded key reduction is not supported by this version of the "
+                                              "FBX exporter, baked animation was simplified with the Simplify factor")
+        if not stats.tracks:
+            if stats.bake_seconds:
+                self.operator.report({'INFO'}, "Animation baked in %.2fs" % stats.bake_seconds)
+            return
+
+        self.operator.report({'INFO'}, "Animation baked in %.2fs, %d of %d keys kept (%.1f%%) on %d tracks, "
+                                       "simplified in %.2fs"
+                             % (stats.bake_seconds, stats.kept, stats.sampled,
+                                100.0 * stats.kept / max(stats.sampled, 1), len(stats.tracks),
+                                stats.simplify_seconds))
+
+    def status_text(self):
+        converted = sum(future.done() for future, _path in self.conversions)
+        if self.cancelled:
+            text = "Cancelling EXOR Mesh export, waiting for %d conversions" % (len(self.conversions) - converted)
+        elif self.writing:
+            name = self.units[self.next_unit][0] or os.path.basename(self.fbx_path)
+            text = "Exporting %s (%d/%d), %d/%d converted" % (name, self.next_unit + 1, len(self.units),
+                                                               converted, len(self.conversions))
+            if self.throttled():
+                text += ", waiting for memory"
+        else:
+            text = "Converting, %d/%d done" % (converted, len(self.conversions))
+        return text
+
+    def cancel(self):
+        """Stop writing and drop the conversions that have not started, with their FBX files.
+
+        Running conversions cannot be interrupted, finish() waits for them.
+        """
+        self.cancelled = True
+        for future, path in self.conversions:
+            if future.cancel():
+                converter.remove_file(path)
+        for _name, future in self.analyses:
+            future.cancel()
+        for future, _materials in self.manifest_stats.values():
+            future.cancel()
+        for future, _key in self.collisions.values():
+            future.cancel()
+        for future in self.lod_futures():
+            future.cancel()
+
+    def update_cache(self, written, failed_paths):
+        for obj, key in self.changed.items():
+            outputs = mesh_outputs(obj, written)
+            if outputs and self.unit_paths.get(obj, self.fbx_path) not in failed_paths:
+                self.cache.store(obj.name, key, outputs)
+            else:
+                self.cache.discard(obj.name)
+        try:
+            self.cache.save()
+        except (OSError, TimeoutError) as e:
+            self.operator.report({'WARNING'}, "Export cache not updated: %s" % e)
+
+        if self.units:
+            self.operator.report({'INFO'}, "Export cache: %d hits, %d misses" % (len(self.unchanged), len(self.changed)))
+        else:
+            self.operator.report({'INFO'}, "Export cache: %d hits, 0 misses, nothing to export" % len(self.unchanged))
+
+    def finish(self, context):
+        """Wait for the queued conversions, then report and write the cache and trace."""
+        results = []
+        failed_paths = set()
+        for future, path in self.conversions:
+            if future.cancelled():
+                failed_paths.add(path)
+                continue
+            result = future.result()
+            results.append(result)
+            if not result.ok:
+                failed_paths.add(path)
+        self.pool.shutdown()
+
+        written = new_files(self.export_root, ".mesh", self.meshes_before)
+        report_conversions(self.operator, results)
+        self.report_bake()
+        self.report_skins()
+        self.report_analyses()
+        if self.cache is not None:
+            self.update_cache(written, failed_paths)
+        if self.use_manifest and written:
+            self.write_manifest(written)
+        if self.collisions:
+            self.write_collisions(written)
+        if self.cook_pool is not None:
+            self.cook_pool.shutdown()
+
+        if self.org_mode is not None and bpy.ops.object.mode_set.poll():
+            bpy.ops.object.mode_set(mode=self.org_mode)
+
+        self.trace.record("export", self.start, bytes=sum(file_size(path) for path in written), files=len(written))
+        if self.trace_path:
+            self.trace.write(self.trace_path, self.trace_chrome)
+            self.operator.report({'INFO'}, "Export trace written to %s" % self.trace_path)
+
+        if self.cancelled:
+            self.operator.report({'WARNING'}, "Export cancelled, %d .mesh files written" % len(written))
+            return {'CANCELLED'}
+        return self.result
+
+    def run(self, context):
+        try:
+            self.prepare(context)
+            while self.writing:
+                self.throttle()
+                self.write_next(context)
+        except BaseException:
+            self.cancel()
+            self.finish(context)
+            raise
+        return self.finish(context)
+
+
+def save(operator, context, **kwargs):
+    return ExportJob(operator, **kwargs).run(context)
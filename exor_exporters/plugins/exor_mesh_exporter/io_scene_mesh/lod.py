@@ -0,0 +1,123 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Generated LOD objects.
+#
+# The converter names every .mesh after its object, so a LOD level is exported
+# as a temporary object called <object>_lod<N>, built from the decimated arrays
+# of its source object (see decimate.py). It copies the source's transform,
+# parent, materials, vertex groups and armature modifiers, is written to the
+# FBX together with it and is removed again right after.
+#
+# Sources are read in rest pose, with their armature modifiers disabled, the
+# same way the FBX exporter reads skinned meshes.
+
+import re
+from contextlib import contextmanager
+
+import bpy
+
+from . import mesh_arrays
+
+LOD_NAME = re.compile(r"_lod\d+$", re.IGNORECASE)
+
+
+def lod_name(obj_name, level):
+    return "%s_lod%d" % (obj_name, level)
+
+
+def is_lod(obj):
+    """True for objects that are LODs themselves, generated or made by hand."""
+    return LOD_NAME.search(obj.name) is not None
+
+
+@contextmanager
+def rest_pose(context, objects):
+    """Disable the armature modifiers of objects for the duration of the block."""
+    disabled = [modifier for obj in objects for modifier in obj.modifiers
+                if modifier.type == 'ARMATURE' and modifier.show_viewport]
+    for modifier in disabled:
+        modifier.show_viewport = False
+    if disabled:
+        context.view_layer.update()
+    try:
+        yield
+    finally:
+        for modifier in disabled:
+            modifier.show_viewport = True
+        if disabled:
+            context.view_layer.update()
+
+
+def extract_sources(context, objects, use_mesh_modifiers=True):
+    """Rest pose MeshArrays of every object, in object space."""
+    sources = {}
+    with rest_pose(context, objects):
+        depsgraph = context.evaluated_depsgraph_get()
+        for obj in objects:
+            group_names = [group.name for group in obj.vertex_groups]
+            if use_mesh_modifiers:
+                with mesh_arrays.evaluated_mesh(obj, depsgraph) as mesh:
+                    if mesh is not None:
+                        sources[obj] = mesh_arrays.extract(mesh, group_names=group_names)
+            else:
+                sources[obj] = mesh_arrays.extract(obj.data, group_names=group_names)
+    return sources
+
+
+def build_object(context, source, name, arrays):
+    """A temporary LOD object of source with the geometry of arrays, None when name is taken."""
+    if name in bpy.data.objects:
+        return None
+
+    mesh = bpy.data.meshes.new(name)
+    mesh_arrays.fill_mesh(mesh, arrays)
+    for slot in source.material_slots:
+        mesh.materials.append(slot.material)
+
+    obj = bpy.data.objects.new(name, mesh)
+    if obj.name != name:
+        # Truncated to Blender's name length limit, the output would be misnamed.
+        remove_objects([obj])
+        return None
+    context.scene.collection.objects.link(obj)
+    obj.parent = source.parent
+    obj.parent_type = source.parent_type
+    obj.parent_bone = source.parent_bone
+    obj.matrix_world = source.matrix_world.copy()
+
+    if arrays.weight_offsets is not None:
+        mesh_arrays.add_weights([obj.vertex_groups.new(name=group_name) for group_name in arrays.group_names], arrays)
+    for modifier in source.modifiers:
+        if modifier.type == 'ARMATURE':
+            copy = obj.modifiers.new(modifier.name, 'ARMATURE')
+            copy.object = modifier.object
+            copy.use_vertex_groups = modifier.use_vertex_groups
+            copy.use_bone_envelopes = modifier.use_bone_envelopes
+            copy.use_deform_preserve_volume = modifier.use_deform_preserve_volume
+    return obj
+
+
+def remove_objects(objects):
+    for obj in objects:
+        mesh = obj.data
+        bpy.data.objects.remove(obj)
+        if mesh is not None and mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
@@ -0,0 +1,158 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Export manifest.
+#
+# A compact JSON file in the export root describes every .mesh file below it,
+# keyed by its path relative to the root (with forward slashes), so packing
+# tools can look files up without opening them:
+#
+#   {"version": 1, "files": {"props/crate.mesh": {
+#       "object": "crate", "hash": "<blake2b-128 of the file>", "size": 18432,
+#       "aabb": [[x, y, z], [x, y, z]], "sphere": [x, y, z, radius],
+#       "vertices": 812, "triangles": 1204, "bones": 0,
+#       "materials": ["crate"], "settings": "<export settings digest>",
+#       "exported": 1700000000.0}}}
+#
+# Geometry figures are in the object's own space, with the export axes and
+# scale, so moving an object in the scene does not change them. vertices
+# counts unique vertices as a GPU draws them, bones the bones that carry
+# weights. Files written without geometry figures (objects the FBX exporter
+# picked itself) only have object, hash, size, settings and exported.
+#
+# Exports merge their entries into the manifest rather than rewriting it:
+# under a lock file the manifest is read again, entries of .mesh files that no
+# longer exist are dropped, the new entries are added and the result replaces
+# the file atomically. Parallel exports into the same root, such as
+# batch_export.py workers, therefore never lose each other's entries.
+#
+# This module does not import bpy.
+
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from . import optimize
+
+MANIFEST_FILENAME = "exor_mesh_manifest.json"
+MANIFEST_VERSION = 1
+
+# A lock file older than this is left over from a crashed export.
+STALE_LOCK_SECONDS = 60.0
+LOCK_TIMEOUT = 30.0
+
+
+def mesh_stats(arrays, skin_groups=()):
+    """Geometry figures of MeshArrays, as manifest entry fields."""
+    positions = arrays.positions.astype(np.float64)
+    if len(positions):
+        low, high = positions.min(axis=0), positions.max(axis=0)
+    else:
+        low = high = np.zeros(3)
+    # Centered on the box, not minimal, but cheap and never too small.
+    center = (low + high) * 0.5
+    radius = float(np.sqrt(((positions - center) ** 2).sum(axis=1).max())) if len(positions) else 0.0
+
+    bones = 0
+    if skin_groups and arrays.weight_offsets is not None:
+        used = np.unique(arrays.weight_groups[arrays.weight_values > 0.0])
+        bones = sum(arrays.group_names[group] in skin_groups for group in used.tolist())
+
+    return {
+        "aabb": [low.tolist(), high.tolist()],
+        "sphere": center.tolist() + [radius],
+        "vertices": optimize.vertex_buffer(arrays).vertex_count,
+        "triangles": arrays.triangle_count,
+        "bones": bones,
+    }
+
+
+def file_hash(path):
+    """blake2b-128 hex digest of a file's content."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def relative_key(directory, path):
+    return os.path.relpath(path, directory).replace(os.sep, "/")
+
+
+def load(directory):
+    """Entries of the manifest in directory, by relative path."""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILENAME), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        return {}
+    return data.get("files", {})
+
+
+@contextmanager
+def locked(directory, timeout=LOCK_TIMEOUT):
+    """Hold the manifest lock of directory during the block, export_cache.py takes it too."""
+    lock_path = os.path.join(directory, MANIFEST_FILENAME + ".lock")
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > STALE_LOCK_SECONDS:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue  # Released in the meantime.
+            if time.monotonic() > deadline:
+                raise TimeoutError("%s is held by another export" % lock_path)
+            time.sleep(0.05)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+def update(directory, entries):
+    """Merge entries (relative path -> entry) into the manifest of directory, returns the entry count."""
+    with locked(directory):
+        files = load(directory)
+        files = {key: entry for key, entry in files.items()
+                 if os.path.isfile(os.path.join(directory, *key.split("/")))}
+        files.update(entries)
+        path = os.path.join(directory, MANIFEST_FILENAME)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": files}, f, separators=(",", ":"), sort_keys=True)
+        os.replace(tmp_path, path)
+    return len(files)
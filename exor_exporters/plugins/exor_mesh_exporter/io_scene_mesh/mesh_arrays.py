@@ -0,0 +1,332 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Bulk extraction of mesh data into NumPy arrays.
+#
+# Everything is read with foreach_get into preallocated buffers, so the cost is
+# a handful of memcpy-like calls per attribute instead of a Python loop per
+# vertex or loop. The only exception is vertex group weights: Blender exposes
+# no bulk accessor for them, so they are gathered in a single tight loop.
+#
+# fill_mesh() and add_weights() write MeshArrays back the same way, with
+# foreach_set and one vertex group call per group and weight.
+#
+# This module deliberately does not import bpy, it only relies on the
+# foreach_get protocol of the data it is given.
+
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class MeshArrays:
+    """Geometry of one mesh as flat NumPy arrays, in Blender's own element order.
+
+    positions             (V, 3) float32
+    loop_vertices         (L,) int32, vertex index of every loop (face corner)
+    loop_normals          (L, 3) float32, split normals
+    loop_tangents         (L, 3) float32 or None
+    loop_bitangent_signs  (L,) float32 or None
+    polygon_loop_starts   (P,) int32
+    polygon_loop_totals   (P,) int32
+    polygon_materials     (P,) int32
+    triangles             (T, 3) int32, loop indices of every loop triangle
+    triangle_polygons     (T,) int32
+    uvs                   {layer name: (L, 2) float32}
+    colors                {layer name: (L, 4) float32}
+    weight_offsets        (V + 1,) int32, CSR offsets into the two arrays below
+    weight_groups         (W,) int32, vertex group index
+    weight_values         (W,) float32
+    group_names           vertex group names, indexed by weight_groups
+    """
+
+    def __init__(self):
+        self.positions = None
+        self.loop_vertices = None
+        self.loop_normals = None
+        self.loop_tangents = None
+        self.loop_bitangent_signs = None
+        self.polygon_loop_starts = None
+        self.polygon_loop_totals = None
+        self.polygon_materials = None
+        self.triangles = None
+        self.triangle_polygons = None
+        self.uvs = {}
+        self.colors = {}
+        self.weight_offsets = None
+        self.weight_groups = None
+        self.weight_values = None
+        self.group_names = []
+
+    @property
+    def vertex_count(self):
+        return len(self.positions)
+
+    @property
+    def loop_count(self):
+        return len(self.loop_vertices)
+
+    @property
+    def triangle_count(self):
+        return len(self.triangles)
+
+    @property
+    def nbytes(self):
+        """Bytes held by all the arrays."""
+        arrays = [value for value in vars(self).values() if isinstance(value, np.ndarray)]
+        arrays.extend(self.uvs.values())
+        arrays.extend(self.colors.values())
+        return sum(array.nbytes for array in arrays)
+
+    @property
+    def triangle_vertices(self):
+        """(T, 3) vertex indices of every loop triangle."""
+        return self.loop_vertices[self.triangles]
+
+    def influences(self, max_influences=None):
+        """Dense (V, K) group indices and weights, strongest influence first.
+
+        Unused slots hold group -1 and weight 0. K is the largest influence
+        count found on any vertex, clamped to max_influences when given.
+        """
+        vertex_count = self.vertex_count
+        if self.weight_offsets is None:
+            return np.empty((vertex_count, 0), np.int32), np.empty((vertex_count, 0), np.float32)
+
+        counts = np.diff(self.weight_offsets)
+        width = int(counts.max()) if vertex_count else 0
+        if max_influences is not None:
+            width = min(width, max_influences)
+
+        indices = np.full((vertex_count, width), -1, np.int32)
+        weights = np.zeros((vertex_count, width), np.float32)
+        if width == 0 or len(self.weight_values) == 0:
+            return indices, weights
+
+        owners = np.repeat(np.arange(vertex_count), counts)
+        # Sort by owning vertex, then by descending weight, and rank within each vertex.
+        order = np.lexsort((-self.weight_values, owners))
+        owners = owners[order]
+        ranks = np.arange(len(order)) - self.weight_offsets[owners]
+        keep = ranks < width
+        indices[owners[keep], ranks[keep]] = self.weight_groups[order][keep]
+        weights[owners[keep], ranks[keep]] = self.weight_values[order][keep]
+        return indices, weights
+
+
+def _foreach_get(collection, attr, count, width=1, dtype=np.float32):
+    buf = np.empty(count * width, dtype=dtype)
+    if count:
+        collection.foreach_get(attr, buf)
+    return buf.reshape(count, width) if width > 1 else buf
+
+
+def _extract_weights(mesh, arrays):
+    vertex_count = arrays.vertex_count
+    offsets = np.zeros(vertex_count + 1, np.int32)
+    groups = []
+    values = []
+    for index, vertex in enumerate(mesh.vertices):
+        vertex_groups = vertex.groups
+        offsets[index + 1] = len(vertex_groups)
+        for elem in vertex_groups:
+            groups.append(elem.group)
+            values.append(elem.weight)
+
+    np.cumsum(offsets, out=offsets)
+    arrays.weight_offsets = offsets
+    arrays.weight_groups = np.array(groups, np.int32)
+    arrays.weight_values = np.array(values, np.float32)
+
+
+def extract(mesh, use_uvs=True, use_colors=True, use_tspace=False, use_weights=True, group_names=()):
+    """Read all exportable data of a mesh into a new MeshArrays.
+
+    Loop triangles and split normals are (re)computed on the mesh, tangents too
+    when use_tspace is set and the mesh has an active UV layer. group_names
+    should be the names of the owning object's vertex groups.
+    """
+    arrays = MeshArrays()
+
+    mesh.calc_loop_triangles()
+    if hasattr(mesh, "calc_normals_split"):
+        mesh.calc_normals_split()
+
+    vertex_count = len(mesh.vertices)
+    loop_count = len(mesh.loops)
+    polygon_count = len(mesh.polygons)
+    triangle_count = len(mesh.loop_triangles)
+
+    arrays.positions = _foreach_get(mesh.vertices, "co", vertex_count, 3)
+    arrays.loop_vertices = _foreach_get(mesh.loops, "vertex_index", loop_count, dtype=np.int32)
+    arrays.loop_normals = _foreach_get(mesh.loops, "normal", loop_count, 3)
+
+    arrays.polygon_loop_starts = _foreach_get(mesh.polygons, "loop_start", polygon_count, dtype=np.int32)
+    arrays.polygon_loop_totals = _foreach_get(mesh.polygons, "loop_total", polygon_count, dtype=np.int32)
+    arrays.polygon_materials = _foreach_get(mesh.polygons, "material_index", polygon_count, dtype=np.int32)
+
+    arrays.triangles = _foreach_get(mesh.loop_triangles, "loops", triangle_count, 3, dtype=np.int32)
+    arrays.triangle_polygons = _foreach_get(mesh.loop_triangles, "polygon_index", triangle_count, dtype=np.int32)
+
+    if use_uvs:
+        for layer in mesh.uv_layers:
+            arrays.uvs[layer.name] = _foreach_get(layer.data, "uv", loop_count, 2)
+
+    if use_colors and hasattr(mesh, "vertex_colors"):
+        for layer in mesh.vertex_colors:
+            arrays.colors[layer.name] = _foreach_get(layer.data, "color", loop_count, 4)
+
+    if use_tspace and mesh.uv_layers.active is not None:
+        mesh.calc_tangents(uvmap=mesh.uv_layers.active.name)
+        arrays.loop_tangents = _foreach_get(mesh.loops, "tangent", loop_count, 3)
+        arrays.loop_bitangent_signs = _foreach_get(mesh.loops, "bitangent_sign", loop_count)
+
+    if use_weights:
+        arrays.group_names = list(group_names)
+        _extract_weights(mesh, arrays)
+
+    return arrays
+
+
+def extract_weights(mesh, group_names=()):
+    """A MeshArrays with only the positions and vertex group weights of a mesh."""
+    arrays = MeshArrays()
+    arrays.positions = _foreach_get(mesh.vertices, "co", len(mesh.vertices), 3)
+    arrays.group_names = list(group_names)
+    _extract_weights(mesh, arrays)
+    return arrays
+
+
+def fill_mesh(mesh, arrays):
+    """Give an empty mesh the geometry, UVs, colors and split normals of arrays.
+
+    All polygons are smooth with custom split normals, so shading does not
+    depend on edge flags. Weights need the owning object, see add_weights().
+    """
+    mesh.vertices.add(arrays.vertex_count)
+    mesh.vertices.foreach_set("co", arrays.positions.ravel())
+    mesh.loops.add(arrays.loop_count)
+    mesh.loops.foreach_set("vertex_index", arrays.loop_vertices)
+    polygon_count = len(arrays.polygon_loop_starts)
+    mesh.polygons.add(polygon_count)
+    mesh.polygons.foreach_set("loop_start", arrays.polygon_loop_starts)
+    try:
+        mesh.polygons.foreach_set("loop_total", arrays.polygon_loop_totals)
+    except (AttributeError, TypeError, RuntimeError):
+        pass  # Read-only and derived from loop_start in newer Blender versions.
+    mesh.polygons.foreach_set("material_index", arrays.polygon_materials)
+    mesh.polygons.foreach_set("use_smooth", [True] * polygon_count)
+    mesh.update(calc_edges=True)
+
+    for layer_name, uv in arrays.uvs.items():
+        mesh.uv_layers.new(name=layer_name).data.foreach_set("uv", uv.ravel())
+    for layer_name, color in arrays.colors.items():
+        mesh.vertex_colors.new(name=layer_name).data.foreach_set("color", color.ravel())
+    mesh.use_auto_smooth = True
+    mesh.normals_split_custom_set(arrays.loop_normals.tolist())
+
+
+def add_weights(vertex_groups, arrays):
+    """Add the weights of arrays to vertex_groups, indexed like arrays.group_names.
+
+    Every add() is an RNA call, so there is one per group and distinct weight
+    (painted weights share a few values) rather than one per weight entry.
+    """
+    if arrays.weight_offsets is None or not len(arrays.weight_values):
+        return
+    owners = np.repeat(np.arange(arrays.vertex_count), np.diff(arrays.weight_offsets))
+    values = arrays.weight_values.astype(np.float32)
+    keys = (arrays.weight_groups.astype(np.int64) << 32) | values.view(np.uint32).astype(np.int64)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.append(starts[1:], len(keys))
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        entry = order[start]
+        vertex_groups[int(arrays.weight_groups[entry])].add(owners[order[start:end]].tolist(),
+                                                            float(values[entry]), 'REPLACE')
+
+
+def export_matrix(global_matrix=None, global_scale=1.0, matrix_world=None):
+    """Combine axis conversion, global scale and object transform into one 4x4 array."""
+    matrix = np.identity(4)
+    if matrix_world is not None:
+        matrix = np.array(matrix_world, np.float64)
+    matrix = np.diag((global_scale, global_scale, global_scale, 1.0)) @ matrix
+    if global_matrix is not None:
+        matrix = np.array(global_matrix, np.float64) @ matrix
+    return matrix
+
+
+def transform(arrays, matrix):
+    """Apply a 4x4 transform to positions, normals and tangents in place.
+
+    Each attribute costs a single matrix multiply. Normals go through the
+    inverse transpose, and triangle winding is flipped for mirroring matrices
+    so faces keep pointing outwards.
+    """
+    matrix = np.asarray(matrix, np.float64)
+    linear = matrix[:3, :3]
+    translation = matrix[:3, 3]
+
+    arrays.positions[:] = arrays.positions @ linear.T + translation
+
+    normal_matrix = np.linalg.inv(linear).T
+    arrays.loop_normals[:] = _normalized(arrays.loop_normals @ normal_matrix.T)
+    if arrays.loop_tangents is not None:
+        arrays.loop_tangents[:] = _normalized(arrays.loop_tangents @ linear.T)
+
+    if np.linalg.det(linear) < 0.0:
+        arrays.triangles[:] = arrays.triangles[:, ::-1]
+        if arrays.loop_bitangent_signs is not None:
+            np.negative(arrays.loop_bitangent_signs, out=arrays.loop_bitangent_signs)
+
+    return arrays
+
+
+def _normalized(vectors):
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(lengths > 0.0, lengths, 1.0)
+
+
+@contextmanager
+def evaluated_mesh(obj, depsgraph):
+    """Temporary evaluated mesh of an object, freed with to_mesh_clear on exit."""
+    obj_eval = obj.evaluated_get(depsgraph)
+    mesh = obj_eval.to_mesh()
+    try:
+        yield mesh
+    finally:
+        obj_eval.to_mesh_clear()
+
+
+def extract_object(obj, depsgraph, global_matrix=None, global_scale=1.0, use_world=True, **kwargs):
+    """Extract the evaluated mesh of an object, already in export space.
+
+    Without use_world the object transform is left out, only the axis
+    conversion and global scale are applied.
+    """
+    with evaluated_mesh(obj, depsgraph) as mesh:
+        if mesh is None:
+            return None
+        group_names = [group.name for group in obj.vertex_groups]
+        arrays = extract(mesh, group_names=group_names, **kwargs)
+
+    return transform(arrays, export_matrix(global_matrix, global_scale, obj.matrix_world if use_world else None))
@@ -0,0 +1,239 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""Compare two .mesh files, or two trees of them, to verify exports.
+
+    python mesh_diff.py A B [--float-range START:END ...] [--rtol R] [--atol A] [--jobs N]
+                        [--report REPORT.json]
+
+A and B are both files or both directories; directories are searched
+recursively and their .mesh files paired by relative path. Files are memory
+mapped and compared as NumPy views without being read into memory first, so a
+whole asset tree is checked in seconds.
+
+The .mesh layout belongs to fbx_tool_win_release.exe and is not decoded here,
+so files are compared byte for byte by default. Packed integers (indices,
+counts) can look like any float, so tolerances only apply to the byte ranges
+given with --float-range, which the caller knows to hold float32 values, such
+as a vertex buffer. There, differing little-endian 32-bit words that are
+finite and within the tolerances count as equal, the way positions, normals,
+UVs and weights move by rounding when the pipeline reorders its math. END may
+be left out for the end of the file, both offsets must be multiples of 4.
+
+Every pair is IDENTICAL, CLOSE (within tolerances), DIFFERENT or missing on
+one side. The exit status is 1 when any pair is DIFFERENT or missing.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+IDENTICAL = "IDENTICAL"
+CLOSE = "CLOSE"
+DIFFERENT = "DIFFERENT"
+ONLY_A = "ONLY_A"
+ONLY_B = "ONLY_B"
+
+# Words compared per step, so the temporaries stay small for large files.
+CHUNK_WORDS = 1 << 22
+
+
+class MeshFile:
+    """A .mesh file mapped read-only into memory.
+
+    data   (N,) uint8 view of the whole file
+    words  (N // 4,) little-endian float32 view of its 32-bit words
+    tail   (N % 4,) uint8 view of the bytes after the last whole word
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        # numpy cannot map empty files.
+        self.data = np.memmap(path, np.uint8, mode='r') if self.size else np.empty(0, np.uint8)
+        word_count = self.size // 4
+        self.words = self.data[:word_count * 4].view('<f4')
+        self.tail = self.data[word_count * 4:]
+
+
+def parse_range(text):
+    """(start, end) byte offsets of a START:END argument, end None for the end of the file."""
+    start, separator, end = text.partition(":")
+    if not separator:
+        raise ValueError("%r is not START:END" % text)
+    start, end = int(start, 0), int(end, 0) if end else None
+    if start < 0 or start % 4 or (end is not None and (end < start or end % 4)):
+        raise ValueError("%r is not a range of whole 32-bit words" % text)
+    return start, end
+
+
+def float_mask(word_offset, word_count, float_ranges):
+    """(word_count,) bool, True for the words from word_offset on that lie in one of float_ranges."""
+    indices = np.arange(word_offset, word_offset + word_count)
+    mask = np.zeros(word_count, bool)
+    for start, end in float_ranges:
+        mask |= (indices >= start // 4) & (indices < (end // 4 if end is not None else word_offset + word_count))
+    return mask
+
+
+def compare_files(path_a, path_b, rtol=0.0, atol=0.0, float_ranges=()):
+    """Comparison of two .mesh files as a dict, see the module docstring.
+
+    float_ranges are (start, end) byte offsets as parse_range() returns them,
+    tolerances apply to the words inside them only.
+    """
+    a = MeshFile(path_a)
+    b = MeshFile(path_b)
+    result = {"a": path_a, "b": path_b, "size_a": a.size, "size_b": b.size}
+    if a.size != b.size:
+        result["status"] = DIFFERENT
+        result["reason"] = "size %d != %d" % (a.size, b.size)
+        return result
+
+    different_words = 0
+    close_words = 0
+    max_difference = 0.0
+    first_difference = None
+    for start in range(0, len(a.words), CHUNK_WORDS):
+        words_a = a.words[start:start + CHUNK_WORDS]
+        words_b = b.words[start:start + CHUNK_WORDS]
+        # Bitwise comparison first, NaN payloads and signed zeros included.
+        unequal = np.flatnonzero(words_a.view(np.uint32) != words_b.view(np.uint32))
+        if not len(unequal):
+            continue
+        if first_difference is None:
+            first_difference = (start + int(unequal[0])) * 4
+        values_a = words_a[unequal].astype(np.float64)
+        values_b = words_b[unequal].astype(np.float64)
+        difference = np.abs(values_a - values_b)
+        with np.errstate(invalid='ignore'):
+            close = np.isfinite(difference) & (difference <= atol + rtol * np.abs(values_b))
+        close &= float_mask(start, len(words_a), float_ranges)[unequal]
+        close_words += int(close.sum())
+        different_words += int((~close).sum())
+        if close.any():
+            max_difference = max(max_difference, float(difference[close].max()))
+
+    tail_different = not np.array_equal(a.tail, b.tail)
+    if tail_different and first_difference is None:
+        first_difference = len(a.words) * 4
+
+    result.update(different_words=different_words, close_words=close_words, max_difference=max_difference,
+                  first_difference=first_difference)
+    if different_words or tail_different:
+        result["status"] = DIFFERENT
+        result["reason"] = "%d words differ, first at byte %d" % (different_words + tail_different,
+                                                                   first_difference)
+    elif close_words:
+        result["status"] = CLOSE
+        result["reason"] = "%d float words within tolerance, max difference %.3g" % (close_words, max_difference)
+    else:
+        result["status"] = IDENTICAL
+    return result
+
+
+def find_mesh_files(root):
+    """Relative path -> path of the .mesh files below root."""
+    found = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(".mesh"):
+                path = os.path.join(dirpath, name)
+                found[os.path.normcase(os.path.relpath(path, root))] = path
+    return found
+
+
+def compare_trees(root_a, root_b, rtol=0.0, atol=0.0, jobs=1, float_ranges=()):
+    """Comparisons of the .mesh files of two directories, paired by relative path, sorted by path."""
+    files_a = find_mesh_files(root_a)
+    files_b = find_mesh_files(root_b)
+    results = [{"a": files_a[key], "b": None, "status": ONLY_A} for key in files_a if key not in files_b]
+    results.extend({"a": None, "b": files_b[key], "status": ONLY_B} for key in files_b if key not in files_a)
+    pairs = [(files_a[key], files_b[key]) for key in files_a if key in files_b]
+    # Comparison is dominated by page faults on the mapped files, which threads overlap.
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        results.extend(pool.map(lambda pair: compare_files(pair[0], pair[1], rtol, atol, float_ranges),
+                                pairs))
+    return sorted(results, key=lambda result: result["a"] or result["b"])
+
+
+def summarize(results):
+    counts = {status: 0 for status in (IDENTICAL, CLOSE, DIFFERENT, ONLY_A, ONLY_B)}
+    for result in results:
+        counts[result["status"]] += 1
+    return counts
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="mesh_diff.py", description="Compare .mesh files or trees of them")
+    parser.add_argument("a", help=".mesh file or directory")
+    parser.add_argument("b", help=".mesh file or directory to compare with")
+    parser.add_argument("--float-range", dest="float_ranges", action="append", default=[], metavar="START:END",
+                        help="byte range holding float32 values, where the tolerances apply (repeatable)")
+    parser.add_argument("--rtol", type=float, default=0.0, help="relative tolerance of float32 words")
+    parser.add_argument("--atol", type=float, default=0.0, help="absolute tolerance of float32 words")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="files compared in parallel")
+    parser.add_argument("--report", help="also write every comparison to this JSON file")
+    parser.add_argument("--quiet", "-q", action="store_true", help="only print the summary")
+    args = parser.parse_args(argv)
+    if os.path.isdir(args.a) != os.path.isdir(args.b):
+        parser.error("a and b must both be files or both be directories")
+    try:
+        args.float_ranges = [parse_range(text) for text in args.float_ranges]
+    except ValueError as e:
+        parser.error("--float-range: %s" % e)
+    if (args.rtol or args.atol) and not args.float_ranges:
+        parser.error("--rtol and --atol need a --float-range, the .mesh layout is not known here")
+    return args
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+    start = time.perf_counter()
+    if os.path.isdir(args.a):
+        results = compare_trees(args.a, args.b, args.rtol, args.atol, args.jobs, args.float_ranges)
+    else:
+        results = [compare_files(args.a, args.b, args.rtol, args.atol, args.float_ranges)]
+    seconds = time.perf_counter() - start
+
+    if not args.quiet:
+        for result in results:
+            if result["status"] != IDENTICAL:
+                print("%-9s %s  %s" % (result["status"], result["a"] or result["b"], result.get("reason", "")))
+    counts = summarize(results)
+    print("%d files in %.2fs: %d identical, %d close, %d different, %d only in A, %d only in B"
+          % (len(results), seconds, counts[IDENTICAL], counts[CLOSE], counts[DIFFERENT], counts[ONLY_A],
+             counts[ONLY_B]))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"seconds": seconds, "counts": counts, "files": results}, f, indent=2)
+    return 1 if counts[DIFFERENT] or counts[ONLY_A] or counts[ONLY_B] else 0
+
+
+if __name__ == "__main__":
+    status = main()
+    if status:
+        sys.exit(status)
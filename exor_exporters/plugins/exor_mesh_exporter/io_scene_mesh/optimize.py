@@ -0,0 +1,362 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Vertex cache and vertex fetch optimization of indexed triangle lists.
+#
+# vertex_buffer() turns MeshArrays into what a GPU draws: every face corner
+# becomes a vertex, exact duplicates are welded, and triangles index into the
+# result. optimize() then reorders triangles for the post-transform vertex
+# cache and vertices for fetch locality, keeping triangles grouped by material.
+#
+# fbx_tool builds the .mesh buffers from the FBX in polygon order, so the
+# exporter applies the order by handing the FBX exporter a mesh rebuilt from
+# reorder(): one triangle per polygon in optimized order, vertices by first
+# use. The converter's welding then yields the optimized buffer.
+#
+# Two triangle orders are available. SPATIAL sorts triangles along a Morton
+# curve through their centroids; it is fully vectorized and handles 500k
+# triangles in a fraction of a second, so it is the one the exporter uses.
+# TIPSIFY is Sander et al.'s "Fast Triangle Reordering for Vertex Locality and
+# Reduced Overdraw" (2007); it reaches a lower ACMR but walks the mesh in
+# Python, about ten times slower, and is only kept for comparison in
+# benchmarks/bench_optimize.py.
+#
+# ACMR (average cache miss ratio) is the number of vertex shader invocations
+# per triangle with a FIFO cache: 3.0 is the worst case, 0.5 the ideal for
+# large regular meshes.
+#
+# This module does not import bpy.
+
+import numpy as np
+
+from .mesh_arrays import MeshArrays
+
+DEFAULT_CACHE_SIZE = 32
+METHODS = ('SPATIAL', 'TIPSIFY')
+
+
+class VertexBuffer:
+    """Indexed triangle list, one row per unique vertex.
+
+    attributes  {name: (N, k) array}, "position" and "normal" always present
+    indices     (T, 3) uint32
+    materials   (T,) int32, material index of every triangle
+    """
+
+    def __init__(self, attributes, indices, materials):
+        self.attributes = attributes
+        self.indices = indices
+        self.materials = materials
+
+    @property
+    def vertex_count(self):
+        return len(self.attributes["position"])
+
+    @property
+    def triangle_count(self):
+        return len(self.indices)
+
+
+def _corner_attributes(arrays, max_influences=None):
+    """Per face corner attribute rows, in loop order."""
+    loop_vertices = arrays.loop_vertices
+    attributes = {
+        "position": arrays.positions[loop_vertices],
+        "normal": arrays.loop_normals,
+    }
+    if arrays.loop_tangents is not None:
+        signs = arrays.loop_bitangent_signs.reshape(-1, 1)
+        attributes["tangent"] = np.concatenate((arrays.loop_tangents, signs), axis=1)
+    for name, uv in arrays.uvs.items():
+        attributes["uv:" + name] = uv
+    for name, color in arrays.colors.items():
+        attributes["color:" + name] = color
+    groups, weights = arrays.influences(max_influences)
+    if groups.shape[1]:
+        attributes["bone_indices"] = groups[loop_vertices]
+        attributes["bone_weights"] = weights[loop_vertices]
+    return attributes
+
+
+def weld(attributes):
+    """Merge rows that are identical in every attribute.
+
+    Returns the welded attributes, in order of occurrence, and the (N,) map
+    from old row to welded row.
+    """
+    count = len(attributes["position"])
+    columns = []
+    for array in attributes.values():
+        array = np.ascontiguousarray(array.reshape(count, -1))
+        if array.dtype.kind == 'f':
+            array = array + array.dtype.type(0.0)  # -0.0 and 0.0 compare equal, their bytes do not.
+        columns.append(array.view(np.uint8).reshape(count, -1))
+    rows = np.ascontiguousarray(np.concatenate(columns, axis=1))
+
+    # Sorting 64-bit row hashes is much faster than sorting the rows
+    # themselves; the rows are compared afterwards to rule out collisions.
+    first, inverse = _unique_rows(_row_hashes(rows))
+    if not np.array_equal(rows, rows[first[inverse]]):
+        keys = rows.view(np.dtype((np.void, rows.shape[1]))).ravel()
+        first, inverse = _unique_rows(keys)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    kept = first[order]
+    return {name: array[kept] for name, array in attributes.items()}, rank[inverse]
+
+
+def _row_hashes(rows):
+    if rows.shape[1] % 8:
+        rows = np.concatenate((rows, np.zeros((len(rows), 8 - rows.shape[1] % 8), np.uint8)), axis=1)
+    words = rows.view(np.uint64)
+    hashes = np.zeros(len(rows), np.uint64)
+    with np.errstate(over='ignore'):
+        for column in range(words.shape[1]):
+            hashes ^= words[:, column]
+            hashes *= np.uint64(0x9E3779B97F4A7C15)
+            hashes ^= hashes >> np.uint64(29)
+    return hashes
+
+
+def _unique_rows(keys):
+    """(U,) index of one occurrence of every distinct key, and the (N,) map to them."""
+    order = np.argsort(keys)
+    ordered = keys[order]
+    starts = np.empty(len(keys), bool)
+    starts[:1] = True
+    np.not_equal(ordered[1:], ordered[:-1], out=starts[1:])
+    inverse = np.empty(len(keys), np.int64)
+    inverse[order] = np.cumsum(starts) - 1
+    return order[starts], inverse
+
+
+def vertex_buffer(arrays, max_influences=None):
+    """Welded vertex buffer of MeshArrays, triangles in Blender's order."""
+    attributes, remap = weld(_corner_attributes(arrays, max_influences))
+    indices = remap[arrays.triangles].astype(np.uint32)
+    materials = arrays.polygon_materials[arrays.triangle_polygons].astype(np.int32)
+    return VertexBuffer(attributes, indices, materials)
+
+
+def _spread_bits(values):
+    """Insert two zero bits after each of the low 10 bits (3D Morton code helper)."""
+    x = values & np.uint32(0x3FF)
+    for shift, mask in ((16, 0x030000FF), (8, 0x0300F00F), (4, 0x030C30C3), (2, 0x09249249)):
+        x = (x | (x << np.uint32(shift))) & np.uint32(mask)
+    return x
+
+
+def spatial_order(positions, indices):
+    """Triangle order along a Morton curve through the triangle centroids."""
+    if len(indices) == 0:
+        return np.empty(0, np.int64)
+    centroids = positions[indices].mean(axis=1)
+    low = centroids.min(axis=0)
+    span = max(float((centroids.max(axis=0) - low).max()), 1e-12)
+    cells = ((centroids - low) * (1023.0 / span)).astype(np.uint32)
+    codes = _spread_bits(cells[:, 0]) | (_spread_bits(cells[:, 1]) << np.uint32(1)) \
+        | (_spread_bits(cells[:, 2]) << np.uint32(2))
+    return np.argsort(codes, kind='stable')
+
+
+def tipsify_order(indices, vertex_count, cache_size=DEFAULT_CACHE_SIZE):
+    """Triangle order of the Tipsify algorithm for a FIFO cache of cache_size entries."""
+    triangle_count = len(indices)
+    corners = indices.ravel().astype(np.int64)
+    # Vertex -> triangle adjacency in CSR form.
+    counts = np.bincount(corners, minlength=vertex_count)
+    offsets = np.zeros(vertex_count + 1, np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    adjacency = (np.argsort(corners, kind='stable') // 3).tolist()
+    offsets = offsets.tolist()
+    live = counts.tolist()
+    triangles = indices.tolist()
+
+    timestamps = [0] * vertex_count
+    emitted = bytearray(triangle_count)
+    order = []
+    dead_end = []
+    time = cache_size + 1
+    cursor = 0
+    fanning = 0 if vertex_count else -1
+    while fanning >= 0:
+        candidates = []
+        for triangle in adjacency[offsets[fanning]:offsets[fanning + 1]]:
+            if emitted[triangle]:
+                continue
+            emitted[triangle] = 1
+            order.append(triangle)
+            for vertex in triangles[triangle]:
+                live[vertex] -= 1
+                dead_end.append(vertex)
+                candidates.append(vertex)
+                if time - timestamps[vertex] > cache_size:
+                    timestamps[vertex] = time
+                    time += 1
+
+        # Next fanning vertex: the one that stays in cache longest after
+        # emitting its remaining triangles, else the most recent dead end, else
+        # the next vertex with triangles left.
+        fanning = -1
+        best = -1
+        for vertex in candidates:
+            if live[vertex] > 0:
+                priority = 0
+                if time - timestamps[vertex] + 2 * live[vertex] <= cache_size:
+                    priority = time - timestamps[vertex]
+                if priority > best:
+                    best = priority
+                    fanning = vertex
+        if fanning < 0:
+            while dead_end:
+                vertex = dead_end.pop()
+                if live[vertex] > 0:
+                    fanning = vertex
+                    break
+        if fanning < 0:
+            while cursor < vertex_count and live[cursor] == 0:
+                cursor += 1
+            fanning = cursor if cursor < vertex_count else -1
+
+    return np.array(order, np.int64)
+
+
+def fetch_order(indices, vertex_count):
+    """Vertex order by first use, returning (new -> old, old -> new) maps.
+
+    Vertices that no triangle uses are moved to the end.
+    """
+    corners = indices.ravel()
+    first = np.full(vertex_count, len(corners), np.int64)
+    # Assigning in reverse leaves the earliest corner of every vertex.
+    first[corners[::-1]] = np.arange(len(corners) - 1, -1, -1)
+    order = np.argsort(first, kind='stable')
+    remap = np.empty(vertex_count, np.int64)
+    remap[order] = np.arange(vertex_count)
+    return order, remap
+
+
+def triangle_order(buffer, method='SPATIAL', cache_size=DEFAULT_CACHE_SIZE):
+    """Triangle order of buffer for the vertex cache, with the material ranges kept contiguous."""
+    if method == 'TIPSIFY':
+        order = tipsify_order(buffer.indices, buffer.vertex_count, cache_size)
+    elif method == 'SPATIAL':
+        order = spatial_order(buffer.attributes["position"], buffer.indices)
+    else:
+        raise ValueError("unknown triangle order %r" % method)
+    # Keep the material ranges (draw calls) contiguous.
+    if len(order) and buffer.materials.min() != buffer.materials.max():
+        order = order[np.argsort(buffer.materials[order], kind='stable')]
+    return order
+
+
+def optimize(buffer, method='SPATIAL', cache_size=DEFAULT_CACHE_SIZE):
+    """Copy of buffer with triangles reordered for the vertex cache and vertices for fetch locality."""
+    order = triangle_order(buffer, method, cache_size)
+    indices = buffer.indices[order]
+
+    vertex_order, remap = fetch_order(indices, buffer.vertex_count)
+    attributes = {name: array[vertex_order] for name, array in buffer.attributes.items()}
+    return VertexBuffer(attributes, remap[indices].astype(np.uint32), buffer.materials[order])
+
+
+def reorder(arrays, method='SPATIAL', cache_size=DEFAULT_CACHE_SIZE):
+    """Copy of MeshArrays with a triangle polygon per loop triangle, in the order of optimize().
+
+    Vertices are ordered by first use, with their weights. Tangents are left
+    out, the FBX exporter computes them on the mesh it writes. Triangles are
+    ordered over the mesh's own vertices, which needs no welding.
+    """
+    materials = arrays.polygon_materials[arrays.triangle_polygons].astype(np.int32)
+    buffer = VertexBuffer({"position": arrays.positions}, arrays.triangle_vertices, materials)
+    order = triangle_order(buffer, method, cache_size)
+    loops = arrays.triangles[order].ravel()
+    vertex_order, remap = fetch_order(arrays.loop_vertices[loops].reshape(-1, 3), arrays.vertex_count)
+    triangle_count = len(order)
+
+    result = MeshArrays()
+    result.positions = arrays.positions[vertex_order]
+    result.loop_vertices = remap[arrays.loop_vertices[loops]].astype(np.int32)
+    result.loop_normals = arrays.loop_normals[loops]
+    result.polygon_loop_starts = np.arange(0, 3 * triangle_count, 3, dtype=np.int32)
+    result.polygon_loop_totals = np.full(triangle_count, 3, np.int32)
+    result.polygon_materials = arrays.polygon_materials[arrays.triangle_polygons[order]]
+    result.triangles = np.arange(3 * triangle_count, dtype=np.int32).reshape(triangle_count, 3)
+    result.triangle_polygons = np.arange(triangle_count, dtype=np.int32)
+    result.uvs = {name: uv[loops] for name, uv in arrays.uvs.items()}
+    result.colors = {name: color[loops] for name, color in arrays.colors.items()}
+    result.group_names = list(arrays.group_names)
+    if arrays.weight_offsets is not None:
+        counts = np.diff(arrays.weight_offsets)[vertex_order]
+        offsets = np.zeros(len(counts) + 1, np.int32)
+        np.cumsum(counts, out=offsets[1:])
+        entries = np.repeat(arrays.weight_offsets[vertex_order] - offsets[:-1], counts) + np.arange(offsets[-1])
+        result.weight_offsets = offsets
+        result.weight_groups = arrays.weight_groups[entries]
+        result.weight_values = arrays.weight_values[entries]
+    return result
+
+
+def _cache_misses(indices, cache_size):
+    # A vertex is cached when fewer than cache_size misses happened since its own.
+    inserted = [-cache_size] * (int(indices.max()) + 1)
+    misses = 0
+    for vertex in indices.ravel().tolist():
+        if inserted[vertex] <= misses - cache_size:
+            inserted[vertex] = misses
+            misses += 1
+    return misses
+
+
+def acmr(indices, cache_size=DEFAULT_CACHE_SIZE, max_triangles=None):
+    """Average cache miss ratio of indices for a FIFO cache of cache_size vertices.
+
+    With max_triangles the ratio is estimated from eight evenly spaced windows
+    of the index buffer instead, each starting with an empty cache.
+    """
+    triangle_count = len(indices)
+    if triangle_count == 0:
+        return 0.0
+    if max_triangles is None or triangle_count <= max_triangles:
+        return _cache_misses(indices, cache_size) / triangle_count
+
+    windows = 8
+    size = max(1, max_triangles // windows)
+    starts = np.linspace(0, triangle_count - size, windows).astype(np.int64)
+    misses = sum(_cache_misses(indices[start:start + size], cache_size) for start in starts)
+    return misses / (size * windows)
+
+
+def analyze(arrays, method='SPATIAL', cache_size=DEFAULT_CACHE_SIZE, max_triangles=200000, buffer=None):
+    """Vertex and ACMR figures of arrays as Blender orders them, and after optimize().
+
+    buffer is the vertex_buffer() of arrays, when the caller has it already.
+    """
+    if buffer is None:
+        buffer = vertex_buffer(arrays)
+    optimized = optimize(buffer, method, cache_size)
+    return {
+        "triangles": buffer.triangle_count,
+        "corners": arrays.loop_count,
+        "vertices": buffer.vertex_count,
+        "acmr_before": acmr(buffer.indices, cache_size, max_triangles),
+        "acmr_after": acmr(optimized.indices, cache_size, max_triangles),
+    }
@@ -0,0 +1,173 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Preflight checks of the meshes about to be exported.
+#
+# Broken geometry otherwise only shows up deep inside the FBX write or in
+# fbx_tool, after every object before it has been written. check() looks at
+# the MeshArrays of one object with a few whole-array NumPy operations, a
+# couple of milliseconds for a typical game mesh, and returns every problem it
+# finds instead of stopping at the first one. The exporter checks all objects
+# before it writes anything and reports the problems of the whole export
+# together.
+#
+# ERROR problems make the output unusable and abort the export. WARNING
+# problems are reported, and abort it only in strict mode.
+#
+# This module does not import bpy.
+
+import numpy as np
+
+from . import optimize
+
+# Bone influences per vertex the .mesh format keeps.
+MAX_INFLUENCES = 4
+
+# Vertices addressable with 16-bit indices.
+MAX_VERTICES = 65536
+
+# Largest difference of a vertex's summed bone weights from 1.
+WEIGHT_SUM_TOLERANCE = 1e-3
+
+# Triangles with a smaller area, in squared export units, count as degenerate.
+MIN_AREA = 1e-12
+
+
+class Problem:
+    """One failed check of one object."""
+
+    def __init__(self, severity, name, message):
+        self.severity = severity  # 'ERROR' or 'WARNING', as operator reports
+        self.name = name
+        self.message = message
+
+    def __str__(self):
+        return "%s: %s" % (self.name, self.message)
+
+
+def _polygon_edges(arrays):
+    """(L, 2) sorted vertex pairs of the edge that starts at every loop."""
+    loop_count = arrays.loop_count
+    following = np.arange(1, loop_count + 1)
+    last = arrays.polygon_loop_starts + arrays.polygon_loop_totals - 1
+    following[last] = arrays.polygon_loop_starts
+    edges = np.stack((arrays.loop_vertices, arrays.loop_vertices[following]), axis=1)
+    edges.sort(axis=1)
+    return edges
+
+
+def non_manifold_edges(arrays):
+    """Number of edges shared by more than two polygons."""
+    if not arrays.loop_count:
+        return 0
+    edges = _polygon_edges(arrays).astype(np.int64)
+    keys = edges[:, 0] * arrays.vertex_count + edges[:, 1]
+    _keys, counts = np.unique(keys, return_counts=True)
+    return int((counts > 2).sum())
+
+
+def degenerate_triangles(arrays, min_area=MIN_AREA):
+    """Number of triangles that repeat a vertex or have (nearly) no area."""
+    vertices = arrays.triangle_vertices
+    if not len(vertices):
+        return 0
+    repeated = ((vertices[:, 0] == vertices[:, 1]) | (vertices[:, 1] == vertices[:, 2])
+                | (vertices[:, 2] == vertices[:, 0]))
+    positions = arrays.positions.astype(np.float64)
+    origins = positions[vertices[:, 0]]
+    u = positions[vertices[:, 1]] - origins
+    v = positions[vertices[:, 2]] - origins
+    # Squared length of the cross product, four times the squared area.
+    cross = (u[:, 1] * v[:, 2] - u[:, 2] * v[:, 1]) ** 2
+    cross += (u[:, 2] * v[:, 0] - u[:, 0] * v[:, 2]) ** 2
+    cross += (u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]) ** 2
+    return int((repeated | (cross <= 4.0 * min_area * min_area)).sum())
+
+
+def skin_weights(arrays, skin_groups):
+    """Influence count and weight sum of every vertex, over the vertex groups in skin_groups."""
+    if arrays.weight_offsets is None or not len(arrays.weight_values):
+        return np.zeros(arrays.vertex_count, np.int64), np.zeros(arrays.vertex_count)
+    bones = [index for index, name in enumerate(arrays.group_names) if name in skin_groups]
+    owners = np.repeat(np.arange(arrays.vertex_count), np.diff(arrays.weight_offsets))
+    influence = np.isin(arrays.weight_groups, bones) & (arrays.weight_values > 0.0)
+    counts = np.bincount(owners[influence], minlength=arrays.vertex_count)
+    sums = np.bincount(owners[influence], arrays.weight_values[influence], minlength=arrays.vertex_count)
+    return counts, sums
+
+
+def check(name, arrays, use_uvs=True, use_tspace=False, skin_groups=(), max_vertices=MAX_VERTICES):
+    """Problems of the MeshArrays of the object called name, as a list of Problem.
+
+    use_uvs checks for a UV layer, use_tspace for what tangent space needs.
+    skin_groups are the vertex group names the object is skinned with (the
+    bones of its armatures); weights are only checked when there are any.
+    max_vertices 0 leaves the vertex count unchecked.
+    """
+    problems = []
+
+    def add(severity, message, *args):
+        problems.append(Problem(severity, name, message % args))
+
+    non_finite = int((~np.isfinite(arrays.positions)).any(axis=1).sum())
+    if non_finite:
+        add('ERROR', "%d of %d vertex positions are NaN or infinite", non_finite, arrays.vertex_count)
+
+    # Only tangent space cannot be computed without UVs, a mesh may otherwise
+    # have none (helpers, untextured props).
+    if use_uvs and not arrays.uvs and arrays.triangle_count:
+        if use_tspace:
+            add('ERROR', "no UV layer, tangent space needs one")
+        else:
+            add('WARNING', "no UV layer")
+
+    if use_tspace:
+        ngons = int((arrays.polygon_loop_totals > 4).sum())
+        if ngons:
+            add('ERROR', "%d polygons with more than 4 sides, tangent space needs triangles and quads", ngons)
+        non_manifold = non_manifold_edges(arrays)
+        if non_manifold:
+            add('WARNING', "%d non-manifold edges, tangents along them are unreliable", non_manifold)
+
+    degenerate = degenerate_triangles(arrays)
+    if degenerate:
+        add('WARNING', "%d of %d triangles are degenerate or have zero area", degenerate, arrays.triangle_count)
+
+    if skin_groups:
+        counts, sums = skin_weights(arrays, set(skin_groups))
+        over = int((counts > MAX_INFLUENCES).sum())
+        if over:
+            add('WARNING', "%d vertices have more than %d bone influences (up to %d)",
+                over, MAX_INFLUENCES, int(counts.max()))
+        unnormalized = int(((counts > 0) & (np.abs(sums - 1.0) > WEIGHT_SUM_TOLERANCE)).sum())
+        if unnormalized:
+            add('WARNING', "%d vertices have bone weights that do not sum to 1", unnormalized)
+
+    # The exported vertex count lies between the mesh's vertex and face corner
+    # counts, welding is only needed when the limit is in between.
+    if max_vertices and arrays.loop_count > max_vertices:
+        vertex_count = arrays.vertex_count
+        if vertex_count <= max_vertices:
+            vertex_count = optimize.vertex_buffer(arrays).vertex_count
+        if vertex_count > max_vertices:
+            add('WARNING', "at least %d vertices, more than the %d addressable with 16-bit indices",
+                vertex_count, max_vertices)
+
+    return problems
@@ -0,0 +1,227 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Per-stage instrumentation of the export pipeline.
+#
+# A Trace records one event per stage (and per object or file where it makes
+# sense) with its wall time, the process RSS when it started and ended and the
+# bytes it wrote. The process peak RSS, which only ever grows, is recorded once
+# for the whole trace. Pipeline code always goes through trace.stage(), exports
+# without tracing get NULL_TRACE whose stages record nothing.
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_ENV = "EXOR_MESH_TRACE"
+TRACE_CHROME_ENV = "EXOR_MESH_TRACE_CHROME"
+
+
+def _memory_counters_windows():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD),
+                    ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, 0 when it cannot be queried."""
+    try:
+        if sys.platform == "win32":
+            counters = _memory_counters_windows()
+            return counters.PeakWorkingSetSize if counters else 0
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError, AttributeError):
+        return 0
+
+
+def _resident_size_mac():
+    import ctypes
+    import ctypes.util
+
+    class MachTaskBasicInfo(ctypes.Structure):
+        _fields_ = [("virtual_size", ctypes.c_uint64),
+                    ("resident_size", ctypes.c_uint64),
+                    ("resident_size_max", ctypes.c_uint64),
+                    ("user_time", ctypes.c_int32 * 2),
+                    ("system_time", ctypes.c_int32 * 2),
+                    ("policy", ctypes.c_int32),
+                    ("suspend_count", ctypes.c_int32)]
+
+    MACH_TASK_BASIC_INFO = 20
+    libc = ctypes.CDLL(ctypes.util.find_library("c"))
+    info = MachTaskBasicInfo()
+    count = ctypes.c_uint32(ctypes.sizeof(info) // 4)
+    task = ctypes.c_uint32.in_dll(libc, "mach_task_self_")
+    if libc.task_info(task, MACH_TASK_BASIC_INFO, ctypes.byref(info), ctypes.byref(count)) != 0:
+        return 0
+    return info.resident_size
+
+
+def current_rss():
+    """Resident set size of this process in bytes, 0 when it cannot be queried."""
+    try:
+        if sys.platform == "win32":
+            counters = _memory_counters_windows()
+            return counters.WorkingSetSize if counters else 0
+        if sys.platform == "darwin":
+            return _resident_size_mac()
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (ImportError, OSError, AttributeError, ValueError, IndexError):
+        return 0
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class Trace:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def _thread_index(self):
+        ident = threading.get_ident()
+        with self._lock:
+            return self._threads.setdefault(ident, len(self._threads))
+
+    @contextmanager
+    def stage(self, name, obj=None):
+        """Time the enclosed block. The yielded event dict takes extra fields, like "bytes"."""
+        event = {"stage": name, "rss_before": current_rss()}
+        if obj is not None:
+            event["object"] = obj
+        start = time.perf_counter()
+        try:
+            yield event
+        finally:
+            self._close(event, start)
+
+    def record(self, name, start, obj=None, **fields):
+        """Add an event for a stage that ran from start (a perf_counter() value) until now.
+
+        For stages that do not fit in one block, like a modal export spanning many timer events.
+        Only the RSS at the end is known, unless fields pass rss_before.
+        """
+        event = {"stage": name}
+        if obj is not None:
+            event["object"] = obj
+        event.update(fields)
+        self._close(event, start)
+
+    def _close(self, event, start):
+        event["start"] = start - self.origin
+        event["seconds"] = time.perf_counter() - start
+        event["rss_after"] = current_rss()
+        event["thread"] = self._thread_index()
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self):
+        """Totals per stage name: event count, seconds and bytes."""
+        stages = {}
+        for event in self.events:
+            total = stages.setdefault(event["stage"], {"count": 0, "seconds": 0.0, "bytes": 0})
+            total["count"] += 1
+            total["seconds"] += event["seconds"]
+            total["bytes"] += event.get("bytes", 0)
+        return stages
+
+    def to_dict(self):
+        return {
+            "seconds": time.perf_counter() - self.origin,
+            "peak_rss": peak_rss(),
+            "stages": self.summary(),
+            "events": sorted(self.events, key=lambda event: event["start"]),
+        }
+
+    def chrome_events(self):
+        """Events in the Chrome trace event format (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        events = []
+        for event in self.events:
+            args = {key: value for key, value in event.items() if key not in {"stage", "start", "seconds", "thread"}}
+            events.append({
+                "name": event["stage"] if "object" not in event else "%s %s" % (event["stage"], event["object"]),
+                "cat": event["stage"],
+                "ph": "X",
+                "ts": event["start"] * 1e6,
+                "dur": event["seconds"] * 1e6,
+                "pid": pid,
+                "tid": event["thread"],
+                "args": args,
+            })
+        return events
+
+    def write(self, path, chrome=False):
+        """Write the JSON trace to path, and the Chrome trace next to it when asked."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=1)
+        if chrome:
+            with open(os.path.splitext(path)[0] + ".chrome.json", "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": self.chrome_events(), "displayTimeUnit": "ms"}, f)
+
+
+class NullTrace:
+    @contextmanager
+    def stage(self, name, obj=None):
+        yield {}
+
+    def record(self, name, start, obj=None, **fields):
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+
+def trace_settings(trace_path="", trace_chrome=False):
+    """Trace output path and Chrome flag, the environment overriding empty operator settings."""
+    trace_path = trace_path or os.environ.get(TRACE_ENV, "")
+    trace_chrome = trace_chrome or os.environ.get(TRACE_CHROME_ENV, "") not in {"", "0"}
+    return trace_path, trace_chrome
@@ -0,0 +1,285 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Compact quantized vertex layout of a VertexBuffer (see optimize.py).
+#
+#   normal        octahedral, 2 x snorm16
+#   tangent       octahedral, 2 x snorm16 of 15 bits, bitangent sign in the
+#                 lowest bit of y
+#   uv            2 x unorm16 when the layer lies in [0, 1], else 2 x half
+#   color         4 x unorm8
+#   bone_indices  uint8 when every group index fits, else uint16
+#   bone_weights  unorm8, normalized to sum to exactly 255
+#   indices       uint16 when there are at most 65536 vertices, else uint32
+#
+# Positions stay 32-bit floats. Every attribute is decoded again and its
+# largest error compared with a tolerance; an attribute that exceeds it keeps
+# its full precision format instead. Sizes are compared with the same data as
+# 32-bit floats (uint16 group indices, uint32 indices).
+#
+# Octahedral encoding follows Cigolle et al., "A Survey of Efficient
+# Representations for Independent Unit Vectors" (JCGT 2014), including the
+# search over the four nearest quantized points for the most precise one.
+#
+# This module does not import bpy.
+
+import math
+
+import numpy as np
+
+# Largest decoded error accepted for each attribute: angles in radians for
+# directions, absolute values otherwise.
+TOLERANCES = {
+    "normal": math.radians(0.05),
+    "tangent": math.radians(0.05),
+    "uv": 1.0 / 2048,
+    "color": 0.5 / 255,
+    "bone_weights": 1.0 / 255,
+}
+
+# Bytes per vertex of every format.
+FORMAT_SIZES = {
+    'FLOAT32x2': 8, 'FLOAT32x3': 12, 'FLOAT32x4': 16,
+    'OCT_SNORM16': 4, 'UNORM16x2': 4, 'FLOAT16x2': 4, 'UNORM8x4': 4,
+}
+
+
+class CompactAttribute:
+    __slots__ = ("name", "format", "data", "max_error", "baseline_format", "rejected_error")
+
+    def __init__(self, name, format, data, max_error, baseline_format, rejected_error=None):
+        self.name = name
+        self.format = format
+        self.data = data
+        self.max_error = max_error
+        self.baseline_format = baseline_format
+        # Error of the quantized format when it exceeded the tolerance and was not used.
+        self.rejected_error = rejected_error
+
+    @property
+    def quantized(self):
+        return self.format != self.baseline_format
+
+
+class CompactBuffer:
+    """Quantized attributes and indices of a VertexBuffer, with their sizes."""
+
+    def __init__(self, attributes, indices, vertex_count, baseline_index_bytes):
+        self.attributes = attributes  # [CompactAttribute]
+        self.indices = indices
+        self.vertex_count = vertex_count
+        self.baseline_index_bytes = baseline_index_bytes
+
+    @property
+    def stride(self):
+        return sum(attribute.data.dtype.itemsize * (attribute.data.shape[1] if attribute.data.ndim > 1 else 1)
+                   for attribute in self.attributes)
+
+    @property
+    def baseline_stride(self):
+        return sum(_format_size(attribute.baseline_format) for attribute in self.attributes)
+
+    @property
+    def size(self):
+        return self.vertex_count * self.stride + self.indices.nbytes
+
+    @property
+    def baseline_size(self):
+        return self.vertex_count * self.baseline_stride + self.indices.size * self.baseline_index_bytes
+
+    @property
+    def fallbacks(self):
+        """Attributes kept at full precision because quantizing them exceeded the tolerance."""
+        return [attribute for attribute in self.attributes if attribute.rejected_error is not None]
+
+
+def _format_size(format):
+    if format in FORMAT_SIZES:
+        return FORMAT_SIZES[format]
+    kind, count = format.split("x")
+    return {"UINT8": 1, "UINT16": 2, "UNORM8": 1, "FLOAT32": 4}[kind] * int(count)
+
+
+def _sign(values):
+    return np.where(values < 0.0, -1.0, 1.0)
+
+
+def oct_encode(vectors):
+    """(N, 2) octahedral coordinates in [-1, 1] of (N, 3) directions."""
+    vectors = np.asarray(vectors, np.float64)
+    lengths = np.abs(vectors).sum(axis=1, keepdims=True)
+    projected = vectors / np.where(lengths > 0.0, lengths, 1.0)
+    encoded = projected[:, :2].copy()
+    lower = projected[:, 2] < 0.0
+    encoded[lower] = (1.0 - np.abs(projected[lower][:, [1, 0]])) * _sign(projected[lower][:, :2])
+    return encoded
+
+
+def oct_decode(encoded):
+    """(N, 3) unit directions of (N, 2) octahedral coordinates."""
+    encoded = np.asarray(encoded, np.float64)
+    x = encoded[:, 0].copy()
+    y = encoded[:, 1].copy()
+    z = 1.0 - np.abs(x) - np.abs(y)
+    lower = z < 0.0
+    x[lower], y[lower] = (1.0 - np.abs(encoded[lower, 1])) * _sign(encoded[lower, 0]), \
+        (1.0 - np.abs(encoded[lower, 0])) * _sign(encoded[lower, 1])
+    vectors = np.stack((x, y, z), axis=1)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _angles(a, b):
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-30)
+    return np.arccos(np.clip((a * b).sum(axis=1), -1.0, 1.0))
+
+
+def oct_quantize(vectors, scale=32767):
+    """Octahedral integer coordinates in [-scale, scale] of directions, the most precise of the four nearest."""
+    encoded = oct_encode(vectors) * scale
+    low = np.floor(encoded)
+    best = None
+    best_error = None
+    for offset in ((0, 0), (1, 0), (0, 1), (1, 1)):
+        candidate = np.clip(low + offset, -scale, scale)
+        error = _angles(vectors, oct_decode(candidate / scale))
+        if best is None:
+            best, best_error = candidate, error
+        else:
+            better = error < best_error
+            best[better] = candidate[better]
+            best_error[better] = error[better]
+    return best.astype(np.int32), best_error
+
+
+def quantize_weights(weights):
+    """(V, K) uint8 weights of every vertex normalized to sum to exactly 255, or all 0."""
+    weights = np.asarray(weights, np.float64)
+    totals = weights.sum(axis=1, keepdims=True)
+    scaled = weights * (255.0 / np.where(totals > 0.0, totals, 1.0))
+    quantized = np.floor(scaled)
+    # Largest remainder rounding: the missing units go to the largest fractions.
+    missing = np.where(totals[:, 0] > 0.0, 255 - quantized.sum(axis=1), 0).astype(np.int64)
+    order = np.argsort(-(scaled - quantized), axis=1, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(weights.shape[1]), axis=1)
+    quantized += ranks < missing.reshape(-1, 1)
+    return quantized.astype(np.uint8)
+
+
+def _direction(name, vectors, tolerance):
+    quantized, errors = oct_quantize(vectors)
+    max_error = float(errors.max()) if len(errors) else 0.0
+    if max_error > tolerance:
+        return CompactAttribute(name, 'FLOAT32x3', vectors.astype(np.float32), 0.0, 'FLOAT32x3', max_error)
+    return CompactAttribute(name, 'OCT_SNORM16', quantized.astype(np.int16), max_error, 'FLOAT32x3')
+
+
+def _tangent(tangents, tolerance):
+    directions = tangents[:, :3].astype(np.float64)
+    quantized, errors = oct_quantize(directions, 16383)
+    max_error = float(errors.max()) if len(errors) else 0.0
+    if max_error > tolerance:
+        return CompactAttribute("tangent", 'FLOAT32x4', tangents.astype(np.float32), 0.0, 'FLOAT32x4', max_error)
+    packed = quantized.copy()
+    packed[:, 0] *= 2
+    packed[:, 1] = packed[:, 1] * 2 + (tangents[:, 3] < 0.0)
+    return CompactAttribute("tangent", 'OCT_SNORM16', packed.astype(np.int16), max_error, 'FLOAT32x4')
+
+
+def _uv(name, uv, tolerance):
+    uv = np.asarray(uv, np.float64)
+    if len(uv) and uv.min() >= 0.0 and uv.max() <= 1.0:
+        quantized = np.round(uv * 65535.0).astype(np.uint16)
+        decoded = quantized / 65535.0
+        format = 'UNORM16x2'
+    else:
+        quantized = uv.astype(np.float16)
+        decoded = quantized.astype(np.float64)
+        format = 'FLOAT16x2'
+    max_error = float(np.abs(decoded - uv).max()) if len(uv) else 0.0
+    if not np.isfinite(max_error) or max_error > tolerance:
+        return CompactAttribute(name, 'FLOAT32x2', uv.astype(np.float32), 0.0, 'FLOAT32x2', max_error)
+    return CompactAttribute(name, format, quantized, max_error, 'FLOAT32x2')
+
+
+def _color(name, color, tolerance):
+    color = np.asarray(color, np.float64)
+    quantized = np.round(np.clip(color, 0.0, 1.0) * 255.0).astype(np.uint8)
+    max_error = float(np.abs(quantized / 255.0 - color).max()) if len(color) else 0.0
+    if max_error > tolerance:
+        return CompactAttribute(name, 'FLOAT32x4', color.astype(np.float32), 0.0, 'FLOAT32x4', max_error)
+    return CompactAttribute(name, 'UNORM8x4', quantized, max_error, 'FLOAT32x4')
+
+
+def _bones(indices, weights, tolerance):
+    width = indices.shape[1]
+    baseline = 'UINT16x%d' % width
+    # Unused slots (group -1) become group 0 with weight 0.
+    indices = np.maximum(indices, 0)
+    if len(indices) and indices.max() > 255:
+        bone_indices = CompactAttribute("bone_indices", baseline, indices.astype(np.uint16), 0.0, baseline)
+    else:
+        bone_indices = CompactAttribute("bone_indices", 'UINT8x%d' % width, indices.astype(np.uint8), 0.0, baseline)
+
+    weights = np.asarray(weights, np.float64)
+    quantized = quantize_weights(weights)
+    totals = weights.sum(axis=1, keepdims=True)
+    normalized = weights / np.where(totals > 0.0, totals, 1.0)
+    max_error = float(np.abs(quantized / 255.0 - normalized).max()) if weights.size else 0.0
+    baseline = 'FLOAT32x%d' % width
+    if max_error > tolerance:
+        return bone_indices, CompactAttribute("bone_weights", baseline, weights.astype(np.float32), 0.0, baseline,
+                                                          max_error)
+    return bone_indices, CompactAttribute("bone_weights", 'UNORM8x%d' % width, quantized, max_error, baseline)
+
+
+def compact(buffer, tolerances=None):
+    """CompactBuffer of a VertexBuffer."""
+    tolerances = dict(TOLERANCES, **(tolerances or {}))
+    source = buffer.attributes
+    attributes = [CompactAttribute("position", 'FLOAT32x3', source["position"].astype(np.float32), 0.0, 'FLOAT32x3'),
+                  _direction("normal", source["normal"].astype(np.float64), tolerances["normal"])]
+    if "tangent" in source:
+        attributes.append(_tangent(source["tangent"], tolerances["tangent"]))
+    for name, array in source.items():
+        if name.startswith("uv:"):
+            attributes.append(_uv(name, array, tolerances["uv"]))
+        elif name.startswith("color:"):
+            attributes.append(_color(name, array, tolerances["color"]))
+    if "bone_indices" in source:
+        attributes.extend(_bones(source["bone_indices"], source["bone_weights"], tolerances["bone_weights"]))
+
+    vertex_count = buffer.vertex_count
+    index_type = np.uint16 if vertex_count <= 65536 else np.uint32
+    return CompactBuffer(attributes, buffer.indices.astype(index_type), vertex_count, 4)
+
+
+def analyze(buffer, tolerances=None):
+    """Size and error figures of the compact layout of a VertexBuffer."""
+    compacted = compact(buffer, tolerances)
+    return {
+        "stride": compacted.stride,
+        "baseline_stride": compacted.baseline_stride,
+        "bytes": compacted.size,
+        "baseline_bytes": compacted.baseline_size,
+        "index_bits": compacted.indices.dtype.itemsize * 8,
+        "errors": {attribute.name: attribute.max_error for attribute in compacted.attributes if attribute.quantized},
+        "fallbacks": [(attribute.name, attribute.rejected_error) for attribute in compacted.fallbacks],
+    }
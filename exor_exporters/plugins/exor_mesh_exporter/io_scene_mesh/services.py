@@ -0,0 +1,164 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Long-lived helper processes fed jobs over stdin/stdout.
+#
+# The converter services (see converter.py) and the hull cooking workers (see
+# collision.py) share this protocol: every message in either direction is a
+# 4-byte little-endian length followed by that many bytes of UTF-8 JSON, an
+# object whose "id" the reply repeats. A Service handles one request at a time
+# and is started on its first request; a ServicePool keeps idle services, grown
+# on demand to the number of concurrent requests, and restarts a service that
+# dies.
+#
+# This module does not import bpy, nor any other module of the addon, so the
+# cooking workers can import it when collision.py runs as a script.
+
+import json
+import struct
+import subprocess
+import threading
+
+_HEADER = struct.Struct("<I")
+
+
+def write_message(stream, message):
+    data = json.dumps(message).encode("utf-8")
+    stream.write(_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+def _read_exactly(stream, size):
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def read_message(stream):
+    """Next message from stream, None when it was closed."""
+    header = _read_exactly(stream, _HEADER.size)
+    if header is None:
+        return None
+    data = _read_exactly(stream, _HEADER.unpack(header)[0])
+    return None if data is None else json.loads(data.decode("utf-8"))
+
+
+class Service:
+    """One long-lived process started with command, handling one request at a time.
+
+    name stands for the process in error messages.
+    """
+
+    def __init__(self, command, name="service"):
+        self.command = command
+        self.name = name
+        self.proc = None
+        self.last_id = 0
+
+    @property
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def request(self, message, timeout=None):
+        """Reply to message, raises TimeoutError after killing the process when it takes longer than timeout."""
+        if not self.alive:
+            self.proc = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.last_id += 1
+        # Pipe reads cannot time out on Windows, killing the process ends the read instead.
+        proc = self.proc
+        expired = threading.Event()
+
+        def expire():
+            expired.set()
+            proc.kill()
+
+        timer = threading.Timer(timeout, expire) if timeout else None
+        if timer is not None:
+            timer.daemon = True
+            timer.start()
+        try:
+            write_message(proc.stdin, dict(message, id=self.last_id))
+            reply = read_message(proc.stdout)
+        except (OSError, ValueError):
+            if expired.is_set():
+                reply = None
+            else:
+                raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+        if reply is None and expired.is_set():
+            self.close()
+            raise TimeoutError("%s did not finish within %.0fs" % (self.name, timeout))
+        if reply is None or reply.get("id") != self.last_id:
+            raise ConnectionError("%s stopped responding" % self.name)
+        return reply
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+
+class ServicePool:
+    """Idle services started with command, grown on demand to the number of concurrent requests."""
+
+    def __init__(self, command, name="service"):
+        self.command = command
+        self.name = name
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def request(self, message, timeout=None):
+        """Reply of a service to message, None when no service could handle it.
+
+        A request that times out is not retried, its TimeoutError is raised.
+        """
+        with self.lock:
+            service = self.idle.pop() if self.idle else Service(self.command, self.name)
+        try:
+            for _attempt in range(2):
+                try:
+                    return service.request(message, timeout)
+                except TimeoutError:
+                    raise
+                except (OSError, ValueError, ConnectionError):
+                    # Dead or confused service: drop it, the retry starts a fresh one.
+                    service.close()
+            return None
+        finally:
+            with self.lock:
+                self.idle.append(service)
+
+    def close(self):
+        with self.lock:
+            services, self.idle = self.idle, []
+        for service in services:
+            service.close()
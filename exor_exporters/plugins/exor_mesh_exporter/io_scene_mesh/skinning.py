@@ -0,0 +1,124 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Skin weight compaction.
+#
+# Painted meshes often carry a dozen vertex groups per vertex, most of them
+# with weights close to zero, and every one of them ends up as an influence of
+# the exported skin. compact() drops the bone weights whose share of their
+# vertex's total is below a threshold, keeps the strongest max_influences of
+# every vertex and renormalizes the rest to sum to 1. It works on the CSR
+# weight arrays of MeshArrays as a whole: one sort, a rank per entry and a few
+# bincounts. A vertex never loses its strongest bone.
+#
+# The bones still referenced form the mesh's palette, which the export report
+# counts.
+#
+# This module does not import bpy.
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.01
+DEFAULT_MAX_INFLUENCES = 4
+
+
+class Compaction:
+    """Compacted bone weights of one MeshArrays.
+
+    weights      (W,) float32, new value of every weight entry, 0 where pruned
+    pruned       (W,) bool, bone weight entries that were dropped
+    kept         (K,) bone weight entries kept, by vertex and strongest first
+    palette      (B,) int32, vertex group indices of the bones still used
+    before       influence count histogram before compaction
+    after        influence count histogram after compaction
+    bone_count   number of bones the mesh is skinned with
+    max_change   largest change of any kept weight
+    """
+
+    def __init__(self, weights, pruned, kept, palette, before, after, bone_count, max_change):
+        self.weights = weights
+        self.pruned = pruned
+        self.kept = kept
+        self.palette = palette
+        self.before = before
+        self.after = after
+        self.bone_count = bone_count
+        self.max_change = max_change
+
+    @property
+    def changed(self):
+        return bool(self.pruned.any() or self.max_change > 0.0)
+
+
+def _ranks(owners, vertex_count):
+    """Position of every entry among those of its vertex, for entries sorted by vertex."""
+    counts = np.bincount(owners, minlength=vertex_count)
+    return np.arange(len(owners)) - (np.cumsum(counts) - counts)[owners], counts
+
+
+def compact(arrays, skin_groups, threshold=DEFAULT_THRESHOLD, max_influences=DEFAULT_MAX_INFLUENCES):
+    """Compaction of the weights of arrays over the vertex groups named in skin_groups.
+
+    Weights of other vertex groups are left alone. None when the mesh has no
+    bone weights.
+    """
+    if arrays.weight_offsets is None or not len(arrays.weight_values):
+        return None
+    bones = [index for index, name in enumerate(arrays.group_names) if name in skin_groups]
+    if not bones:
+        return None
+
+    vertex_count = arrays.vertex_count
+    values = arrays.weight_values
+    owners = np.repeat(np.arange(vertex_count), np.diff(arrays.weight_offsets))
+    entries = np.flatnonzero(np.isin(arrays.weight_groups, bones) & (values > 0.0))
+
+    # Entries are already grouped by vertex, a fractional part below 1 sorts
+    # them strongest first within it. One float sort is ten times faster
+    # than a lexsort of the two keys.
+    entry_values = np.minimum(values[entries], 1.0).astype(np.float64)
+    order = np.argsort(owners[entries] + (1.0 - entry_values) * 0.5)
+    entries = entries[order]
+    entry_owners = owners[entries]
+    ranks, before = _ranks(entry_owners, vertex_count)
+    # Blender does not keep weights normalized, the threshold applies to the
+    # share of every weight in its vertex's total.
+    totals = np.bincount(entry_owners, values[entries], minlength=vertex_count)
+    keep = (ranks < max_influences) & ((values[entries] >= threshold * totals[entry_owners]) | (ranks == 0))
+
+    kept = entries[keep]
+    kept_owners = entry_owners[keep]
+    sums = np.bincount(kept_owners, values[kept], minlength=vertex_count)
+    weights = values.copy()
+    weights[entries[~keep]] = 0.0
+    weights[kept] = values[kept] / sums[kept_owners]
+
+    pruned = np.zeros(len(values), bool)
+    pruned[entries[~keep]] = True
+    palette = np.unique(arrays.weight_groups[kept]).astype(np.int32)
+    max_change = float(np.abs(weights[kept] - values[kept]).max()) if len(kept) else 0.0
+    after = np.bincount(kept_owners, minlength=vertex_count)
+    return Compaction(weights, pruned, kept, palette, np.bincount(before), np.bincount(after),
+                      len(bones), max_change)
+
+
+def format_histogram(histogram):
+    """Text of an influence count histogram as influences:vertices pairs, empty bins left out."""
+    return " ".join("%d:%d" % (count, vertices) for count, vertices in enumerate(histogram.tolist()) if vertices)
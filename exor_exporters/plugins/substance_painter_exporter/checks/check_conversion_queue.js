@@ -0,0 +1,189 @@
+// Checks of the texture conversion queue of exporter.qml.
+//
+//     node check_conversion_queue.js
+//
+// Runs exor-exporter/conversion_queue.js with fake_texture_converter.js
+// started the way alg.subprocess.start runs converters: the limit of
+// concurrent converters, exports joining running conversions, failure
+// counting, converters that fail to start and empty exports. Prints one line
+// per check and exits with status 1 when any of them fails.
+
+var assert = require( "assert" );
+var childProcess = require( "child_process" );
+var fs = require( "fs" );
+var path = require( "path" );
+var vm = require( "vm" );
+
+var QUEUE_PATH = path.join( __dirname, "..", "exor-exporter", "conversion_queue.js" );
+var FAKE_CONVERTER = path.join( __dirname, "fake_texture_converter.js" );
+
+var ConversionQueue = vm.createContext( {} );
+vm.runInContext( fs.readFileSync( QUEUE_PATH, "utf8" ), ConversionQueue, { filename: QUEUE_PATH } );
+
+function job( index, options )
+{
+  var file = "map_" + index + ".png";
+  var command = "\"" + process.execPath + "\" \"" + FAKE_CONVERTER + "\" " + ( options || "" ) +
+    " --file=" + file + " --output=map_" + index + ".dds";
+  return { command: command, file: file };
+}
+
+function jobs( count, options )
+{
+  var list = [];
+  for ( var index = 0; index < count; ++index )
+    list.push( job( index, options ) );
+  return list;
+}
+
+// A queue running converters as processes. result.idle lists the counts of
+// every onIdle call, result.peak the most converters running at once.
+function processQueue( maxJobs, resultAsObject )
+{
+  var result = { running: 0, peak: 0, idle: [], done: [] };
+  var queue = new ConversionQueue.Queue( function( job, done )
+  {
+    result.running += 1;
+    result.peak = Math.max( result.peak, result.running );
+    childProcess.exec( job.command, function( error )
+    {
+      result.running -= 1;
+      var exitCode = error ? error.code : 0;
+      done( resultAsObject ? { exitCode: exitCode } : exitCode );
+    } );
+  } );
+  queue.maxJobs = maxJobs;
+  queue.onProgress = function( job, exitCode )
+  {
+    if ( job !== null )
+      result.done.push( [ job.file, exitCode ] );
+  };
+  queue.onIdle = function()
+  {
+    result.idle.push( { total: queue.total, finished: queue.finished, failed: queue.failed } );
+  };
+  result.queue = queue;
+  return result;
+}
+
+function whenIdle( result, callback )
+{
+  var timer = setInterval( function()
+  {
+    if ( result.idle.length > 0 && result.queue.idle() )
+    {
+      clearInterval( timer );
+      callback();
+    }
+  }, 10 );
+}
+
+function checkLimit( callback )
+{
+  var result = processQueue( 3, false );
+  result.queue.enqueue( jobs( 10 ) );
+  assert.strictEqual( result.queue.running, 3 );
+  whenIdle( result, function()
+  {
+    assert.strictEqual( result.peak, 3, "at most 3 converters should run at once" );
+    assert.deepStrictEqual( result.idle, [ { total: 10, finished: 10, failed: 0 } ] );
+    assert.strictEqual( result.queue.total, 0, "counts should be reset once idle" );
+    callback();
+  } );
+}
+
+function checkJoin( callback )
+{
+  var result = processQueue( 2, true );
+  result.queue.enqueue( jobs( 3, "--delay=100" ) );
+  setTimeout( function() { result.queue.enqueue( jobs( 4 ) ); }, 20 );
+  whenIdle( result, function()
+  {
+    assert.strictEqual( result.peak, 2 );
+    assert.deepStrictEqual( result.idle, [ { total: 7, finished: 7, failed: 0 } ],
+                            "a later export should join the running conversions" );
+    callback();
+  } );
+}
+
+function checkFailures( callback )
+{
+  var result = processQueue( 4, false );
+  var list = jobs( 6 );
+  list[1] = job( 1, "--exit=1" );
+  list[4] = job( 4, "--exit=3" );
+  result.queue.enqueue( list );
+  whenIdle( result, function()
+  {
+    assert.deepStrictEqual( result.idle, [ { total: 6, finished: 6, failed: 2 } ] );
+    var failed = result.done.filter( function( entry ) { return entry[1] !== 0; } ).sort();
+    assert.deepStrictEqual( failed, [ [ "map_1.png", 1 ], [ "map_4.png", 3 ] ] );
+    callback();
+  } );
+}
+
+function checkStartFailure( callback )
+{
+  // A converter that cannot be started reports back before start() returns.
+  var idle = [];
+  var queue = new ConversionQueue.Queue( function( job, done ) { done( -1 ); } );
+  queue.maxJobs = 2;
+  queue.onIdle = function() { idle.push( { total: queue.total, failed: queue.failed } ); };
+  queue.enqueue( jobs( 5 ) );
+  assert.deepStrictEqual( idle, [ { total: 5, failed: 5 } ], "idle should be reported once" );
+  assert.ok( queue.idle() );
+  callback();
+}
+
+function checkEmpty( callback )
+{
+  var idle = 0;
+  var queue = new ConversionQueue.Queue( function() { assert.fail( "nothing to start" ); } );
+  queue.onIdle = function() { idle += 1; };
+  queue.enqueue( [] );
+  assert.strictEqual( idle, 1, "an export without maps should close the dialog" );
+  callback();
+}
+
+var CHECKS = [ checkLimit, checkJoin, checkFailures, checkStartFailure, checkEmpty ];
+
+function run( index, failed )
+{
+  if ( index === CHECKS.length )
+  {
+    process.exit( failed ? 1 : 0 );
+    return;
+  }
+
+  var check = CHECKS[ index ];
+  var start = Date.now();
+  var finished = false;
+  var timer = null;
+  var finish = function( error )
+  {
+    if ( finished )
+      return;
+    finished = true;
+    clearTimeout( timer );
+    process.removeListener( "uncaughtException", finish );
+
+    var status = error ? "FAILED " + error.message : "ok";
+    console.log( ( check.name + "                        " ).substring( 0, 24 ) + " " +
+                 ( ( Date.now() - start ) / 1000 ).toFixed( 2 ) + "s " + status );
+    run( index + 1, failed + ( error ? 1 : 0 ) );
+  };
+
+  // Assertions in converter callbacks throw outside of check().
+  process.on( "uncaughtException", finish );
+  timer = setTimeout( function() { finish( new Error( "timed out" ) ); }, 10000 );
+  try
+  {
+    check( function() { finish( null ); } );
+  }
+  catch ( error )
+  {
+    finish( error );
+  }
+}
+
+run( 0, 0 );
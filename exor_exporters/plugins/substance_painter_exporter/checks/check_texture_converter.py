@@ -0,0 +1,350 @@
+"""Checks of texture_converter.py against independent decoders.
+
+Usage: python check_texture_converter.py
+
+Writes source PNGs with every row filter, converts them with the converter's
+command line like exporter.qml does and reads the results back with the
+decoders below, which share no code with the converter: the PNG reader, DDS
+headers and mip counts, BC1, BC3 and BC5 blocks, mip levels of data, sRGB
+color and normal maps, and quality tiers. Decoded levels are compared with box
+filtered source levels within the error block compression may add. Prints one
+line per check and exits with status 1 when any of them fails.
+"""
+
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+CONVERTER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "exor-exporter")
+CONVERTER = os.path.join(CONVERTER_DIR, "texture_converter.py")
+
+sys.path.insert(0, CONVERTER_DIR)
+import texture_converter  # noqa: E402
+
+FOURCC = {"dxt1c": b"DXT1", "dxt5": b"DXT5", "bc5": b"ATI2"}
+BLOCK_BYTES = {"dxt1c": 8, "dxt5": 16, "bc5": 16}
+
+
+# ----------------------------------------------------------------------------
+# Sources
+
+
+def png_content(pixels, color_type):
+    """PNG file content of (H, W, C) uint8 pixels, cycling through the five row filters."""
+    height, width, channels = pixels.shape
+    rows = pixels.reshape(height, width * channels).astype(np.int32)
+    filtered = []
+    for y in range(height):
+        kind = y % 5
+        row = rows[y]
+        up = rows[y - 1] if y else np.zeros_like(row)
+        left = np.concatenate([np.zeros(channels, np.int32), row[:-channels]])
+        up_left = np.concatenate([np.zeros(channels, np.int32), up[:-channels]])
+        if kind == 1:
+            row = row - left
+        elif kind == 2:
+            row = row - up
+        elif kind == 3:
+            row = row - (left + up) // 2
+        elif kind == 4:
+            estimate = left + up - up_left
+            pa, pb, pc = np.abs(estimate - left), np.abs(estimate - up), np.abs(estimate - up_left)
+            row = row - np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, up_left))
+        filtered.append(bytes([kind]) + (row & 0xFF).astype(np.uint8).tobytes())
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(b"".join(filtered))) + chunk(b"IEND", b""))
+
+
+def write_png(path, image):
+    """Write an (H, W, 4) RGBA image in [0, 1], returns it as stored (8 bit)."""
+    pixels = np.rint(np.clip(image, 0.0, 1.0) * 255.0).astype(np.uint8)
+    with open(path, "wb") as f:
+        f.write(png_content(pixels, 6))
+    return pixels.astype(np.float64) / 255.0
+
+
+def gradient(size, seed=0):
+    """Diagonal RGBA gradient along one color line with some noise, alpha rising left to right.
+
+    Every 4x4 block of it is close to a color line, which BC1 can store.
+    """
+    y, x = np.mgrid[0:size, 0:size] / (size - 1.0)
+    t = (x + y) * 0.5
+    noise = np.random.default_rng(seed).random((size, size, 4)) * 0.04
+    image = np.stack([t, 0.2 + 0.6 * t, 0.9 - 0.8 * t, x], axis=-1) + noise
+    return np.clip(image, 0.0, 1.0)
+
+
+def normal_map(size):
+    """RGB encoded unit normals of a bumpy surface."""
+    y, x = np.mgrid[0:size, 0:size] * (2.0 * np.pi / size)
+    vectors = np.stack([0.5 * np.sin(x * 2.0), 0.5 * np.cos(y * 3.0), np.ones((size, size))], axis=-1)
+    vectors /= np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.concatenate([(vectors + 1.0) * 0.5, np.ones((size, size, 1))], axis=-1)
+
+
+def checker(size):
+    """0/1 checker of single texels, a data map such as roughness."""
+    y, x = np.mgrid[0:size, 0:size]
+    value = ((x + y) % 2).astype(np.float64)
+    return np.stack([value, value, value, np.ones((size, size))], axis=-1)
+
+
+# ----------------------------------------------------------------------------
+# Expected mip levels
+
+
+def box(image):
+    height, width = image.shape[:2]
+    return image.reshape(max(1, height // 2), min(2, height), max(1, width // 2), min(2, width), -1).mean(axis=(1, 3))
+
+
+def expected_levels(image, mode="data"):
+    """Source levels, largest first; mode is data, srgb or normal."""
+    levels = [image]
+    working = image.copy()
+    if mode == "srgb":
+        working[..., :3] = np.where(working[..., :3] <= 0.04045, working[..., :3] / 12.92,
+                                    ((working[..., :3] + 0.055) / 1.055) ** 2.4)
+    elif mode == "normal":
+        working[..., :3] = working[..., :3] * 2.0 - 1.0
+    while working.shape[0] > 1 or working.shape[1] > 1:
+        working = box(working)
+        level = working.copy()
+        if mode == "srgb":
+            color = np.clip(level[..., :3], 0.0, 1.0)
+            level[..., :3] = np.where(color <= 0.0031308, color * 12.92, 1.055 * color ** (1.0 / 2.4) - 0.055)
+        elif mode == "normal":
+            working[..., :3] /= np.linalg.norm(working[..., :3], axis=-1, keepdims=True)
+            level[..., :3] = (working[..., :3] + 1.0) * 0.5
+        levels.append(level)
+    return levels
+
+
+# ----------------------------------------------------------------------------
+# Decoders
+
+
+def read_dds(path, fmt):
+    """Levels of a DDS file as (H, W, 4) float arrays, checking its header."""
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data[:4] == b"DDS ", "no DDS magic"
+    size, _flags, height, width, linear_size, _depth, mip_count = struct.unpack_from("<7I", data, 4)
+    pf_size, pf_flags, fourcc = struct.unpack_from("<2I4s", data, 76)
+    assert size == 124 and pf_size == 32 and pf_flags & 0x4, "malformed DDS header"
+    assert fourcc == FOURCC[fmt], "fourcc %r for %s" % (fourcc, fmt)
+    assert linear_size == block_count(width, height) * BLOCK_BYTES[fmt], "wrong top level size"
+
+    levels = []
+    position = 128
+    for level in range(max(1, mip_count)):
+        level_width, level_height = max(1, width >> level), max(1, height >> level)
+        nbytes = block_count(level_width, level_height) * BLOCK_BYTES[fmt]
+        blocks = np.frombuffer(data, np.uint8, nbytes, position).reshape(-1, BLOCK_BYTES[fmt])
+        position += nbytes
+        levels.append(unblock(decode_blocks(blocks, fmt), level_width, level_height))
+    assert position == len(data), "%d trailing bytes" % (len(data) - position)
+    return levels
+
+
+def block_count(width, height):
+    return max(1, (width + 3) // 4) * max(1, (height + 3) // 4)
+
+
+def unblock(texels, width, height):
+    """(H, W, 4) image of (N, 16, 4) block texels."""
+    rows, columns = max(1, (height + 3) // 4), max(1, (width + 3) // 4)
+    image = texels.reshape(rows, columns, 4, 4, 4).transpose(0, 2, 1, 3, 4).reshape(rows * 4, columns * 4, 4)
+    return image[:height, :width]
+
+
+def decode_565(codes):
+    codes = codes.astype(np.int64)
+    return np.stack([(codes >> 11) & 31, (codes >> 5) & 63, codes & 31], axis=-1) / np.array([31.0, 63.0, 31.0])
+
+
+def decode_color(blocks, four_colors_only=False):
+    """(N, 16, 4) RGBA of 8-byte BC1 color blocks."""
+    color0 = blocks[:, 0].astype(np.int64) | blocks[:, 1].astype(np.int64) << 8
+    color1 = blocks[:, 2].astype(np.int64) | blocks[:, 3].astype(np.int64) << 8
+    c0, c1 = decode_565(color0), decode_565(color1)
+    four = (color0 > color1) | four_colors_only
+    palette = np.empty((len(blocks), 4, 4))
+    palette[:, 0, :3], palette[:, 1, :3] = c0, c1
+    palette[:, 2, :3] = np.where(four[:, None], (2.0 * c0 + c1) / 3.0, (c0 + c1) / 2.0)
+    palette[:, 3, :3] = np.where(four[:, None], (c0 + 2.0 * c1) / 3.0, 0.0)
+    palette[:, :, 3] = 1.0
+    palette[~four, 3, 3] = 0.0
+    bits = blocks[:, 4:8].astype(np.int64)
+    indices = bits[:, 0] | bits[:, 1] << 8 | bits[:, 2] << 16 | bits[:, 3] << 24
+    indices = (indices[:, None] >> (2 * np.arange(16))) & 3
+    return palette[np.arange(len(blocks))[:, None], indices]
+
+
+def decode_bc4(blocks):
+    """(N, 16) values of 8-byte BC4 blocks."""
+    a0, a1 = blocks[:, 0].astype(np.float64), blocks[:, 1].astype(np.float64)
+    eight = a0 > a1
+    palette = np.empty((len(blocks), 8))
+    palette[:, 0], palette[:, 1] = a0, a1
+    for code in range(2, 8):
+        palette[:, code] = np.where(eight, ((8 - code) * a0 + (code - 1) * a1) / 7.0,
+                                    ((6 - code) * a0 + (code - 1) * a1) / 5.0)
+    palette[~eight, 6], palette[~eight, 7] = 0.0, 255.0
+    bits = np.zeros(len(blocks), np.int64)
+    for byte in range(6):
+        bits |= blocks[:, 2 + byte].astype(np.int64) << (8 * byte)
+    indices = (bits[:, None] >> (3 * np.arange(16))) & 7
+    return palette[np.arange(len(blocks))[:, None], indices] / 255.0
+
+
+def decode_blocks(blocks, fmt):
+    if fmt == "dxt1c":
+        return decode_color(blocks)
+    if fmt == "dxt5":
+        texels = decode_color(blocks[:, 8:], four_colors_only=True)
+        texels[..., 3] = decode_bc4(blocks[:, :8])
+        return texels
+    texels = np.zeros((len(blocks), 16, 4))
+    texels[..., 0] = decode_bc4(blocks[:, :8])
+    texels[..., 1] = decode_bc4(blocks[:, 8:])
+    texels[..., 3] = 1.0
+    return texels
+
+
+# ----------------------------------------------------------------------------
+# Checks
+
+
+def convert(directory, image, *options, name="source.png"):
+    """Write image as a PNG, run the converter on it with options and return the stored source."""
+    source = os.path.join(directory, name)
+    stored = write_png(source, image)
+    command = [sys.executable, CONVERTER, "--file=" + source] + list(options)
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    assert result.returncode == 0, "converter failed: %s" % result.stdout.strip()
+    return stored
+
+
+def compare(levels, expected, channels, mean_error, max_error):
+    assert len(levels) == len(expected), "%d levels, expected %d" % (len(levels), len(expected))
+    for index, (level, want) in enumerate(zip(levels, expected)):
+        assert level.shape[:2] == want.shape[:2], "level %d is %s, expected %s" % (index, level.shape, want.shape)
+        error = np.abs(level[..., channels] - want[..., channels])
+        assert error.mean() <= mean_error and error.max() <= max_error, (
+            "level %d differs by %.3f on average, %.3f at most" % (index, error.mean(), error.max()))
+
+
+def check_png_decoder():
+    rng = np.random.default_rng(1)
+    for color_type, channels in ((6, 4), (2, 3), (4, 2), (0, 1)):
+        pixels = rng.integers(0, 256, (11, 7, channels)).astype(np.uint8)
+        image = texture_converter.decode_png(png_content(pixels, color_type))
+        expected = np.ones((11, 7, 4))
+        if channels <= 2:
+            expected[..., :3] = pixels[..., :1] / 255.0
+            if channels == 2:
+                expected[..., 3] = pixels[..., 1] / 255.0
+        else:
+            expected[..., :channels] = pixels / 255.0
+        assert np.abs(image - expected).max() < 1e-6, "color type %d decoded wrongly" % color_type
+
+
+def check_bc1():
+    with tempfile.TemporaryDirectory() as directory:
+        image = gradient(64)
+        image[..., 3] = 1.0
+        stored = convert(directory, image, "--format=dxt1c", "--output=" + os.path.join(directory, "o.dds"),
+                                 "--srgb")
+        levels = read_dds(os.path.join(directory, "o.dds"), "dxt1c")
+        # On the smallest levels one block spans most of the gradient, more colors than BC1's four.
+        compare(levels, expected_levels(stored, "srgb"), slice(0, 3), 0.045, 0.12)
+        assert all((level[..., 3] == 1.0).all() for level in levels), "opaque map has transparent texels"
+
+
+def check_bc3():
+    with tempfile.TemporaryDirectory() as directory:
+        stored = convert(directory, gradient(32, 2), "--format=dxt5", "--nomipmap",
+                                 "--output=" + os.path.join(directory, "o.dds"))
+        levels = read_dds(os.path.join(directory, "o.dds"), "dxt5")
+        assert len(levels) == 1, "--nomipmap wrote %d levels" % len(levels)
+        compare(levels, [stored], slice(0, 3), 0.02, 0.12)
+        compare(levels, [stored], slice(3, 4), 0.01, 0.04)
+
+
+def check_bc5():
+    with tempfile.TemporaryDirectory() as directory:
+        stored = convert(directory, normal_map(32), "--format=bc5", "--norm",
+                                 "--output=" + os.path.join(directory, "o.dds"))
+        levels = read_dds(os.path.join(directory, "o.dds"), "bc5")
+        compare(levels, expected_levels(stored, "normal"), slice(0, 2), 0.01, 0.04)
+
+
+def check_data_mips():
+    # A 0/1 roughness checker averages to 0.5, and only to its sRGB mean when it is color.
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, options, mean in (("data", [], 0.5), ("srgb", ["--srgb"], 0.735)):
+            output = os.path.join(directory, mode + ".dds")
+            stored = convert(directory, checker(16), "--format=dxt1c", "--output=" + output, *options)
+            levels = read_dds(output, "dxt1c")
+            level_mean = levels[1][..., 0].mean()
+            assert abs(level_mean - mean) < 0.02, "mip 1 of a 0/1 %s checker is %.3f" % (mode, level_mean)
+            compare(levels, expected_levels(stored, mode), slice(0, 3), 0.02, 0.05)
+
+
+def check_tiers():
+    with tempfile.TemporaryDirectory() as directory:
+        tiers = [os.path.join(directory, "tier1", "o.dds"), os.path.join(directory, "tier2", "o.dds")]
+        stored = convert(directory, gradient(32, 3), "--format=dxt5", "--srgb",
+                                 "--output=" + os.path.join(directory, "o.dds"), *["--tier=" + tier for tier in tiers])
+        levels = read_dds(os.path.join(directory, "o.dds"), "dxt5")
+        for index, tier in enumerate(tiers, 1):
+            tier_levels = read_dds(tier, "dxt5")
+            assert len(tier_levels) == len(levels) - index, "tier %d has %d levels" % (index, len(tier_levels))
+            for level, want in zip(tier_levels, levels[index:]):
+                assert np.array_equal(level, want), "tier %d differs from the output's mip chain" % index
+
+
+def check_png_tiers():
+    # PNG tiers of normal maps are renormalized, those of data maps averaged as stored; one row high tiers too.
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, options, image in (("normal", ["--norm"], normal_map(16)), ("data", [], checker(16)),
+                                     ("normal", ["--norm"], normal_map(16)[:2])):
+            tier = os.path.join(directory, mode, "tier1.png")
+            stored = convert(directory, image, "--format=none", "--output=" + os.path.join(directory, mode + ".png"),
+                             "--tier=" + tier, *options)
+            with open(tier, "rb") as f:
+                level = texture_converter.decode_png(f.read())
+            compare([level], expected_levels(stored, mode)[1:2], slice(0, 3), 0.004, 0.004)
+
+
+CHECKS = (check_png_decoder, check_bc1, check_bc3, check_bc5, check_data_mips, check_tiers, check_png_tiers)
+
+
+def main():
+    failed = 0
+    for check in CHECKS:
+        start = time.perf_counter()
+        try:
+            check()
+            status = "ok"
+        except AssertionError as e:
+            status = "FAILED %s" % e
+            failed += 1
+        print("%-24s %6.2fs %s" % (check.__name__, time.perf_counter() - start, status))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,17 @@
+// Stand-in for texture_converter, for check_conversion_queue.js.
+//
+//     node fake_texture_converter.js [--delay=MS] [--exit=CODE] --file=IN.png --output=OUT.dds [...]
+//
+// Takes the command lines exporter.qml builds, converts nothing, waits --delay
+// milliseconds (default 50) to overlap with the other conversions and exits
+// with --exit (default 0).
+
+var options = { delay: "50", exit: "0" };
+process.argv.slice( 2 ).forEach( function( arg )
+{
+  var match = /^--([^=]+)=(.*)$/.exec( arg );
+  if ( match )
+    options[ match[1] ] = match[2];
+} );
+
+setTimeout( function() { process.exit( parseInt( options.exit ) ); }, parseInt( options.delay ) );
@@ -0,0 +1,83 @@
+// Texture conversion scheduling of exporter.qml.
+//
+// Conversions wait in a queue and at most maxJobs converters run at a time,
+// each export adds its maps to the conversions still running. This file uses
+// no QML types, so checks/check_conversion_queue.js runs it under node.
+
+// start( job, done ) launches the converter of job and calls done( result )
+// once it exited.
+function Queue( start )
+{
+  this.start = start;
+  this.maxJobs = 4;
+  this.pending = [];
+  this.running = 0;
+  this.total = 0;
+  this.finished = 0;
+  this.failed = 0;
+  this.starting = false;
+  // Called after the counts changed, with the job and its exit code when one finished.
+  this.onProgress = function( job, exitCode ) {};
+  // Called when no conversion is left, the counts are reset right after.
+  this.onIdle = function() {};
+}
+
+// The converter callback gets the exit code, or an object holding it.
+function exitCode( result )
+{
+  return ( result !== null && typeof result === "object" ) ? result.exitCode : result;
+}
+
+Queue.prototype.idle = function()
+{
+  return this.running === 0 && this.pending.length === 0;
+};
+
+Queue.prototype.enqueue = function( jobs )
+{
+  for ( var idx in jobs )
+    this.pending.push( jobs[idx] );
+  this.total += jobs.length;
+
+  this.startJobs();
+};
+
+Queue.prototype.startJobs = function()
+{
+  // A converter that finishes while start() runs lands here again, the loop below goes on.
+  if ( this.starting )
+    return;
+
+  this.starting = true;
+  while ( this.running < this.maxJobs && this.pending.length > 0 )
+  {
+    var job = this.pending.shift();
+    this.running += 1;
+    this.start( job, this.jobDone.bind( this, job ) );
+  }
+  this.starting = false;
+
+  this.onProgress( null, undefined );
+
+  if ( this.idle() )
+  {
+    this.onIdle();
+
+    this.total = 0;
+    this.finished = 0;
+    this.failed = 0;
+  }
+};
+
+Queue.prototype.jobDone = function( job, result )
+{
+  var code = exitCode( result );
+
+  this.running -= 1;
+  this.finished += 1;
+  if ( code !== undefined && code !== 0 )
+    this.failed += 1;
+
+  this.onProgress( job, code );
+  this.startJobs();
+};
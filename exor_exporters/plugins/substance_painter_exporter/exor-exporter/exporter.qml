@@ -11,6 +11,7 @@ import QtQuick.Controls.Styles 1.4
 import Qt.labs.platform 1.0
 import AlgWidgets 2.0
 import AlgWidgets.Style 1.0
+import "conversion_queue.js" as ConversionQueue
 
 Button {
   id: control
@@ -59,35 +60,73 @@ Button {
     id: convertDialog
 
     title: "Converting files..."
-    width: bar.width
-    height: bar.height
+    width: progressLayout.width
+    height: progressLayout.height
     modality: Qt.ApplicationModal
 
-    property int filesCount
-    function onConvertDone()
-    {
-      bar.value += 1;
+    // Conversions run from a ConversionQueue.Queue, see conversion_queue.js.
+    property var conversions: null
+    property int maxJobs: 4
+
+    Component.onCompleted: {
+      conversions = new ConversionQueue.Queue( function( job, done ) { alg.subprocess.start( job.command, done ); } );
+
+      conversions.onProgress = function( job, exitCode )
+      {
+        if ( job !== null )
+        {
+          bar.value = conversions.finished;
+          if ( exitCode !== undefined && exitCode !== 0 )
+            alg.log.error( "Conversion failed with exit code " + exitCode + ": " + job.file );
+          else
+            alg.log.info( "Converted " + conversions.finished + " of " + conversions.total + ": " + job.file );
+        }
 
-      filesCount -= 1;
-      if ( filesCount <= 0 )
+        progressLabel.text = conversions.finished + " of " + conversions.total + " done" +
+          ( conversions.failed > 0 ? ", " + conversions.failed + " failed" : "" );
+      };
+
+      conversions.onIdle = function()
+      {
+        alg.log.info( "Converted " + ( conversions.total - conversions.failed ) + " of " + conversions.total + " textures" );
+        if ( conversions.failed > 0 )
+          alg.log.error( conversions.failed + " texture conversions failed, see the log above" );
+
+        bar.value = 0;
         convertDialog.accept();
+      };
     }
 
-    function onConverStart( count )
+    function idle()
     {
-        filesCount = count;
+      return conversions.idle();
+    }
 
-        bar.from = 0.0;
-        bar.to = filesCount;
+    function enqueue( jobs )
+    {
+      bar.from = 0.0;
+      bar.to = Math.max( conversions.total + jobs.length, 1 );
+      convertDialog.show();
 
-        convertDialog.show();
+      conversions.maxJobs = maxJobs;
+      conversions.enqueue( jobs );
     }
 
-    AlgProgressBar {
-      id: bar
-      height: 30
-      width: 200
-      indeterminate: false
+    ColumnLayout {
+      id: progressLayout
+
+      AlgProgressBar {
+        id: bar
+        height: 30
+        width: 200
+        indeterminate: false
+      }
+
+      AlgLabel {
+        id: progressLabel
+        Layout.leftMargin: 10
+        text: ""
+      }
     }
   }
 
@@ -142,11 +181,55 @@ Button {
     return "";
   }
 
-  function buildConverterCommand( inputFile, convertToDDS, textureSuffix, materialName, generateMipMaps, sharpenMipMaps, isNormalMap, convertToBC5, hasAlphaChannel )
+  function usesPythonConverter( tierCount )
+  {
+    // texture_converter.py takes the same arguments where the exe does not run,
+    // and only it keeps a cache of converted textures, writes quality tiers and
+    // tells sRGB color from data maps.
+    return Qt.platform.os !== "windows" || ddsSkipUnchanged.checked || tierCount > 1;
+  }
+
+  function converterCommand( tierCount )
+  {
+    var windows = Qt.platform.os === "windows";
+    if ( !usesPythonConverter( tierCount ) )
+      return "\"" + alg.plugin_root_directory + "texture_converter.exe\"";
+
+    var command = ( windows ? "python" : "python3" ) + " \"" + alg.plugin_root_directory + "texture_converter.py\"";
+    if ( ddsSkipUnchanged.checked )
+      command += " --cache=\"" + textureCacheDirectory() + "\"";
+    return command;
+  }
+
+  function textureCacheDirectory()
+  {
+    // Per user, the plugin directory may be shared or read-only.
+    var cacheUrl = StandardPaths.writableLocation( StandardPaths.GenericCacheLocation );
+    return alg.fileIO.urlToLocalFile( cacheUrl.toString() ) + "/exor-exporter/texture_cache";
+  }
+
+  function tierOutput( outputFile, tier )
+  {
+    // Lower tiers mirror the textures directory in textures_tier<N> next to it.
+    var root = ( alg.settings.value("exportDir", "") + "/textures/" ).toLowerCase();
+    if ( outputFile.indexOf( root ) !== 0 )
+      return "";
+
+    return root.replace( /\/textures\/$/, "/textures_tier" + tier + "/" ) + outputFile.substring( root.length );
+  }
+
+  function buildConverterCommand( inputFile, convertToDDS, textureSuffix, materialName, generateMipMaps, sharpenMipMaps, isNormalMap, convertToBC5, hasAlphaChannel, tierCount, isColor )
   {
-    var command = "\"" + alg.plugin_root_directory + "texture_converter.exe\""
+    var command = converterCommand( tierCount );
     command += generateMipMaps ? "" : " --nomipmap";
 
+    // Data maps are filtered as stored, only color is filtered in linear light,
+    // for DDS mips and PNG quality tiers alike.
+    if ( isNormalMap )
+      command += " --norm";
+    else if ( isColor && usesPythonConverter( tierCount ) )
+      command += " --srgb";
+
     var outputFile = inputFile.replace( "_" + materialName + "_temp_", textureSuffix ).toLowerCase();
 
     var format = "none";
@@ -156,14 +239,9 @@ Button {
       if ( !isNormalMap && generateMipMaps && sharpenMipMaps ) 
         command += " --sharpen";
 
-      if ( isNormalMap )
+      if ( convertToBC5 )
       {
-        command += " --norm";
-
-        if ( convertToBC5 )
-        {
-          format = "bc5";
-        }
+        format = "bc5";
       }
 
       outputFile = outputFile.replace(".png", ".dds");
@@ -174,6 +252,18 @@ Button {
     command += " --output=\"" + outputFile + "\""
     command += " --remove"
 
+    for ( var tier = 1; tier < tierCount; tier++ )
+    {
+      var tierFile = tierOutput( outputFile, tier );
+      if ( tierFile === "" )
+      {
+        alg.log.warn( "Not below the export directory, quality tiers skipped: " + outputFile );
+        break;
+      }
+
+      command += " --tier=\"" + tierFile + "\"";
+    }
+
     return command;
   }
 
@@ -212,7 +302,9 @@ Button {
 
     var structure = alg.mapexport.documentStructure();
 
-    var commands = []
+    var jobs = []
+    // Maps are exported at the top tier's resolution, lower tiers are derived from them.
+    var tierCount = qualityTiers.currentIndex + 1;
     for (var mapName in maps)
     {
       var material = structure.materials.find( function( mat ) { return mat.name == mapName; } );
@@ -234,45 +326,39 @@ Button {
         alg.log.info("******************");
         alg.log.info("File: " + filePath);
 
+        var isNormalMap = !( filePath.indexOf("normal") === -1 );
+        var isAlbedo = !( filePath.indexOf("albedo") === -1 );
+        var isColor = isAlbedo || !( filePath.indexOf("emissive") === -1 );
+        alg.log.info("Is normal map: " + isNormalMap);
+
         if ( exportAsDDS.checked )
         {
-          var isNormalMap = !( filePath.indexOf("normal") === -1 );
-          var isAlbedo = !( filePath.indexOf("albedo") === -1 );
-
           var generateMipMaps = ddsGenerateMips.checked;
           var sharpenMipMaps = isAlbedo && ddsSharpenMips.checked;
           var convertToBC5 = isNormalMap && ddsNormalsBC5.checked;
           var hasOpacity = isAlbedo && hasOpacityChannel;
 
           alg.log.info("Sharpen mipmaps: " + sharpenMipMaps);
-          alg.log.info("Is normal map: " + isNormalMap);
           alg.log.info("Has opacity: " + hasOpacityChannel);
           alg.log.info("Convert to BC5: " + convertToBC5);
 
-          var command = buildConverterCommand( filePath, true, textureSuffix, material.name, generateMipMaps, sharpenMipMaps, isNormalMap, convertToBC5, hasOpacity )
+          var command = buildConverterCommand( filePath, true, textureSuffix, material.name, generateMipMaps, sharpenMipMaps, isNormalMap, convertToBC5, hasOpacity, tierCount, isColor )
           alg.log.info("Command: " + command );
 
-          commands.push( command );
+          jobs.push( { command: command, file: filePath } );
         }
         else
         {
-          var command = buildConverterCommand( filePath, false, textureSuffix, material.name )
+          var command = buildConverterCommand( filePath, false, textureSuffix, material.name, false, false, isNormalMap, false, false, tierCount, isColor )
           alg.log.info("Command: " + command );
 
-          commands.push( command );
+          jobs.push( { command: command, file: filePath } );
         }
       }
     }
 
-    convertDialog.onConverStart(commands.length + 1)
-
-    for ( var idx in commands )
-    {
-      var command = commands[idx];
-      alg.subprocess.start(command, function(e){ convertDialog.onConvertDone(); } );
-    }
-
-    convertDialog.onConvertDone();
+    convertDialog.maxJobs = Math.max( 1, parseInt( alg.settings.value( "converterJobs", 4 ) ) || 1 );
+    convertDialog.enqueue( jobs );
   }
 
   function createListModel() {
@@ -301,6 +387,9 @@ Button {
         ddsSharpenMips.checked = alg.project.settings.value("ddsSharpenMips", false)
         ddsGenerateMips.checked = alg.project.settings.value("ddsGenerateMips", true)
         ddsNormalsBC5.checked = alg.project.settings.value("ddsNormalsBC5", true)
+        ddsSkipUnchanged.checked = alg.settings.value("ddsSkipUnchanged", Qt.platform.os !== "windows")
+        qualityTiers.currentIndex = alg.project.settings.value("qualityTiers", 1) - 1
+        converterJobs.currentIndex = Math.max( 0, converterJobs.model.indexOf( String( alg.settings.value("converterJobs", 4) ) ) )
         exportDirLabel.text = alg.settings.value("exportDir", "");
     }
 
@@ -342,7 +431,8 @@ Button {
 
           convertDialog.show();
           var maps = alg.mapexport.exportDocumentMaps( preset, path, "png", { resolution: [size,size] }, [material.name] );
-          convertDialog.accept();
+          if ( convertDialog.idle() )
+            convertDialog.accept();
 
           convertTextures( maps );
         }
@@ -358,6 +448,9 @@ Button {
         alg.project.settings.setValue("ddsSharpenMips", ddsSharpenMips.checked)
         alg.project.settings.setValue("ddsGenerateMips", ddsGenerateMips.checked)
         alg.project.settings.setValue("ddsNormalsBC5", ddsNormalsBC5.checked)
+        alg.settings.setValue("ddsSkipUnchanged", ddsSkipUnchanged.checked)
+        alg.project.settings.setValue("qualityTiers", qualityTiers.currentIndex + 1)
+        alg.settings.setValue("converterJobs", parseInt( converterJobs.currentText ))
 
         var exportDir = alg.settings.value("exportDir", "")
         if ( exportDir === "" || !alg.fileIO.exists(exportDir) )
@@ -545,6 +638,34 @@ Button {
                   enabled: exportAsDDS.checked
                   text: "Use BC5 for normal map"
                 }
+
+                AlgCheckBox {
+                  id: ddsSkipUnchanged
+                  enabled: exportAsDDS.checked
+                  text: "Skip unchanged textures"
+                }
+
+                RowLayout {
+                  AlgLabel {
+                    text: "Quality tiers"
+                  }
+
+                  AlgComboBox {
+                    id: qualityTiers
+                    model: [ "1", "2", "3", "4" ]
+                  }
+                }
+
+                RowLayout {
+                  AlgLabel {
+                    text: "Parallel conversions"
+                  }
+
+                  AlgComboBox {
+                    id: converterJobs
+                    model: [ "1", "2", "4", "8", "16" ]
+                  }
+                }
               }
             }
           }
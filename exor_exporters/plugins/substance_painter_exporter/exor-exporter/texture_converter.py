@@ -0,0 +1,591 @@
+"""Cross-platform stand-in for texture_converter.exe.
+
+    python texture_converter.py --file=IN.png --output=OUT.dds [--format=dxt1c|dxt5|bc5|none]
+                                [--norm] [--srgb] [--sharpen] [--nomipmap] [--remove] [--jobs N]
+                                [--cache=DIR [--cache-limit=MB]] [--tier=OUT_HALF.dds [--tier=OUT_QUARTER.dds ...]]
+
+Takes the command lines exporter.qml builds for texture_converter.exe, with
+python (and this script) in place of the executable, so textures can be
+rebuilt on machines without Windows. Only NumPy is required; PNG files are read
+with Pillow when it is installed and with a built-in decoder otherwise.
+
+--format picks the DDS block compression: dxt1c (BC1, no alpha), dxt5 (BC3)
+or bc5 (two channel, for normal maps). none writes the PNG to --output as it
+is. Mip levels down to 1x1 are generated unless --nomipmap is given:
+
+  * values are averaged as stored, right for data maps (roughness,
+    metallic, occlusion, packed maps); with --srgb, color is averaged in
+    linear light and stored as sRGB again, for albedo and emissive maps,
+  * with --norm, texels are decoded as unit vectors, averaged and
+    renormalized on every level,
+  * with --sharpen, every generated level gets an unsharp mask, which keeps
+    albedo detail from washing out in the distance.
+
+Blocks are encoded with NumPy in tiles spread over --jobs threads. Colors use
+the principal axis of every block for their endpoints, refined once by least
+squares; alpha and BC5 channels use the block's range. --remove deletes the
+input file once the output is written.
+
+With --cache, every DDS file written is also kept in DIR, named after a hash
+of the source file's content and the conversion options. Converting the same
+map with the same options again copies the kept file instead of encoding it.
+The least recently used files are deleted when DIR grows over --cache-limit;
+DIR can also be deleted at any time.
+
+Every --tier is one more output for a lower quality tier, each half the size
+of the one before, so a map exported from Painter once at the top resolution
+serves every tier. A DDS tier is the output's mip chain from the matching
+level down, the encoded levels are written again rather than encoded again;
+PNG tiers are written from the same mip levels. Tier files are written in
+parallel, missing directories are created.
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import struct
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+FORMATS = ("dxt1c", "dxt5", "bc5", "none")
+
+# Blocks encoded per task. Large enough to amortize NumPy call overhead,
+# small enough to keep the temporaries of one task in cache.
+TILE_BLOCKS = 4096
+
+SHARPEN_AMOUNT = 0.5
+
+# Part of every cache key, raise it when the encoded output changes.
+CACHE_VERSION = 2
+CACHE_LIMIT_MB = 2048
+
+# ----------------------------------------------------------------------------
+# PNG reading
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}  # by color type
+
+
+def _paeth(left, up, up_left):
+    estimate = left + up - up_left
+    distance_left = np.abs(estimate - left)
+    distance_up = np.abs(estimate - up)
+    distance_up_left = np.abs(estimate - up_left)
+    return np.where((distance_left <= distance_up) & (distance_left <= distance_up_left), left,
+                    np.where(distance_up <= distance_up_left, up, up_left))
+
+
+def _unfilter(filtered, filters, width, bpp):
+    """Undo PNG scanline filtering of (H, W * bpp) bytes."""
+    height = len(filtered)
+    if not (filters >= 3).any():
+        # None, Sub and Up only depend on whole rows, one row at a time is enough.
+        out = np.empty_like(filtered)
+        previous = np.zeros(filtered.shape[1], np.uint8)
+        for y in range(height):
+            line = filtered[y]
+            if filters[y] == 1:
+                line = np.cumsum(line.reshape(width, bpp), axis=0, dtype=np.uint8).ravel()
+            elif filters[y] == 2:
+                line = line + previous
+            out[y] = previous = line
+        return out
+
+    # Average and Paeth depend on the texel to the left, the one above and the
+    # one above to the left. Texels on the same anti-diagonal do not depend on
+    # each other, so the image is decoded one anti-diagonal at a time.
+    texels = filtered.reshape(height, width, bpp).astype(np.int16)
+    out = np.zeros((height + 1, width + 1, bpp), np.int16)  # out[y + 1, x + 1], zero padded
+    row_filters = filters.astype(np.int16).reshape(-1, 1)
+    for diagonal in range(height + width - 1):
+        ys = np.arange(max(0, diagonal - width + 1), min(height - 1, diagonal) + 1)
+        xs = diagonal - ys
+        left = out[ys + 1, xs]
+        up = out[ys, xs + 1]
+        up_left = out[ys, xs]
+        kind = row_filters[ys]
+        predicted = np.select((kind == 1, kind == 2, kind == 3, kind == 4),
+                              (left, up, (left + up) >> 1, _paeth(left, up, up_left)), 0)
+        out[ys + 1, xs + 1] = (texels[ys, xs] + predicted) & 255
+    return out[1:, 1:].astype(np.uint8).reshape(height, width * bpp)
+
+
+def decode_png(data):
+    """(H, W, 4) float32 RGBA in [0, 1] of PNG file content.
+
+    Handles 8 and 16 bit gray, gray alpha, RGB, RGBA and 8 bit palette images
+    without interlacing, what texture exporters write.
+    """
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("not a PNG file")
+    position = 8
+    header = None
+    palette = transparency = None
+    compressed = []
+    while position < len(data):
+        length, kind = struct.unpack(">I4s", data[position:position + 8])
+        chunk = data[position + 8:position + 8 + length]
+        position += 12 + length
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", chunk)
+        elif kind == b"PLTE":
+            palette = np.frombuffer(chunk, np.uint8).reshape(-1, 3)
+        elif kind == b"tRNS":
+            transparency = np.frombuffer(chunk, np.uint8)
+        elif kind == b"IDAT":
+            compressed.append(chunk)
+        elif kind == b"IEND":
+            break
+    if header is None:
+        raise ValueError("PNG file without header")
+
+    width, height, bit_depth, color_type, _compression, _filter, interlace = header
+    if color_type not in PNG_CHANNELS or bit_depth not in (8, 16) or interlace:
+        raise ValueError("unsupported PNG (bit depth %d, color type %d, interlace %d), install Pillow"
+                         % (bit_depth, color_type, interlace))
+    channels = PNG_CHANNELS[color_type]
+    bpp = channels * bit_depth // 8
+    rows = np.frombuffer(zlib.decompress(b"".join(compressed)), np.uint8).reshape(height, width * bpp + 1)
+    if (rows[:, 0] > 4).any():
+        raise ValueError("invalid PNG filter type")
+    raw = _unfilter(rows[:, 1:], rows[:, 0], width, bpp)
+
+    if bit_depth == 16:
+        values = raw.view(">u2").reshape(height, width, channels).astype(np.float32) / 65535.0
+    else:
+        values = raw.reshape(height, width, channels).astype(np.float32) / 255.0
+
+    rgba = np.ones((height, width, 4), np.float32)
+    if color_type == 3:
+        indices = raw.reshape(height, width)
+        rgba[..., :3] = palette[indices] / 255.0
+        if transparency is not None:
+            alpha = np.full(256, 255, np.uint8)
+            alpha[:len(transparency)] = transparency
+            rgba[..., 3] = alpha[indices] / 255.0
+    elif channels <= 2:
+        rgba[..., :3] = values[..., :1]
+        if channels == 2:
+            rgba[..., 3] = values[..., 1]
+    else:
+        rgba[..., :channels] = values
+    return rgba
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def encode_png(image):
+    """PNG file content of an (H, W, 4) RGBA image in [0, 1], RGB when it is opaque."""
+    pixels = np.rint(np.clip(image, 0.0, 1.0) * 255.0).astype(np.uint8)
+    color_type = 6
+    if (pixels[..., 3] == 255).all():
+        pixels, color_type = pixels[..., :3], 2
+    height, width, channels = pixels.shape
+    # Up filter on every row, the difference to the row above.
+    rows = np.empty((height, width * channels + 1), np.uint8)
+    rows[:, 0] = 2
+    rows[:, 1:] = pixels.reshape(height, -1)
+    rows[1:, 1:] -= pixels[:-1].reshape(height - 1, width * channels)
+    return (PNG_SIGNATURE + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+            + _png_chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)) + _png_chunk(b"IEND", b""))
+
+
+def read_image(path):
+    """(H, W, 4) float32 RGBA in [0, 1] of an image file."""
+    if Image is not None:
+        with Image.open(path) as image:
+            return np.asarray(image.convert("RGBA"), np.float32) / 255.0
+    with open(path, "rb") as f:
+        return decode_png(f.read())
+
+
+# ----------------------------------------------------------------------------
+# Mip chain
+
+
+def srgb_to_linear(values):
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def linear_to_srgb(values):
+    values = np.clip(values, 0.0, 1.0)
+    return np.where(values <= 0.0031308, values * 12.92, 1.055 * values ** (1.0 / 2.4) - 0.055)
+
+
+def downsample(image):
+    """Half size box filtered image; an axis of size 1 stays as it is."""
+    height, width = image.shape[:2]
+    if height > 1:
+        image = (image[0:height // 2 * 2:2] + image[1:height // 2 * 2:2]) * 0.5
+    if width > 1:
+        image = (image[:, 0:width // 2 * 2:2] + image[:, 1:width // 2 * 2:2]) * 0.5
+    return image
+
+
+def normalized(vectors):
+    lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(lengths > 0.0, lengths, 1.0)
+
+
+def sharpened(image, amount=SHARPEN_AMOUNT):
+    """Unsharp mask of an (H, W, C) image with a 3x3 box blur."""
+    padded = np.pad(image, ((1, 1), (1, 1), (0, 0)), mode="edge")
+    height, width = image.shape[:2]
+    blurred = sum(padded[y:y + height, x:x + width] for y in range(3) for x in range(3)) / 9.0
+    return np.clip(image + amount * (image - blurred), 0.0, 1.0)
+
+
+def mip_chain(image, normal_map=False, srgb=False, sharpen=False, mipmaps=True):
+    """Levels of an RGBA image in [0, 1], largest first."""
+    levels = [image]
+    if not mipmaps:
+        return levels
+
+    # Averaging happens on vectors for normal maps and on linear light for sRGB color.
+    working = image.copy()
+    if normal_map:
+        working[..., :3] = working[..., :3] * 2.0 - 1.0
+    elif srgb:
+        working[..., :3] = srgb_to_linear(working[..., :3])
+
+    while working.shape[0] > 1 or working.shape[1] > 1:
+        working = downsample(working)
+        level = working.copy()
+        if normal_map:
+            working[..., :3] = normalized(working[..., :3])
+            level[..., :3] = (working[..., :3] + 1.0) * 0.5
+        elif sharpen:
+            level[..., :3] = sharpened(level[..., :3])
+        if srgb and not normal_map:
+            level[..., :3] = linear_to_srgb(level[..., :3])
+        levels.append(level)
+    return levels
+
+
+# ----------------------------------------------------------------------------
+# Block compression
+
+
+BC1_BLOCK = np.dtype([("color0", "<u2"), ("color1", "<u2"), ("indices", "<u4")])
+
+# Weight of color0 for the BC1 indices 0 to 3 in four color mode.
+BC1_WEIGHTS = np.array([1.0, 0.0, 2.0 / 3.0, 1.0 / 3.0])
+
+# Palette index order of BC4 codes: code 0 is the first endpoint, 1 the
+# second, 2 to 7 are interpolated from the first towards the second.
+BC4_WEIGHTS = np.array([1.0, 0.0, 6.0 / 7.0, 5.0 / 7.0, 4.0 / 7.0, 3.0 / 7.0, 2.0 / 7.0, 1.0 / 7.0])
+
+
+def to_blocks(image):
+    """(N, 16, C) texels of the 4x4 blocks of an (H, W, C) image, row by row; edges are repeated."""
+    height, width, channels = image.shape
+    padded_height, padded_width = -(-height // 4) * 4, -(-width // 4) * 4
+    if (padded_height, padded_width) != (height, width):
+        image = np.pad(image, ((0, padded_height - height), (0, padded_width - width), (0, 0)), mode="edge")
+    blocks = image.reshape(padded_height // 4, 4, padded_width // 4, 4, channels).transpose(0, 2, 1, 3, 4)
+    return blocks.reshape(-1, 16, channels)
+
+
+def _pack_565(colors):
+    """uint16 RGB565 codes of (N, 3) colors in [0, 255]."""
+    r = np.clip(np.rint(colors[:, 0] * (31.0 / 255.0)), 0, 31).astype(np.uint16)
+    g = np.clip(np.rint(colors[:, 1] * (63.0 / 255.0)), 0, 63).astype(np.uint16)
+    b = np.clip(np.rint(colors[:, 2] * (31.0 / 255.0)), 0, 31).astype(np.uint16)
+    return (r << 11) | (g << 5) | b
+
+
+def _unpack_565(codes):
+    codes = codes.astype(np.int32)
+    r, g, b = (codes >> 11) & 31, (codes >> 5) & 63, codes & 31
+    return np.stack(((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)), axis=-1).astype(np.float64)
+
+
+def _fit_indices(texels, color0, color1):
+    """Ordered endpoint codes, nearest indices and squared errors of BC1 blocks.
+
+    Endpoints are ordered so color0 > color1 (four color mode), blocks with a
+    single color use index 0 only.
+    """
+    swap = color0 < color1
+    color0, color1 = np.where(swap, color1, color0), np.where(swap, color0, color1)
+    endpoints0, endpoints1 = _unpack_565(color0), _unpack_565(color1)
+    palette = (BC1_WEIGHTS.reshape(1, 4, 1) * endpoints0[:, None]
+               + (1.0 - BC1_WEIGHTS).reshape(1, 4, 1) * endpoints1[:, None])
+    distances = ((texels[:, :, None, :] - palette[:, None, :, :]) ** 2).sum(axis=-1)
+    indices = distances.argmin(axis=2)
+    indices[color0 == color1] = 0
+    errors = np.take_along_axis(distances, indices[..., None], axis=2)[..., 0].sum(axis=1)
+    return color0, color1, indices, errors
+
+
+def encode_bc1(texels):
+    """BC1 blocks of (N, 16, 3) texels in [0, 255]."""
+    mean = texels.mean(axis=1, keepdims=True)
+    centered = texels - mean
+    covariance = np.einsum("nki,nkj->nij", centered, centered)
+    # Power iteration for the principal axis of every block's colors.
+    axis = covariance.sum(axis=2) + 1e-6
+    for _iteration in range(4):
+        axis = np.einsum("nij,nj->ni", covariance, axis)
+        axis /= np.maximum(np.linalg.norm(axis, axis=1, keepdims=True), 1e-12)
+    projection = np.einsum("nki,ni->nk", centered, axis)
+    high = mean[:, 0] + axis * projection.max(axis=1, keepdims=True)
+    low = mean[:, 0] + axis * projection.min(axis=1, keepdims=True)
+    color0, color1, indices, errors = _fit_indices(texels, _pack_565(high), _pack_565(low))
+
+    # One least squares refit of the endpoints to the chosen indices.
+    weight0 = BC1_WEIGHTS[indices]
+    weight1 = 1.0 - weight0
+    a00, a01, a11 = (weight0 * weight0).sum(1), (weight0 * weight1).sum(1), (weight1 * weight1).sum(1)
+    rhs0 = np.einsum("nk,nki->ni", weight0, texels)
+    rhs1 = np.einsum("nk,nki->ni", weight1, texels)
+    determinant = a00 * a11 - a01 * a01
+    solvable = np.abs(determinant) > 1e-9
+    determinant = np.where(solvable, determinant, 1.0)[:, None]
+    refit0 = np.clip((a11[:, None] * rhs0 - a01[:, None] * rhs1) / determinant, 0.0, 255.0)
+    refit1 = np.clip((a00[:, None] * rhs1 - a01[:, None] * rhs0) / determinant, 0.0, 255.0)
+    refit = _fit_indices(texels, _pack_565(refit0), _pack_565(refit1))
+    better = solvable & (refit[3] < errors)
+    color0 = np.where(better, refit[0], color0)
+    color1 = np.where(better, refit[1], color1)
+    indices = np.where(better[:, None], refit[2], indices)
+
+    blocks = np.empty(len(texels), BC1_BLOCK)
+    blocks["color0"] = color0
+    blocks["color1"] = color1
+    blocks["indices"] = (indices.astype(np.uint32) << (2 * np.arange(16, dtype=np.uint32))).sum(axis=1)
+    return blocks
+
+
+def encode_bc4(values):
+    """(N, 8) uint8 BC4 blocks of (N, 16) values in [0, 255]."""
+    high = np.clip(np.rint(values.max(axis=1)), 0, 255)
+    low = np.clip(np.rint(values.min(axis=1)), 0, 255)
+    palette = BC4_WEIGHTS * high[:, None] + (1.0 - BC4_WEIGHTS) * low[:, None]
+    indices = np.abs(values[:, :, None] - palette[:, None, :]).argmin(axis=2).astype(np.uint64)
+    indices[high == low] = 0
+    bits = (indices << (3 * np.arange(16, dtype=np.uint64))).sum(axis=1)
+
+    blocks = np.empty((len(values), 8), np.uint8)
+    blocks[:, 0] = high
+    blocks[:, 1] = low
+    for byte in range(6):
+        blocks[:, 2 + byte] = (bits >> np.uint64(8 * byte)) & np.uint64(255)
+    return blocks
+
+
+def encode_blocks(texels, fmt):
+    """Encoded bytes of (N, 16, 4) RGBA texels in [0, 255]."""
+    if fmt == "dxt1c":
+        return encode_bc1(texels[:, :, :3]).tobytes()
+    if fmt == "dxt5":
+        alpha = encode_bc4(texels[:, :, 3])
+        color = encode_bc1(texels[:, :, :3]).view(np.uint8).reshape(-1, 8)
+        return np.concatenate((alpha, color), axis=1).tobytes()
+    if fmt == "bc5":
+        return np.concatenate((encode_bc4(texels[:, :, 0]), encode_bc4(texels[:, :, 1])), axis=1).tobytes()
+    raise ValueError("unknown format %s" % fmt)
+
+
+def compress(level, fmt, pool):
+    """Encoded bytes of one RGBA level in [0, 1], tiles encoded on pool."""
+    texels = to_blocks(np.rint(np.clip(level, 0.0, 1.0) * 255.0))
+    tiles = [texels[start:start + TILE_BLOCKS] for start in range(0, len(texels), TILE_BLOCKS)]
+    return b"".join(pool.map(lambda tile: encode_blocks(tile, fmt), tiles))
+
+
+# ----------------------------------------------------------------------------
+# DDS output
+
+
+DDSD_CAPS, DDSD_HEIGHT, DDSD_WIDTH, DDSD_PIXELFORMAT = 0x1, 0x2, 0x4, 0x1000
+DDSD_MIPMAPCOUNT, DDSD_LINEARSIZE = 0x20000, 0x80000
+DDPF_FOURCC = 0x4
+DDSCAPS_COMPLEX, DDSCAPS_TEXTURE, DDSCAPS_MIPMAP = 0x8, 0x1000, 0x400000
+
+FOURCC = {"dxt1c": b"DXT1", "dxt5": b"DXT5", "bc5": b"ATI2"}
+
+
+def level_size(width, height, fmt):
+    """Bytes of one encoded level."""
+    return max(1, -(-width // 4)) * max(1, -(-height // 4)) * (8 if fmt == "dxt1c" else 16)
+
+
+def split_levels(data, fmt):
+    """Width, height and encoded levels of DDS file content written by this module."""
+    _magic, _size, _flags, height, width, _pitch, _depth, mip_count = struct.unpack("<4s7I", data[:32])
+    levels = []
+    position = 128
+    for level in range(max(mip_count, 1)):
+        size = level_size(max(1, width >> level), max(1, height >> level), fmt)
+        levels.append(data[position:position + size])
+        position += size
+    return width, height, levels
+
+
+def dds_header(width, height, mip_count, fmt, top_level_size):
+    flags = DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH | DDSD_PIXELFORMAT | DDSD_LINEARSIZE
+    caps = DDSCAPS_TEXTURE
+    if mip_count > 1:
+        flags |= DDSD_MIPMAPCOUNT
+        caps |= DDSCAPS_COMPLEX | DDSCAPS_MIPMAP
+    return struct.pack("<4s7I44x2I4s5I5I", b"DDS ", 124, flags, height, width, top_level_size, 0, mip_count,
+                       32, DDPF_FOURCC, FOURCC[fmt], 0, 0, 0, 0, 0, caps, 0, 0, 0, 0)
+
+
+def cache_key(source, fmt, normal_map, sharpen, mipmaps, srgb):
+    """blake2b-128 hex digest of the source file's content and the conversion options."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(("%d %s %d %d %d %d\n" % (CACHE_VERSION, fmt, normal_map, sharpen, mipmaps, srgb)).encode())
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _copy(source, destination):
+    """Copy source over destination atomically, so parallel conversions never see half a file."""
+    tmp_path = "%s.%d.tmp" % (destination, os.getpid())
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def prune_cache(directory, limit):
+    """Delete the least recently used files of a cache directory until it holds at most limit bytes."""
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".dds") and entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _mtime, size, _path in entries)
+    for _mtime, size, path in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue  # Removed by another conversion, or in use.
+        total -= size
+
+
+def _write(path, data):
+    """Write data to path atomically, creating its directory."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        for part in data:
+            f.write(part)
+    os.replace(tmp_path, path)
+
+
+def _write_dds(path, width, height, fmt, levels):
+    _write(path, [dds_header(width, height, len(levels), fmt, len(levels[0]))] + list(levels))
+
+
+def write_dds_tiers(outputs, width, height, fmt, levels, mipmaps, pool):
+    """Write encoded levels as DDS files, outputs[k] starting at level k (or the last)."""
+    def write(tier):
+        level = min(tier, len(levels) - 1)
+        _write_dds(outputs[tier], max(1, width >> level), max(1, height >> level), fmt,
+                   levels[level:] if mipmaps else levels[level:level + 1])
+    list(pool.map(write, range(len(outputs))))
+
+
+def convert(source, output, fmt="dxt1c", normal_map=False, sharpen=False, mipmaps=True, srgb=False, jobs=None,
+            cache=None, cache_limit=CACHE_LIMIT_MB << 20, tiers=()):
+    """Convert the image source to output, a DDS file unless fmt is none.
+
+    tiers are outputs for lower quality tiers, each half the size of the one
+    before. Returns True when the outputs were made from the cache directory
+    cache.
+    """
+    outputs = [output] + list(tiers)
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+        if fmt == "none":
+            if os.path.abspath(source) != os.path.abspath(output):
+                shutil.copyfile(source, output)
+            if tiers:
+                levels = mip_chain(read_image(source), normal_map, srgb, sharpen)
+                list(pool.map(lambda tier: _write(tiers[tier], [encode_png(levels[min(tier + 1, len(levels) - 1)])]),
+                              range(len(tiers))))
+            return False
+
+        cached = None
+        if cache:
+            cached = os.path.join(cache, cache_key(source, fmt, normal_map, sharpen, mipmaps, srgb) + ".dds")
+            if os.path.isfile(cached):
+                _copy(cached, output)
+                os.utime(cached)  # Recently used, pruned last.
+                if not tiers:
+                    return True
+                # The tiers of a file without mips need levels it does not hold.
+                if mipmaps:
+                    with open(cached, "rb") as f:
+                        width, height, levels = split_levels(f.read(), fmt)
+                    write_dds_tiers(outputs[1:], max(1, width >> 1), max(1, height >> 1), fmt, levels[1:], mipmaps,
+                                    pool)
+                    return True
+
+        image = read_image(source)
+        levels = mip_chain(image, normal_map, srgb, sharpen, mipmaps or bool(tiers))
+        # Without mips only the top level of every output is encoded.
+        needed = range(len(levels)) if mipmaps else {min(tier, len(levels) - 1) for tier in range(len(outputs))}
+        data = [compress(level, fmt, pool) if index in needed else None for index, level in enumerate(levels)]
+        height, width = image.shape[:2]
+        write_dds_tiers(outputs, width, height, fmt, data, mipmaps, pool)
+
+    if cached:
+        os.makedirs(cache, exist_ok=True)
+        _copy(output, cached)
+        prune_cache(cache, cache_limit)
+    return False
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="texture_converter.py", description=__doc__.splitlines()[0])
+    parser.add_argument("--file", required=True, help="input image (PNG)")
+    parser.add_argument("--output", required=True, help="output file")
+    parser.add_argument("--format", choices=FORMATS, default="none", help="DDS block compression")
+    parser.add_argument("--norm", action="store_true", help="normal map: renormalize mip levels")
+    parser.add_argument("--sharpen", action="store_true", help="sharpen generated mip levels")
+    parser.add_argument("--nomipmap", action="store_true", help="write the top level only")
+    parser.add_argument("--srgb", action="store_true", help="sRGB color: average mip levels in linear light")
+    parser.add_argument("--remove", action="store_true", help="delete the input file afterwards")
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="encoding threads (default: all cores)")
+    parser.add_argument("--cache", help="directory of earlier conversions to reuse")
+    parser.add_argument("--cache-limit", type=int, default=CACHE_LIMIT_MB,
+                        help="cache size in MB (default: %(default)d)")
+    parser.add_argument("--tier", action="append", default=[],
+                        help="output of the next lower quality tier, half the size of the one before")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+    try:
+        convert(args.file, args.output, args.format, args.norm, args.sharpen, not args.nomipmap, args.srgb,
+                args.jobs, args.cache, args.cache_limit << 20, args.tier)
+    except (OSError, ValueError, zlib.error) as e:
+        print("texture_converter: %s: %s" % (args.file, e), file=sys.stderr)
+        return 1
+    if args.remove and os.path.abspath(args.file) != os.path.abspath(args.output):
+        os.remove(args.file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())